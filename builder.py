@@ -15,8 +15,10 @@ from string import Formatter
 script_dir = os.path.abspath(os.path.dirname(__file__))
 
 sys.path.append(os.path.join(script_dir, 'lib', 'python-build-tools'))
+# dependency-free helpers shared with unibuild (importing the unibuild package itself would load its config)
+sys.path.append(os.path.join(script_dir, 'unibuild', 'utility'))
 
-from buildtools import ENV, http, log, os_utils
+from buildtools import ENV, log, os_utils
 from buildtools.buildsystem import MSBuild, WindowsCCompiler
 from buildtools.buildsystem.visualstudio import (ProjectType,
                                                  VisualStudio2015Solution,
@@ -25,6 +27,10 @@ from buildtools.config import YAMLConfig
 from buildtools.repo.git import GitRepository
 from buildtools.repo.hg import HgRepository
 from buildtools.wrapper import CMake
+from http_client import HTTPClient
+from source_fingerprint import git_fingerprint
+from git_submodules import list_submodules, select_submodules, update_submodules
+import cmake_stamp
 
 
 
@@ -112,13 +118,18 @@ def dlPackagesIn(pkgdefs, superrepo='build'):
             filename = os.path.join(script_dir, 'download', retrievalData.get('filename', hashlib.md5(url).hexdigest() + ext))
             if not os.path.isfile(filename):
                 with log.info('Downloading %s...', url):
-                    http.DownloadFile(url, filename)
+                    HTTPClient().configure(max_per_host=config.get('download.connections-per-host', 4)).download(url, filename)
             if (rebuild or not os.path.isdir(destination)) and not retrievalData.get('download-only', False):
                 if rebuild:
                     os_utils.safe_rmtree(destination)
                 os_utils.ensureDirExists(destination)
-                with os_utils.Chdir(destination):
-                    os_utils.decompressFile(filename)
+                include = retrievalData.get('include')
+                if include:
+                    # let 7-Zip pick the few members we need instead of unpacking everything
+                    os_utils.cmd([EXECUTABLES['7za'], 'x', '-y', '-r', filename, '-o' + destination] + include, echo=True, show_output=True, critical=True)
+                else:
+                    with os_utils.Chdir(destination):
+                        os_utils.decompressFile(filename)
 
 
 def gen_userfile_content(projdir):
@@ -203,6 +214,9 @@ class Builder(object):
             data=yaml.load(f)
             manifest=data.get('manifest',{})
 
+        fingerprint=self.sourceFingerprint()
+        if fingerprint is not None and fingerprint != data.get('fingerprint'): return True
+
         for expectedFile in self.expected:
             if not os.path.isfile(expectedFile): return True
             relfilepath=os.path.relpath(expectedFile,script_dir)
@@ -210,6 +224,12 @@ class Builder(object):
             if os.stat(expectedFile).m_time != manifest[relfilepath]: return True
         return False
 
+    def sourceFingerprint(self):
+        '''
+        HEAD tree id plus local modifications if build_dir is a git checkout, None otherwise.
+        '''
+        return git_fingerprint(EXECUTABLES['git'], self.build_dir)
+
     def updateManifest(self):
         currentFiles=[]
         newfiles=[]
@@ -232,7 +252,7 @@ class Builder(object):
             log.info('All check out!')
 
         with open(self.builder_meta_file,'w') as f:
-            yaml.dump({'configuration':self.configuration,'manifest':newmanifest,'newfiles':newfiles},f,default_flow_style=False)
+            yaml.dump({'configuration':self.configuration,'manifest':newmanifest,'newfiles':newfiles,'fingerprint':self.sourceFingerprint()},f,default_flow_style=False)
 
         return True
 
@@ -249,8 +269,8 @@ class CMakeBuilder(Builder):
             for k,v in cmake_flags.items():
                 self.cmake.setFlag(k,v)
             #self.cmake.setFlag('CMAKE_INSTALL_PREFIX', self.install_prefix)
-            self.cmake.generator = 'NMake Makefiles'
-            self.cmake.run(CMAKE=EXECUTABLES['cmake'])
+            setCMakeGenerator(self.cmake)
+            configureCMake(self.cmake)
             if cmake_opts.get('build',False):
                 target=''
                 if cmake_flags.get('CMAKE_INSTALL_PREFIX') is not None:
@@ -291,6 +311,7 @@ userconfig = {
         'executables':{
             '7za': os_utils.which('7z.exe'),
             'cmake': os_utils.which('cmake.exe'),
+            'ninja': os_utils.which('ninja.exe'),
             'git': os_utils.which('git.exe'),
             'graphviz': 'C:\\Program Files (x86)\\Graphviz2.38\\bin\\dot.exe',  # Default Graphviz2 install
             'hg': os_utils.which('hg.exe'),
@@ -310,6 +331,29 @@ config = YAMLConfig('build.yml', config, variables={'nbits': '32'})
 config.Load('user-config.yml', merge=True, defaults=userconfig)
 EXECUTABLES = config.get('paths.executables')
 
+# Ninja compiles in parallel on its own, NMake one file at a time.
+CMAKE_GENERATOR = config.get('build.cmake-generator', 'Ninja' if EXECUTABLES.get('ninja') else 'NMake Makefiles')
+
+def setCMakeGenerator(cmake):
+    cmake.generator = CMAKE_GENERATOR
+    if CMAKE_GENERATOR == 'Ninja' and EXECUTABLES.get('ninja'):
+        cmake.setFlag('CMAKE_MAKE_PROGRAM', EXECUTABLES['ninja'])
+
+def configureCMake(cmake):
+    '''
+    Configures the project in the current directory unless its arguments, environment, toolchain and
+    CMake inputs are the same as last time.
+    '''
+    build_dir = os.getcwd()
+    key = cmake_stamp.configure_key({'generator': cmake.generator, 'flags': cmake.flags}, build_dir, os.environ,
+                                    [EXECUTABLES['cmake'], EXECUTABLES.get('ninja')])
+    if cmake_stamp.is_current(build_dir, key):
+        log.info('Configuration unchanged, skipping CMake configure.')
+        return
+    cmake_stamp.clear_stamp(build_dir)
+    cmake.run(CMAKE=EXECUTABLES['cmake'])
+    cmake_stamp.write_stamp(build_dir, key)
+
 ENV.appendTo('PATH', os.path.dirname(EXECUTABLES['7za']))
 ENV.set('QMAKESPEC', config.get('qt-makespec', 'win32-msvc2013'))
 
@@ -446,8 +490,8 @@ with log.info('Building zlib...'):
         cmake = CMake()
         cmake.setFlag('CMAKE_BUILD_TYPE', config.get('cmake.build-type'))
         cmake.setFlag('CMAKE_INSTALL_PREFIX', os.path.join(script_dir, 'build', 'zlib')) # This LOOKS wrong but it's actually fine.
-        cmake.generator = 'NMake Makefiles'
-        cmake.run(CMAKE=EXECUTABLES['cmake'])
+        setCMakeGenerator(cmake)
+        configureCMake(cmake)
         cmake.build(target='install', CMAKE=EXECUTABLES['cmake'])
 '''
 
@@ -492,8 +536,8 @@ with log.info('Building GoogleTest...'):
             cmake.setFlag('CMAKE_BUILD_TYPE', config.get('cmake.build-type'))
             cmake.setFlag('CMAKE_INSTALL_PREFIX', os.path.join(script_dir, 'install'))
             cmake.setFlag('gtest_force_shared_crt:BOOL', 'ON')
-            cmake.generator = 'NMake Makefiles'
-            cmake.run(CMAKE=EXECUTABLES['cmake'])
+            setCMakeGenerator(cmake)
+            configureCMake(cmake)
             cmake.build(CMAKE=EXECUTABLES['cmake'])
 '''
 
@@ -508,8 +552,8 @@ with log.info('Building asmjit...'):
             cmake.setFlag('ASMJIT_DISABLE_COMPILER', 'TRUE')
             cmake.setFlag('CMAKE_BUILD_TYPE', config.get('cmake.build-type'))
             cmake.setFlag('CMAKE_INSTALL_PREFIX', os.path.join(script_dir, 'install').replace('\\', '/'))
-            cmake.generator = 'NMake Makefiles'
-            cmake.run(CMAKE=EXECUTABLES['cmake'])
+            setCMakeGenerator(cmake)
+            configureCMake(cmake)
             cmake.build(CMAKE=EXECUTABLES['cmake'], target='install')
 
 # MUST be built with system Python because it includes pyexpat.
@@ -543,9 +587,15 @@ with log.info('Building Qt5...'):
                          "qtserialport", "qtsvg", "qtwebengine",
                          "qtwayland", "qtdoc", "qtconnectivity", "qtwebkit-examples"]
 
-            os_utils.cmd([EXECUTABLES['perl'], 'init-repository', '--module-subset=' + ','.join(['all'] + ['-' + x for x in skip_list])], echo=True, show_output=True, critical=False)
             nomake_list = ["tests", "examples"]
 
+            # Fetch only the modules configure doesn't skip, shallow and in parallel.
+            qt_modules = select_submodules(list_submodules(EXECUTABLES['git'], qt5git_dir), skip_list,
+                                           ['-examples'] if 'examples' in nomake_list else [])
+            log.info('Initializing %d Qt modules: %s', len(qt_modules), ', '.join(qt_modules))
+            update_submodules(EXECUTABLES['git'], qt5git_dir, qt_modules, depth=1,
+                              jobs=config.get('build.job-count', multiprocessing.cpu_count()))
+
             num_jobs = config.get('build.job-count', multiprocessing.cpu_count() * 2)
             log.info('jom -j (maximum job count) set to %d.  If you want fewer, please set build.job-count in user-config.yml.')
 
@@ -805,8 +855,8 @@ with log.info('Building USVFS...'):
         cmake = CMake()
         cmake.flags = cmake_parameters.copy()
         cmake.setFlag('PROJ_ARCH', short_arch)
-        cmake.generator = 'NMake Makefiles'  # Was CodeBlocks - NMake Makefiles
-        cmake.run(CMAKE=EXECUTABLES['cmake'])
+        setCMakeGenerator(cmake)
+        configureCMake(cmake)
         cmake.build(CMAKE=EXECUTABLES['cmake'], target='install')
 
 projectBuildInfo = {}
@@ -819,8 +869,8 @@ for projectName, projectCfg in projectdefs.items():
             cmake.flags = cmake_parameters.copy()
             cmake.setFlag('MO_ARCH', short_arch)
             cmake.setFlag('MO_NBITS', nbits)
-            cmake.generator = 'NMake Makefiles'  # Was CodeBlocks - NMake Makefiles
-            cmake.run(CMAKE=EXECUTABLES['cmake'])
+            setCMakeGenerator(cmake)
+            configureCMake(cmake)
             with codecs.open('CMakeLists.txt.user', 'w', encoding='utf-8') as f:
                 f.write(gen_userfile_content(projdir))
             cmake.build(CMAKE=EXECUTABLES['cmake'], target='install')
@@ -19,6 +19,7 @@
 from _winreg import *
 from unibuild.utility.lazy import Lazy
 import os
+import multiprocessing
 
 from buildtools import os_utils
 from buildtools.config import YAMLConfig
@@ -76,14 +77,62 @@ config = {
                                             # This massively increases build time but produces smaller
                                             # binaries and marginally faster code
     'repo_update_frequency': 60 * 60 * 24,  # in seconds
+    'git_clone_depth': None,                # if set, repositories are cloned shallow with this much history
+    'git_clone_filter': None,               # partial clone filter for new clones, e.g. "blob:none"
+    'git_mirror_cache': True,               # clone through a machine-wide cache of bare mirrors
+    'git_mirror_update_frequency': 60 * 60, # in seconds, how old a mirror may get before it's fetched again
+    'git_jobs': 8,                          # number of repositories fetched concurrently
+    'git_fsmonitor': False,                 # let git status use the builtin file system monitor when
+                                            # fingerprinting sources
+    'hg_share_pool': True,                  # create mercurial work copies with "hg share" from a pooled store
+    'bundle_jobs': multiprocessing.cpu_count(),  # items packed or unpacked concurrently by "unimake bundle"
+    'cmake_generator': None,                # generator for command line builds, Ninja if available, otherwise
+                                            # NMake Makefiles
+    'build_jobs': None,                     # parallel compile jobs, if not set one per cpu as long as there is
+                                            # build_job_memory available for each
+    'build_job_memory': "1G",               # memory to reserve per compile job
+    'memory_governor': True,                # lower job counts and hold back tasks while memory is short
+    'memory_reserve': "1G",                 # memory the governor keeps available for the system
+    'memory_pressure_limit': 10.0,          # percentage of time stalled on memory (linux pressure stall
+                                            # information) above which memory counts as short
+    'memory_wait_timeout': 60,              # in seconds, how long a task is held back at most
+    'cmake_initial_cache': True,            # share the resolved compilers and tools between projects configured
+                                            # with the same toolchain. Only tool resolution and the compiler test
+                                            # are skipped, compiler identification, the ABI probes and feature
+                                            # tests still run for every project
+    'cmake_acceleration': False,            # inject precompiled headers and unity builds into the projects
+                                            # listed in makefile.uni.py. Not yet verified on the plugins
+    'compiler_cache': None,                 # ccache, sccache or clcache executable to compile through
+    'compiler_cache_size': "10G",           # size limit of the local compiler cache directory
+    'cpp_toolchain': None,                  # compiler used by build.CPP, "msvc", "gcc" or "clang". Defaults to
+                                            # msvc on windows and gcc elsewhere
+    'download_revalidate_frequency': 60 * 60 * 24,  # in seconds, how often downloads of "latest" urls
+                                                    # are checked for updates
+    'extract_verify': "full",               # "full" re-hashes downloaded archives before trusting an earlier
+                                            # extraction, "fast" only checks the extracted member list
+    'tree_cache': None,                     # populate extracted sources from a cache of unpacked archives.
+                                            # None uses it only where the trees can be reflinked out of the
+                                            # cache, which excludes windows. Otherwise each tree is copied
+    'tree_cache_hardlinks': False,          # allow hard links into the tree cache if reflinks aren't supported.
+                                            # Only safe if nothing writes to extracted sources in place, tools
+                                            # that do (bootstrap scripts, configure, qmake) change the cache too
+    'sourceforge_mirrors': [],              # sourceforge mirror names probed alongside the redirector
+    'mirror_min_throughput': 32 * 1024,     # bytes per second, slower mirrors are abandoned mid-transfer
 }
 
 config['paths'] = {
     'download':      "{base_dir}\\downloads",
     'build':         "{base_dir}\\build",
     'progress':      "{base_dir}\\progress",
+    'tree_cache':    os.path.join(os.path.expanduser("~"), ".unibuild", "trees"),
+    'git_mirrors':   os.path.join(os.path.expanduser("~"), ".unibuild", "git"),
+    'hg_share_pool': os.path.join(os.path.expanduser("~"), ".unibuild", "hg"),
+    'cmake_initial_cache': os.path.join(os.path.expanduser("~"), ".unibuild", "cmake"),
+    'compiler_cache': os.path.join(os.path.expanduser("~"), ".unibuild", "compiler"),
+    'b2_bootstrap':  os.path.join(os.path.expanduser("~"), ".unibuild", "b2"),
     'graphviz':      os_utils.which('dot.exe'), #path_or_default("dot.exe",   "Graphviz2.38", "bin"),
     'cmake':         os_utils.which('cmake.exe'), #path_or_default("cmake.exe", "CMake", "bin"),
+    'ninja':         os_utils.which('ninja.exe'),
     'git':           os_utils.which('git.exe'), #path_or_default("git.exe",   "Git", "bin"),
     'hg':            os_utils.which('hg.exe'),
     'perl':          os_utils.which('perl.exe'),
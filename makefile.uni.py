@@ -19,6 +19,7 @@
 from unibuild import Project
 from unibuild.modules import github, cmake, patch, git, hg, msbuild, build
 from unibuild.utility import lazy, FormatDict
+from unibuild.utility.cmake_project_include import project_include
 from config import config
 from functools import partial
 from string import Formatter
@@ -44,7 +45,8 @@ from unibuild.projects import asmjit, udis86, googletest
 
 Project("LootApi") \
     .depend(patch.Copy(os.path.join(config.get('paths.root'), 'build', 'lootapi',"loot-api_{}{}".format(loot_version, loot_suffix), "loot_api.dll"), os.path.join(config['__build_base_path'], "install", "bin", "loot"))
-            .depend(github.Release("loot", "loot", loot_version, "loot-api_{}{}".format(loot_version, loot_suffix), "7z")
+            .depend(github.Release("loot", "loot", loot_version, "loot-api_{}{}".format(loot_version, loot_suffix), "7z",
+                                   include=["*/loot_api.dll"])
                     .set_destination("lootapi"))
             )
 
@@ -100,6 +102,35 @@ if config.get('optimize', False):
     cmake_parameters.append("-DOPTIMIZE_LINK_FLAGS=\"/LTCG /INCREMENTAL:NO /OPT:REF /OPT:ICF\"")
 
 
+# precompiled headers and unity builds injected into these projects through CMAKE_PROJECT_INCLUDE, their
+# repositories stay untouched
+qt_precompiled_headers = ["<QObject>", "<QString>", "<QStringList>", "<QList>", "<QMap>", "<QVariant>"]
+accelerated_projects = dict((name, qt_precompiled_headers) for name in [
+    "modorganizer-uibase",
+    "modorganizer-game_gamebryo", "modorganizer-game_oblivion", "modorganizer-game_fallout3",
+    "modorganizer-game_fallout4", "modorganizer-game_falloutnv", "modorganizer-game_skyrim",
+    "modorganizer-game_skyrim_se",
+    "modorganizer-tool_inieditor", "modorganizer-preview_base", "modorganizer-diagnose_basic",
+    "modorganizer-check_fnis", "modorganizer-bsa_extractor",
+    "modorganizer-installer_bain", "modorganizer-installer_manual", "modorganizer-installer_bundle",
+    "modorganizer-installer_quick", "modorganizer-installer_fomod", "modorganizer-installer_ncc",
+])
+
+# project -> injections it doesn't survive, "pch" and/or "unity"
+acceleration_opt_out = {
+}
+
+
+def acceleration_parameters(project_name):
+    if not config.get('cmake_acceleration', False) or project_name not in accelerated_projects:
+        return []
+    opt_out = acceleration_opt_out.get(project_name, [])
+    path = project_include(os.path.join(config['paths']['build'], "cmake_include"),
+                           accelerated_projects[project_name] if "pch" not in opt_out else None,
+                           "unity" not in opt_out)
+    return ["-DCMAKE_PROJECT_INCLUDE={}".format(path.replace("\\", "/"))] if path is not None else []
+
+
 usvfs = Project("usvfs")
 
 usvfs.depend(cmake.CMake().arguments(cmake_parameters +
@@ -164,7 +195,7 @@ for git_path, path, branch, dependencies in [
                                                                                 "modorganizer-game_features",
                                                                                 "usvfs"]),
 ]:
-    build_step = cmake.CMake().arguments(cmake_parameters).install()
+    build_step = cmake.CMake().arguments(cmake_parameters + acceleration_parameters(git_path)).install()
 
     for dep in dependencies:
         build_step.depend(dep)
@@ -0,0 +1,71 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from unibuild.modules.b2 import bootstrap_key, configuration_name
+
+
+class BootstrapKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = os.path.join(self.directory, "tools", "build", "src", "engine")
+        self.write("bootstrap.bat", "@call tools\\build\\src\\engine\\build.bat\n")
+        self.write(os.path.join(self.engine, "build.bat"), "cl jam.c\n")
+        self.write(os.path.join(self.engine, "jam.c"), "int main() { return 0; }\n")
+        self.write(os.path.join(self.engine, "jam.h"), "#define JAM 1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, file_path, content):
+        file_path = os.path.join(self.directory, file_path)
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, "w") as f:
+            f.write(content)
+
+    def test_stable_after_bootstrap(self):
+        key = bootstrap_key(self.directory)
+        # what bootstrap.bat leaves behind
+        self.write(os.path.join(self.engine, "bootstrap", "jam0.exe"), "binary")
+        self.write(os.path.join(self.engine, "bin.ntx86_64", "b2.exe"), "binary")
+        self.write(os.path.join(self.engine, "b2.exe"), "binary")
+        self.write(os.path.join(self.engine, "jam.obj"), "object")
+        self.write("b2.exe", "binary")
+        self.write("project-config.jam", "using msvc ;\n")
+        self.assertEqual(bootstrap_key(self.directory), key)
+
+    def test_source_change(self):
+        key = bootstrap_key(self.directory)
+        self.write(os.path.join(self.engine, "jam.h"), "#define JAM 2\n")
+        self.assertNotEqual(bootstrap_key(self.directory), key)
+
+
+class ConfigurationNameTest(unittest.TestCase):
+    def test_name(self):
+        self.assertEqual(configuration_name(["address-model=64", "toolset=msvc-14.0", "link=shared", "-j4"]),
+                         "msvc-14.0_64_shared")
+        self.assertEqual(configuration_name(["--with-thread"]), "default")
+
+
+if __name__ == "__main__":
+    unittest.main()
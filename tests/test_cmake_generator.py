@@ -0,0 +1,75 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+from unibuild.utility.cmake_stamp import cached_generator, reset_generator, write_stamp, is_current
+
+
+CMAKE = find_executable("cmake")
+MAKE = find_executable("make")
+NINJA = find_executable("ninja")
+
+
+@unittest.skipIf(CMAKE is None or MAKE is None or NINJA is None, "cmake, make and ninja are required")
+class GeneratorSwitchTest(unittest.TestCase):
+    """
+    a build directory configured for one generator has to be reconfigured from scratch for another
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, "CMakeLists.txt"), "w") as f:
+            f.write("cmake_minimum_required(VERSION 3.5)\nproject(switch NONE)\n")
+        self.build_path = os.path.join(self.directory, "build")
+        os.mkdir(self.build_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def configure(self, generator):
+        with open(os.devnull, "w") as null:
+            return subprocess.call([CMAKE, "-G", generator, ".."], cwd=self.build_path, stdout=null, stderr=null)
+
+    def test_switch_to_ninja(self):
+        self.assertIsNone(cached_generator(self.build_path))
+        self.assertEqual(self.configure("Unix Makefiles"), 0)
+        write_stamp(self.build_path, "key")
+        self.assertEqual(cached_generator(self.build_path), "Unix Makefiles")
+
+        # this is what existing build directories ran into
+        self.assertNotEqual(self.configure("Ninja"), 0)
+
+        self.assertTrue(reset_generator(self.build_path, "Ninja"))
+        self.assertFalse(is_current(self.build_path, "key"))
+        self.assertEqual(self.configure("Ninja"), 0)
+        self.assertEqual(cached_generator(self.build_path), "Ninja")
+
+    def test_same_generator_is_kept(self):
+        self.assertEqual(self.configure("Unix Makefiles"), 0)
+        self.assertFalse(reset_generator(self.build_path, "Unix Makefiles"))
+        self.assertTrue(os.path.isfile(os.path.join(self.build_path, "CMakeCache.txt")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import unittest
+
+from unibuild.utility.compiler_cache import CompilerCache, parse_size
+
+
+class CompilerCacheTest(unittest.TestCase):
+    def cache(self, executable):
+        return CompilerCache(executable, "/cache", "1G")
+
+    def test_ccache(self):
+        cache = self.cache("/usr/bin/ccache")
+        self.assertEqual(cache.kind, "ccache")
+        self.assertEqual(cache.wrap("cl"), "\"/usr/bin/ccache\" cl")
+        environment = cache.environment({"PATH": "/usr/bin"})
+        self.assertEqual((environment["CCACHE_DIR"], environment["CCACHE_MAXSIZE"]), ("/cache", str(1024 ** 3)))
+        self.assertEqual(environment["PATH"], "/usr/bin")
+
+    def test_sccache(self):
+        cache = self.cache("/tools/sccache.exe")
+        self.assertEqual(cache.kind, "sccache")
+        self.assertEqual(cache.wrap("cl"), "\"/tools/sccache.exe\" cl")
+        environment = cache.environment({})
+        self.assertEqual((environment["SCCACHE_DIR"], environment["SCCACHE_CACHE_SIZE"]),
+                         ("/cache", str(1024 ** 3)))
+
+    def test_clcache(self):
+        cache = self.cache("/tools/clcache.exe")
+        self.assertEqual(cache.kind, "clcache")
+        # clcache stands in for cl.exe, it isn't passed the compiler
+        self.assertEqual(cache.wrap("cl"), "\"/tools/clcache.exe\"")
+        self.assertEqual(cache.environment({})["CLCACHE_DIR"], "/cache")
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            self.cache("/usr/bin/distcc")
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("512M"), 512 * 1024 ** 2)
+        self.assertEqual(parse_size("10G"), 10 * 1024 ** 3)
+        self.assertEqual(parse_size(100), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
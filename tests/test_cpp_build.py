@@ -0,0 +1,125 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from distutils.spawn import find_executable
+
+# unibuild has to be imported before config
+from unibuild import Project
+from unibuild.modules import build
+from unibuild.progress import Progress
+from config import config
+
+
+GCC = find_executable("cc") and find_executable("ar")
+
+SOURCES = {
+    "common.h": "#define VALUE 1\n",
+    "a.c": "#include \"common.h\"\nint a(void) { return VALUE; }\n",
+    "b.c": "#include \"common.h\"\nint b(void) { return VALUE + 1; }\n",
+    "c.c": "int c(void) { return 3; }\n",
+}
+
+OVERRIDES = {'compiler_cache': None, 'memory_governor': False, 'build_jobs': 4, 'cpp_toolchain': "gcc"}
+
+
+@unittest.skipIf(not GCC, "cc and ar are required")
+class CPPBuildTest(unittest.TestCase):
+    """
+    build.CPP with the gcc toolchain: parallel compiles that are only repeated for changed inputs
+    """
+
+    def setUp(self):
+        self.saved = dict((key, config.get(key)) for key in OVERRIDES)
+        config.update(OVERRIDES)
+        self.saved_environment = config.get('__environment')
+        config['__environment'] = dict(os.environ)
+        self.directory = tempfile.mkdtemp()
+        for file_name, content in SOURCES.items():
+            self.write(file_name, content)
+
+    def tearDown(self):
+        config.update(self.saved)
+        if self.saved_environment is None:
+            del config['__environment']
+        else:
+            config['__environment'] = self.saved_environment
+        shutil.rmtree(self.directory)
+
+    def write(self, file_name, content):
+        with open(os.path.join(self.directory, file_name), "w") as f:
+            f.write(content)
+
+    def build(self, cflags=None):
+        cpp = build.CPP(cflags).type(build.STATIC_LIB).sources("test", ["a.c", "b.c", "c.c"])
+        project = Project("cpp test {}".format(id(cpp)))
+        project.set_context_item("build_path", self.directory)
+        project.depend(cpp)
+        progress = Progress()
+        progress.set_change_callback(lambda job, value: None)
+        return cpp.process(progress), cpp.changed
+
+    def modified(self):
+        """
+        modification times of the outputs
+        """
+        result = {}
+        for file_name in ["a.o", "b.o", "c.o", "test.a"]:
+            file_path = os.path.join(self.directory, file_name)
+            self.assertTrue(os.path.isfile(file_path), file_name)
+            result[file_name] = os.path.getmtime(file_path)
+        # remade outputs get a later modification time even on file systems with coarse timestamps
+        time.sleep(1.1)
+        return result
+
+    def remade(self, before):
+        return sorted(file_name for file_name, mtime in before.items()
+                      if os.path.getmtime(os.path.join(self.directory, file_name)) != mtime)
+
+    def test_incremental(self):
+        self.assertEqual(self.build(), (True, True))
+        before = self.modified()
+
+        self.assertEqual(self.build(), (True, False))
+        self.assertEqual(self.remade(before), [])
+
+        self.write("common.h", "#define VALUE 2\n")
+        self.assertEqual(self.build(), (True, True))
+        self.assertEqual(self.remade(before), ["a.o", "b.o", "test.a"])
+
+    def test_flags_change(self):
+        self.assertEqual(self.build(), (True, True))
+        before = self.modified()
+        self.assertEqual(self.build(["-O0"]), (True, True))
+        self.assertEqual(self.remade(before), ["a.o", "b.o", "c.o", "test.a"])
+
+    def test_failed_compile_is_repeated(self):
+        self.assertEqual(self.build(), (True, True))
+        self.write("c.c", "int c(void) { return }\n")
+        self.assertFalse(self.build()[0])
+        self.assertFalse(self.build()[0])
+        self.write("c.c", "int c(void) { return 4; }\n")
+        self.assertEqual(self.build(), (True, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
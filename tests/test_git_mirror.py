@@ -0,0 +1,147 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+# unibuild has to be imported before config
+from unibuild import Project
+from unibuild.modules import git
+from config import config
+
+
+GIT = find_executable("git")
+
+
+class Progress(object):
+    def finish(self):
+        pass
+
+
+@unittest.skipIf(GIT is None, "git not installed")
+class MirrorCacheTest(unittest.TestCase):
+    """
+    clones of a local bare repository through the machine-wide mirror cache
+    """
+
+    SETTINGS = {'offline': False, 'git_mirror_cache': True, 'git_mirror_update_frequency': 0,
+                'git_clone_depth': None, 'git_clone_filter': None}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.saved = dict((key, config.get(key)) for key in MirrorCacheTest.SETTINGS.keys() +
+                          ['__environment', '__build_base_path'])
+        self.saved_paths = dict(config['paths'])
+        config.update(MirrorCacheTest.SETTINGS)
+        config['__environment'] = dict(os.environ, GIT_AUTHOR_NAME="test", GIT_AUTHOR_EMAIL="test@example.com",
+                                       GIT_COMMITTER_NAME="test", GIT_COMMITTER_EMAIL="test@example.com")
+        config['__build_base_path'] = self.directory
+        config['paths'].update({'git': GIT,
+                                'build': os.path.join(self.directory, "build"),
+                                'progress': os.path.join(self.directory, "progress"),
+                                'git_mirrors': os.path.join(self.directory, "mirrors")})
+        os.makedirs(config['paths']['progress'])
+        # the module level registries would otherwise remember clones of other tests
+        git.mirror_cache = git.MirrorCache()
+        git.remote_heads = git.RemoteHeads()
+        git.source_fingerprints = git.SourceFingerprints()
+
+        self.origin = os.path.join(self.directory, "origin.git")
+        self.git(["init", "-q", "--bare", "-b", "master", self.origin])
+        self.work = os.path.join(self.directory, "work")
+        self.git(["clone", "-q", self.origin, self.work])
+        self.commit("first")
+        # a local path would make git copy the objects rather than go through the transport
+        self.url = "file://" + self.origin.replace(os.sep, "/")
+
+    def tearDown(self):
+        for key, value in self.saved.items():
+            if value is None:
+                config.pop(key, None)
+            else:
+                config[key] = value
+        config['paths'] = self.saved_paths
+        shutil.rmtree(self.directory)
+
+    def git(self, args, cwd=None):
+        with open(os.devnull, "w") as null:
+            return subprocess.check_output([GIT] + args, cwd=cwd, env=config["__environment"], stderr=null).strip()
+
+    def commit(self, content):
+        with open(os.path.join(self.work, "file.txt"), "w") as f:
+            f.write(content)
+        self.git(["add", "file.txt"], self.work)
+        self.git(["commit", "-q", "-m", content], self.work)
+        self.git(["push", "-q", "origin", "HEAD:master"], self.work)
+        return self.git(["rev-parse", "HEAD"], self.work)
+
+    def clone(self, destination):
+        clone = git.Clone(self.url, "master").set_destination(destination)
+        clone.set_context(Project("git test {}".format(destination)))
+        clone.prepare()
+        self.assertTrue(clone.process(Progress()))
+        return clone
+
+    def path(self, destination):
+        return os.path.join(config['paths']['build'], destination)
+
+    def head(self, destination):
+        return self.git(["rev-parse", "HEAD"], self.path(destination))
+
+    def test_mirror_and_alternates(self):
+        self.clone("first")
+        mirror_path = git.MirrorCache.path(self.url)
+        self.assertEqual(self.git(["rev-parse", "--is-bare-repository"], mirror_path), "true")
+
+        with open(os.path.join(self.path("first"), ".git", "objects", "info", "alternates"), "r") as f:
+            alternates = f.read().strip()
+        self.assertEqual(os.path.normpath(alternates), os.path.normpath(os.path.join(mirror_path, "objects")))
+        # every object is borrowed, none were copied into the clone
+        counts = dict(line.split(": ") for line in
+                      self.git(["count-objects", "-v"], self.path("first")).splitlines())
+        self.assertEqual((counts["count"], counts["in-pack"]), ("0", "0"))
+        self.assertEqual(self.head("first"), self.git(["rev-parse", "HEAD"], self.work))
+
+    def test_update(self):
+        self.clone("first")
+        head = self.commit("second")
+
+        # a new run, the stale mirror is refreshed before it's used
+        git.mirror_cache = git.MirrorCache()
+        git.remote_heads = git.RemoteHeads()
+        self.clone("second")
+        self.git(["cat-file", "-e", head + "^{commit}"], git.MirrorCache.path(self.url))
+        self.assertEqual(self.head("second"), head)
+
+        self.assertTrue(self.clone("first").changed)
+        self.assertEqual(self.head("first"), head)
+
+    def test_fingerprint_outside_of_work_tree(self):
+        first = self.clone("first")
+        self.assertTrue(first.changed)
+        self.assertEqual(os.listdir(config['paths']['build']), ["first"])
+        self.assertEqual(self.git(["status", "--porcelain"], self.path("first")), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
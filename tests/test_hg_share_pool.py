@@ -0,0 +1,124 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from distutils.spawn import find_executable
+
+# unibuild has to be imported before config
+from unibuild.modules import hg
+from config import config
+
+
+HG = find_executable("hg")
+
+
+class Progress(object):
+    def finish(self):
+        pass
+
+
+@unittest.skipIf(HG is None, "mercurial not installed")
+class SharePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.saved_paths = dict(config['paths'])
+        self.saved_offline = config.get('offline', False)
+        self.saved_environment = config.get('__environment')
+        config['__environment'] = dict(os.environ)
+        config['paths'].update({'hg': HG,
+                                'build': os.path.join(self.directory, "build"),
+                                'hg_share_pool': os.path.join(self.directory, "pool")})
+        config['offline'] = False
+        self.origin = os.path.join(self.directory, "origin")
+        self.hg(["init", self.origin])
+        self.commit("first")
+
+    def tearDown(self):
+        config['paths'] = self.saved_paths
+        config['offline'] = self.saved_offline
+        if self.saved_environment is None:
+            del config['__environment']
+        else:
+            config['__environment'] = self.saved_environment
+        shutil.rmtree(self.directory)
+
+    def hg(self, args, cwd=None):
+        subprocess.check_call([HG, "--config", "ui.username=test"] + args, cwd=cwd,
+                              stdout=open(os.devnull, "w"))
+
+    def commit(self, content):
+        with open(os.path.join(self.origin, "file.txt"), "w") as f:
+            f.write(content)
+        self.hg(["commit", "-A", "-m", content], self.origin)
+
+    def clone(self, destination):
+        clone = hg.Clone(self.origin).set_destination(destination)
+        clone.set_context({})
+        clone.prepare()
+        self.assertTrue(clone.process(Progress()))
+        return clone
+
+    def parent(self, destination):
+        return subprocess.check_output([HG, "id", "-i", "-r", "."],
+                                       cwd=os.path.join(config['paths']['build'], destination)).strip()
+
+    def content(self, destination):
+        with open(os.path.join(config['paths']['build'], destination, "file.txt"), "r") as f:
+            return f.read()
+
+    def test_work_copies_share_one_store(self):
+        first = self.clone("first")
+        second = self.clone("second")
+        self.assertTrue(first.changed and second.changed)
+        store_path = hg.SharePool.path(self.origin)
+        for destination in ["first", "second"]:
+            with open(os.path.join(config['paths']['build'], destination, ".hg", "sharedpath"), "r") as f:
+                self.assertEqual(os.path.normpath(os.path.dirname(f.read().strip())), os.path.normpath(store_path))
+            self.assertEqual(self.content(destination), "first")
+
+    def test_nothing_incoming(self):
+        self.clone("work")
+        self.assertFalse(self.clone("work").changed)
+
+    def test_pull_into_store(self):
+        self.clone("work")
+        self.commit("second")
+        self.assertTrue(hg.SharePool.has_incoming(self.origin, hg.SharePool.path(self.origin)))
+        self.assertTrue(self.clone("work").changed)
+        self.assertEqual(self.content("work"), "second")
+        self.assertFalse(hg.SharePool.has_incoming(self.origin, hg.SharePool.path(self.origin)))
+
+    def test_workspace_behind_the_store(self):
+        self.clone("first")
+        self.clone("second")
+        self.commit("second")
+        # the first work copy pulls the new changeset into the shared store
+        self.assertTrue(self.clone("first").changed)
+        second = self.clone("second")
+        self.assertTrue(second.changed)
+        self.assertEqual(self.content("second"), "second")
+        self.assertEqual(self.parent("second"), self.parent("first"))
+        self.assertFalse(self.clone("second").changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
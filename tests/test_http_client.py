@@ -0,0 +1,177 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import BaseHTTPServer
+import os
+import shutil
+import SocketServer
+import tempfile
+import threading
+import time
+import unittest
+import urllib2
+
+from unibuild.utility.http_client import HTTPClient
+
+
+CONTENT = "unibuild" * 1024
+ETAG = '"v1"'
+
+
+class StandIn(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    local stand-in for a download server: /file supports conditional requests, /redirect points to it,
+    /flaky fails with 503 before it succeeds, /slow answers after a delay
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.path, self.client_address[1], dict(self.headers)))
+        if self.path == "/slow":
+            with self.server.lock:
+                self.server.active += 1
+                self.server.max_active = max(self.server.max_active, self.server.active)
+            time.sleep(0.2)
+            with self.server.lock:
+                self.server.active -= 1
+            self.__reply(200, CONTENT)
+        elif self.path == "/redirect":
+            self.__reply(302, "", {"Location": "/file"})
+        elif self.path == "/flaky" and self.server.failures > 0:
+            self.server.failures -= 1
+            self.__reply(503, "busy")
+        elif self.path in ["/file", "/flaky"]:
+            if self.headers.get("If-None-Match") == ETAG:
+                self.__reply(304, "")
+            else:
+                self.__reply(200, CONTENT, {"ETag": ETAG})
+        else:
+            self.__reply(404, "not found")
+
+    def __reply(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class HTTPClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = Server(("127.0.0.1", 0), StandIn)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.failures = 0
+        self.server.active = 0
+        self.server.max_active = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = HTTPClient().configure(max_per_host=2, retries=2, backoff=0.01)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.client.configure(max_per_host=4)
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def url(self, path):
+        return "http://127.0.0.1:{}{}".format(self.server.server_port, path)
+
+    def test_conditional_download(self):
+        file_path = os.path.join(self.directory, "file")
+        info = self.client.download(self.url("/file"), file_path)
+        self.assertEqual(info.getheader("ETag"), ETAG)
+        with open(file_path, "rb") as f:
+            self.assertEqual(f.read(), CONTENT)
+
+        self.assertIsNone(self.client.download(self.url("/file"), file_path, {"If-None-Match": ETAG}))
+        self.assertEqual(self.server.requests[-1][2].get("if-none-match"), ETAG)
+        with open(file_path, "rb") as f:
+            self.assertEqual(f.read(), CONTENT)
+        self.assertFalse(os.path.exists("{}.part".format(file_path)))
+
+    def test_redirect(self):
+        with self.client.open(self.url("/redirect")) as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.url, self.url("/file"))
+            self.assertEqual(response.read(), CONTENT)
+
+    def test_keep_alive(self):
+        for i in range(3):
+            with self.client.open(self.url("/file")) as response:
+                response.read()
+        # all requests arrived through the same connection
+        self.assertEqual(len(set(port for path, port, headers in self.server.requests)), 1)
+
+    def fetch_concurrently(self, count):
+        """
+        request /slow from count threads at once
+        """
+        def fetch():
+            with self.client.open(self.url("/slow")) as response:
+                response.read()
+
+        threads = [threading.Thread(target=fetch) for _ in range(count)]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.time() - start
+
+    def test_per_host_limit(self):
+        duration = self.fetch_concurrently(6)
+        self.assertEqual(self.server.max_active, 2)
+        # three rounds of two requests
+        self.assertGreaterEqual(duration, 0.6)
+        # the second and third round went through the connections of the first
+        self.assertEqual(len(set(port for path, port, headers in self.server.requests)), 2)
+
+    def test_reconfigure_limit(self):
+        self.fetch_concurrently(2)
+        self.client.configure(max_per_host=3)
+        self.server.max_active = 0
+        self.fetch_concurrently(6)
+        self.assertEqual(self.server.max_active, 3)
+
+    def test_retry(self):
+        self.server.failures = 2
+        with self.client.open(self.url("/flaky")) as response:
+            self.assertEqual(response.status, 200)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_error(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self.client.open(self.url("/missing"))
+        self.assertEqual(context.exception.code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from unibuild.utility import staged_install
+from unibuild.utility.staged_install import InstallConflict, InstallPrefix
+
+
+class InstallPrefixTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.prefix = InstallPrefix(os.path.join(self.directory, "install"), lock_timeout=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, root, file_path, content):
+        file_path = os.path.join(root, *file_path.split("/"))
+        if not os.path.isdir(os.path.dirname(file_path)):
+            os.makedirs(os.path.dirname(file_path))
+        with open(file_path, "w") as f:
+            f.write(content)
+
+    def read(self, file_path):
+        with open(os.path.join(self.prefix.path, *file_path.split("/")), "r") as f:
+            return f.read()
+
+    def install(self, owner, files):
+        with self.prefix.staging(owner) as staging:
+            for file_path, content in files.items():
+                self.write(staging.path, file_path, content)
+
+    def test_merge(self):
+        self.install("a", {"include/a.h": "a", "lib/a.lib": "a"})
+        self.install("b", {"include/b.h": "b"})
+        self.assertEqual(self.read("include/a.h"), "a")
+        self.assertEqual(self.prefix.owners(), {"include/a.h": "a", "lib/a.lib": "a", "include/b.h": "b"})
+        self.assertEqual(sorted(os.listdir(os.path.join(self.prefix.path, "include"))), ["a.h", "b.h"])
+
+    def test_conflict(self):
+        self.install("a", {"include/common.h": "a"})
+        # identical content is fine
+        self.install("b", {"include/common.h": "a"})
+        with self.assertRaises(InstallConflict):
+            self.install("b", {"include/common.h": "b", "include/b.h": "b"})
+        self.assertEqual(self.read("include/common.h"), "a")
+        self.assertFalse(os.path.exists(os.path.join(self.prefix.path, "include", "b.h")))
+
+    def test_stale_files_removed(self):
+        self.install("a", {"include/a.h": "a", "include/old.h": "a"})
+        self.install("a", {"include/a.h": "a2"})
+        self.assertEqual(self.read("include/a.h"), "a2")
+        self.assertFalse(os.path.exists(os.path.join(self.prefix.path, "include", "old.h")))
+        self.assertEqual(self.prefix.owners(), {"include/a.h": "a"})
+
+    def test_outside_prefix(self):
+        with self.assertRaises(InstallConflict):
+            with self.prefix.staging("a") as staging:
+                self.write(staging.path, "include/a.h", "a")
+                self.write(staging.root, "elsewhere/a.h", "a")
+        self.assertFalse(os.path.exists(os.path.join(self.prefix.path, "include", "a.h")))
+
+    def test_rollback(self):
+        self.install("a", {"include/a.h": "a", "include/b.h": "b"})
+        replace = staged_install._replace
+
+        def failing_replace(source, destination):
+            if source.endswith(os.path.join("include", "b.h") + staged_install.NEW_SUFFIX):
+                raise OSError("in use")
+            replace(source, destination)
+
+        staged_install._replace = failing_replace
+        try:
+            with self.assertRaises(OSError):
+                self.install("a", {"include/a.h": "a2", "include/b.h": "b2", "include/c.h": "c2"})
+        finally:
+            staged_install._replace = replace
+        self.assertEqual(self.read("include/a.h"), "a")
+        self.assertEqual(self.read("include/b.h"), "b")
+        self.assertEqual(sorted(os.listdir(os.path.join(self.prefix.path, "include"))), ["a.h", "b.h"])
+        self.assertEqual(self.prefix.owners(), {"include/a.h": "a", "include/b.h": "a"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from unibuild.utility.tree_cache import TreeCache, TreeCloner
+
+
+class TreeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.directory, "cache")
+        self.cache = TreeCache(self.cache_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_failed_populate_leaves_nothing(self):
+        def populate(path):
+            with open(os.path.join(path, "partial"), "w") as f:
+                f.write("partial")
+            raise ValueError("broken archive")
+
+        with self.assertRaises(ValueError):
+            self.cache.add("key", populate)
+        self.assertEqual(os.listdir(self.cache_path), [])
+        self.assertIsNone(self.cache.lookup("key"))
+
+    @unittest.skipIf(not hasattr(os, "symlink"), "symlinks not supported")
+    def test_directory_symlink(self):
+        source = os.path.join(self.directory, "source")
+        os.makedirs(os.path.join(source, "real"))
+        with open(os.path.join(source, "real", "file"), "w") as f:
+            f.write("content")
+        os.symlink("real", os.path.join(source, "link"))
+
+        destination = os.path.join(self.directory, "destination")
+        TreeCloner().clone_tree(source, destination)
+        self.assertTrue(os.path.islink(os.path.join(destination, "link")))
+        self.assertEqual(os.readlink(os.path.join(destination, "link")), "real")
+        self.assertTrue(os.path.isfile(os.path.join(destination, "link", "file")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -17,6 +17,71 @@
 
 
 from task import Task
+from config import config
+from unibuild.utility.compiler_cache import CompilerCache, parse_size
+from unibuild.utility.resources import adaptive_jobs
+from unibuild.utility.memory_governor import MemoryGovernor
+from unibuild.utility.staged_install import InstallPrefix
+import os.path
+
+
+_compiler_caches = {}
+_memory_governors = []
+_install_prefixes = {}
+
+
+def compiler_cache():
+    """
+    the compiler cache set up by the compiler_cache option, None if compiles aren't cached
+    """
+    executable = config.get('compiler_cache', None)
+    if not executable:
+        return None
+    if executable not in _compiler_caches:
+        cache = CompilerCache(executable, config['paths']['compiler_cache'], config.get('compiler_cache_size', "10G"))
+        cache.prepare(config["__environment"])
+        _compiler_caches[executable] = cache
+    return _compiler_caches[executable]
+
+
+def memory_governor():
+    """
+    the governor watching memory during the build, None if disabled
+    """
+    if not config.get('memory_governor', True):
+        return None
+    if not _memory_governors:
+        governor = MemoryGovernor(parse_size(config.get('memory_reserve', "1G")),
+                                  float(config.get('memory_pressure_limit', 10.0)),
+                                  int(config.get('memory_wait_timeout', 60)))
+        governor.start()
+        _memory_governors.append(governor)
+    return _memory_governors[0]
+
+
+def build_jobs(name=None):
+    """
+    number of parallel jobs for a compiler or build tool started now. Unless build_jobs is set that's one per cpu,
+    limited to as many as fit into the available memory with build_job_memory each. The memory governor lowers it
+    further while memory is short
+    :param name: name of the task asking, for the log
+    """
+    memory_per_job = parse_size(config.get('build_job_memory', "1G"))
+    jobs = config.get('build_jobs', None)
+    jobs = int(jobs) if jobs else adaptive_jobs(memory_per_job)
+    governor = memory_governor()
+    return governor.jobs(jobs, memory_per_job, name) if governor is not None else jobs
+
+
+def install_prefix(path=None):
+    """
+    the install prefix at path, which tasks install into through a staging area. By default that's the install
+    directory shared by all projects
+    """
+    path = os.path.normpath(path or os.path.join(config['__build_base_path'], "install"))
+    if path not in _install_prefixes:
+        _install_prefixes[path] = InstallPrefix(path)
+    return _install_prefixes[path]
 
 
 class Builder(Task):
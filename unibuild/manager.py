@@ -28,6 +28,7 @@ class TaskManager(object):
 
     def __init__(self):
         self.__topLevelTask = []
+        self.__dependents = {}
 
     def add_task(self, task):
         self.__topLevelTask.append(task)
@@ -43,9 +44,26 @@ class TaskManager(object):
         for task in self.__topLevelTask:
             self.__add_task(graph, task, parameters, 0)
 
+        # reverse adjacency, edges point from a task to its dependencies
+        self.__dependents = {node: graph.predecessors(node) for node in graph.nodes_iter()}
+
         graph.concentrate = True
         return graph
 
+    def dependents(self, nodes):
+        """
+        all tasks that directly or indirectly depend on any of the nodes, including the nodes themselves.
+        Uses the index built by create_graph so it's unaffected by nodes removed from the graph since
+        """
+        result = set(nodes)
+        stack = list(nodes)
+        while stack:
+            for dependent in self.__dependents.get(stack.pop(), []):
+                if dependent not in result:
+                    result.add(dependent)
+                    stack.append(dependent)
+        return result
+
     def enable(self, graph, node):
         """
         recursively enable the node
@@ -16,10 +16,93 @@
 # along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from unibuild.builder import Builder
+from unibuild.builder import Builder, build_jobs
+from unibuild.utility.tree_cache import hardlink
 from subprocess import Popen
+from config import config
+import fnmatch
+import hashlib
 import os
 import logging
+import shutil
+
+
+# directories containing the sources of the b2 engine, depending on the boost version
+ENGINE_PATHS = [os.path.join("tools", "build", "src", "engine"), os.path.join("tools", "build", "v2", "engine")]
+
+# sources of the engine. Older engines are C, newer ones C++
+ENGINE_SOURCE_PATTERNS = ["*.c", "*.h", "*.cpp", "*.hpp", "*.bat", "*.jam", "*.sh"]
+
+# files produced by bootstrap.bat
+BOOTSTRAP_OUTPUTS = ["b2.exe", "bjam.exe", "project-config.jam"]
+
+BOOTSTRAP_STAMP = ".unibuild-bootstrap"
+
+# properties that select a build configuration, each configuration gets its own stage directory
+CONFIGURATION_PROPERTIES = ["toolset", "address-model", "architecture", "variant", "link", "runtime-link",
+                            "threading"]
+
+
+def bootstrap_key(source_path):
+    """
+    hash of the sources bootstrap.bat builds b2 from. What bootstrapping writes into the engine directory
+    (bootstrap/, bin.*/, executables and objects) is left out, so the key stays the same afterwards
+    """
+    digest = hashlib.sha1()
+    paths = [os.path.join(source_path, "bootstrap.bat")]
+    for engine_path in ENGINE_PATHS:
+        for root, dirs, files in os.walk(os.path.join(source_path, engine_path)):
+            dirs[:] = sorted(d for d in dirs if d != "bootstrap" and not d.startswith("bin."))
+            paths.extend(os.path.join(root, file_name) for file_name in sorted(files)
+                         if any(fnmatch.fnmatch(file_name.lower(), pattern) for pattern in ENGINE_SOURCE_PATTERNS))
+    for file_path in paths:
+        if os.path.isfile(file_path):
+            digest.update(os.path.relpath(file_path, source_path).replace(os.sep, "/"))
+            with open(file_path, "rb") as f:
+                digest.update(hashlib.sha1(f.read()).digest())
+    return digest.hexdigest()
+
+
+def configuration_name(arguments):
+    """
+    name of the build configuration selected by b2 arguments, e.g. "msvc-12.0_64_shared"
+    """
+    properties = dict(argument.split("=", 1) for argument in arguments
+                      if "=" in argument and not argument.startswith("-"))
+    return "_".join(properties[key] for key in CONFIGURATION_PROPERTIES if key in properties) or "default"
+
+
+def sync_directory(source, destination):
+    """
+    make destination contain exactly the files of source, linked where possible
+    """
+    if not os.path.isdir(destination):
+        os.makedirs(destination)
+    names = set(os.listdir(source))
+    for name in os.listdir(destination):
+        if name not in names:
+            path = os.path.join(destination, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+    for name in names:
+        source_path = os.path.join(source, name)
+        destination_path = os.path.join(destination, name)
+        if os.path.isdir(source_path):
+            sync_directory(source_path, destination_path)
+            continue
+        if os.path.isfile(destination_path):
+            source_stat = os.stat(source_path)
+            destination_stat = os.stat(destination_path)
+            if (source_stat.st_size, int(source_stat.st_mtime)) == \
+                    (destination_stat.st_size, int(destination_stat.st_mtime)):
+                continue
+            os.remove(destination_path)
+        try:
+            hardlink(source_path, destination_path)
+        except OSError:
+            shutil.copy2(source_path, destination_path)
 
 
 class B2(Builder):
@@ -48,6 +131,46 @@ class B2(Builder):
             self.__arguments = arguments
         return self
 
+    def __bootstrap(self, sout, serr):
+        """
+        run bootstrap.bat unless b2 was already built from the same sources, here or for another source tree
+        :return: True on success
+        """
+        build_path = self._context["build_path"]
+        key = bootstrap_key(build_path)
+        stamp_path = os.path.join(build_path, BOOTSTRAP_STAMP)
+        if os.path.isfile(stamp_path) and os.path.isfile(os.path.join(build_path, "b2.exe")):
+            with open(stamp_path, "r") as f:
+                if f.read().strip() == key:
+                    logging.info("b2 is up to date")
+                    return True
+
+        cache_path = os.path.join(config['paths']['b2_bootstrap'], key)
+        if os.path.isfile(os.path.join(cache_path, "b2.exe")):
+            logging.info("using b2 bootstrapped earlier from %s", cache_path)
+            for file_name in os.listdir(cache_path):
+                shutil.copy2(os.path.join(cache_path, file_name), os.path.join(build_path, file_name))
+        else:
+            proc = Popen(["cmd.exe", "/C", "bootstrap.bat"], cwd=build_path, stdout=sout, stderr=serr)
+            proc.communicate()
+            if proc.returncode != 0:
+                logging.error("failed to bootstrap (returncode %s)", proc.returncode)
+                return False
+            temp_path = "{}.tmp{}".format(cache_path, os.getpid())
+            os.makedirs(temp_path)
+            for file_name in BOOTSTRAP_OUTPUTS:
+                if os.path.isfile(os.path.join(build_path, file_name)):
+                    shutil.copy2(os.path.join(build_path, file_name), os.path.join(temp_path, file_name))
+            try:
+                os.rename(temp_path, cache_path)
+            except OSError:
+                # bootstrapped concurrently by another build
+                shutil.rmtree(temp_path)
+
+        with open(stamp_path, "w") as f:
+            f.write(key)
+        return True
+
     def process(self, progress):
         if "build_path" not in self._context:
             logging.error("source path not known for {},"
@@ -56,15 +179,13 @@ class B2(Builder):
         serrpath = os.path.join(self._context["build_path"], "stderr.log")
         with open(soutpath, "a") as sout:
             with open(serrpath, "a") as serr:
-                proc = Popen(["cmd.exe", "/C", "bootstrap.bat"], cwd=self._context["build_path"],
-                             stdout=sout, stderr=serr)
-                proc.communicate()
-                if proc.returncode != 0:
-                    logging.error("failed to bootstrap (returncode %s), see %s and %s",
-                                  proc.returncode, soutpath, serrpath)
+                if not self.__bootstrap(sout, serr):
+                    logging.error("see %s and %s", soutpath, serrpath)
                     return False
 
-                cmdline = ["b2.exe"]
+                # every configuration is staged separately, stage/lib gets the files of the current one
+                stage_path = os.path.join("stages", configuration_name(self.__arguments))
+                cmdline = ["b2.exe", "-j{}".format(build_jobs(self.name)), "--stagedir={}".format(stage_path)]
                 if self.__arguments:
                     cmdline.extend(self.__arguments)
 
@@ -74,4 +195,8 @@ class B2(Builder):
                     logging.error("failed to build (returncode %s), see %s and %s",
                                   proc.returncode, soutpath, serrpath)
                     return False
+
+                staged_libs = os.path.join(self._context["build_path"], stage_path, "lib")
+                if os.path.isdir(staged_libs):
+                    sync_directory(staged_libs, os.path.join(self._context["build_path"], "stage", "lib"))
         return True
@@ -17,12 +17,17 @@
 
 
 from unibuild import Task
-from unibuild.builder import Builder
+from unibuild.builder import Builder, compiler_cache, build_jobs, install_prefix
 from unibuild.utility.lazy import Lazy
-from subprocess import Popen
+from unibuild.utility.compiler_cache import compiler_cache_statistics
+from unibuild.utility.cpp_toolchain import TOOLCHAINS, OutputState
+from unibuild.utility.make_tools import make_command
+from subprocess import Popen, PIPE
+from collections import namedtuple
 from config import config
 import os.path
 import logging
+import threading
 
 from buildtools import os_utils
 
@@ -32,12 +37,19 @@ EXECUTABLE = 3
 
 
 class CPP(Builder):
+    """
+    compiles the files of its sources() targets directly, as many at a time as there are build jobs. Objects
+    are only recompiled if the source, one of the headers it included or the flags changed since the last build
+    """
 
-    def __init__(self, cflags=None):
+    Target = namedtuple("Target", ["name", "inputs", "command", "top_level", "compiled"])
+
+    def __init__(self, cflags=None, toolchain=None):
         super(CPP, self).__init__()
         self.__type = EXECUTABLE
         self.__targets = []
-        self.__cflags = cflags or ["-nologo", "-O2", "-MD"]
+        self.__cflags = cflags
+        self.__toolchain = toolchain
 
     @property
     def name(self):
@@ -53,70 +65,201 @@ class CPP(Builder):
         self.__type = build_type
         return self
 
-    def __gen_build_cmd(self, target, files):
-        if self.__type == STATIC_LIB:
-            return "link.exe /lib /nologo /out:{0}.lib {1}".format(
-                target, " ".join([self.__to_obj(f) for f in files]))
-        else:
-            raise NotImplementedError("type {} not yet implemented", self.__type)
-
     def sources(self, target, files, top_level=True):
-        self.__targets.append((target, files, self.__gen_build_cmd(target, files), top_level))
+        if self.__type != STATIC_LIB:
+            raise NotImplementedError("type {} not yet implemented".format(self.__type))
+        self.__targets.append(CPP.Target(target, files, None, top_level, True))
         return self
 
     def custom(self, target, dependencies=None, cmd=None, top_level=False):
-        self.__targets.append((target, dependencies, cmd, top_level))
+        self.__targets.append(CPP.Target(target, dependencies, cmd, top_level, False))
         return self
 
-    @staticmethod
-    def __to_obj(filename):
-        return "{}.obj".format(os.path.splitext(os.path.basename(filename))[0])
-
-    def gen_makefile(self, path):
-        with open(os.path.join(path, "unimakefile"), "w") as mf:
-            mf.write("CFLAGS={}\n\n".format(" ".join(self.__cflags)))
-            for target in self.__targets:
-                files = target[1] or []
-                for f in files:
-                    mf.write("{}:\n".format(self.__to_obj(f)))
-                    mf.write("\t{cl} -c $(CFLAGS) -Fo {file}\n\n".format(cl="cl", file=f))
-
-                mf.write("{0}: {1}\n\t{2}\n\n".format(target[0],
-                                                      " ".join([self.__to_obj(f) for f in files]),
-                                                      target[2] or ""))
-
-            mf.write("all: {}\n".format(" ".join([target[0]
-                                                  for target in self.__targets
-                                                  if target[3]])))
+    def __create_toolchain(self):
+        name = self.__toolchain or config.get('cpp_toolchain', None) or ("msvc" if os.name == "nt" else "gcc")
+        if name not in TOOLCHAINS:
+            raise ValueError("unknown toolchain {}, expected one of {}".format(name, ", ".join(sorted(TOOLCHAINS))))
+        return TOOLCHAINS[name]()
 
     def process(self, progress):
         path = self._context["build_path"]
-
-        self.gen_makefile(path)
-
-        soutpath = os.path.join(self._context["build_path"], "stdout.log")
-        serrpath = os.path.join(self._context["build_path"], "stderr.log")
+        toolchain = self.__create_toolchain()
+        cache = compiler_cache()
+        environment = cache.environment(config["__environment"]) if cache is not None \
+            else dict(config["__environment"])
+        toolchain.locate(environment)
+
+        soutpath = os.path.join(path, "stdout.log")
+        serrpath = os.path.join(path, "stderr.log")
         with open(soutpath, "a") as sout:
             with open(serrpath, "a") as serr:
-                command = "{} /f unimakefile all".format(config["tools"]["make"])
-                sout.write("running {} in {}\n".format(command, self._context['build_path']))
-                proc = Popen(command,
-                             env=config["__environment"],
-                             cwd=self._context["build_path"],
-                             shell=True,
-                             stdout=sout, stderr=serr)
-                proc.communicate()
-                if proc.returncode != 0:
-                    logging.error("failed to build custom makefile (returncode %s), see %s and %s",
-                                  proc.returncode, soutpath, serrpath)
+                compilation = _Compilation(self.name, self.__targets, toolchain,
+                                           self.__cflags or toolchain.default_flags,
+                                           [cache.executable] if cache is not None else [], environment, path,
+                                           sout, serr, progress)
+                try:
+                    with compiler_cache_statistics.measure(self.name, cache, environment):
+                        result = compilation.make_all()
+                finally:
+                    compilation.save()
+                    progress.finish()
+                if not result:
+                    logging.error("failed to build %s, see %s and %s", self._context.name, soutpath, serrpath)
                     return False
+        self._changed = compilation.changed
+        return True
+
+
+class _Compilation(object):
+    """
+    one build of the targets of a CPP task
+    """
+
+    def __init__(self, name, targets, toolchain, cflags, launcher, environment, path, sout, serr, progress):
+        self.__name = name
+        self.__targets = dict((target.name, target) for target in targets)
+        self.__order = [target.name for target in targets]
+        self.__toolchain = toolchain
+        self.__cflags = cflags
+        self.__launcher = launcher
+        self.__environment = environment
+        self.__path = path
+        self.__sout = sout
+        self.__serr = serr
+        self.__progress = progress
+        self.__state = OutputState(path)
+        self.__lock = threading.Lock()
+        self.__made = set()
+        self.changed = False
+
+    def save(self):
+        self.__state.save()
+
+    def make_all(self):
+        return all(self.__make(name) for name in self.__order if self.__targets[name].top_level)
+
+    def __make(self, name):
+        """
+        bring the target and the targets it's made from up to date
+        """
+        if name in self.__made or name not in self.__targets:
+            return True
+        self.__made.add(name)
+        target = self.__targets[name]
+        inputs = target.inputs or []
+        if not all(self.__make(input_name) for input_name in inputs):
+            return False
+        if target.compiled:
+            return self.__compile(inputs) and self.__archive(target.name, inputs)
+        else:
+            return self.__custom(target)
+
+    def __run(self, command, shell=False):
+        proc = Popen(command, env=self.__environment, cwd=self.__path, shell=shell, stdout=PIPE, stderr=PIPE)
+        stdout, stderr = proc.communicate()
+        return proc.returncode, stdout, stderr
+
+    def __log(self, command, stdout, stderr):
+        with self.__lock:
+            self.__sout.write("running {}\n".format(command if isinstance(command, basestring) else " ".join(command)))
+            self.__sout.write(stdout)
+            self.__serr.write(stderr)
+
+    def __compile(self, sources):
+        pending = []
+        for source in sources:
+            object_name = self.__toolchain.object_name(source)
+            command = self.__toolchain.compile_command(source, object_name, self.__cflags)
+            if not self.__state.is_current(object_name, command):
+                pending.append((source, object_name, command))
+        if not pending:
+            return True
+
+        self.changed = True
+        self.__progress.job = "Compiling"
+        self.__progress.maximum = len(pending)
+        self.__progress.value = 0
+        failed = []
+
+        def worker():
+            while True:
+                with self.__lock:
+                    if not pending or failed:
+                        return
+                    source, object_name, command = pending.pop(0)
+                returncode, stdout, stderr = self.__run(self.__launcher + command)
+                dependencies, stdout = self.__toolchain.dependencies(object_name, stdout, self.__path)
+                self.__log(command, stdout, stderr)
+                with self.__lock:
+                    if returncode == 0:
+                        self.__state.record(object_name, command, [source] + dependencies)
+                        self.__progress.value += 1
+                    else:
+                        self.__state.forget(object_name)
+                        failed.append(source)
+
+        threads = [threading.Thread(target=worker) for _ in range(min(build_jobs(self.__name), len(pending)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if failed:
+            logging.error("failed to compile %s", ", ".join(failed))
+        return not failed
+
+    def __archive(self, target, sources):
+        lib_name = self.__toolchain.static_lib_name(target)
+        objects = [self.__toolchain.object_name(source) for source in sources]
+        command = self.__toolchain.archive_command(lib_name, objects)
+        if self.__state.is_current(lib_name, command):
+            return True
+
+        self.changed = True
+        if os.path.exists(os.path.join(self.__path, lib_name)):
+            os.remove(os.path.join(self.__path, lib_name))
+        returncode, stdout, stderr = self.__run(command)
+        self.__log(command, stdout, stderr)
+        if returncode != 0:
+            self.__state.forget(lib_name)
+            logging.error("failed to create %s", lib_name)
+            return False
+        self.__state.record(lib_name, command, objects)
+        return True
+
+    def __custom(self, target):
+        """
+        run the command of a custom target if the target doesn't exist or one of its inputs changed
+        """
+        inputs = target.inputs or []
+        if not target.command or self.__state.is_current(target.name, target.command):
+            return True
+        if not inputs and os.path.exists(os.path.join(self.__path, target.name)):
+            # like make, a target without prerequisites is up to date as long as it exists
+            return True
+
+        self.changed = True
+        returncode, stdout, stderr = self.__run(target.command, shell=True)
+        self.__log(target.command, stdout, stderr)
+        if returncode != 0:
+            self.__state.forget(target.name)
+            logging.error("failed to make %s", target.name)
+            return False
+        self.__state.record(target.name, target.command, inputs)
         return True
 
 
 class Install(Builder):
-    def __init__(self, make_tool=None):
+    def __init__(self, make_tool=None, jobs=None, prefix=None):
+        """
+        :param make_tool: the make tool, possibly with arguments. GNU make, jom, nmake and ninja are recognised
+        :param jobs: number of parallel jobs, by default as many as the machine can take
+        :param prefix: the directory the makefile installs to, the shared install directory by default. Files are
+                       installed into a staging area (DESTDIR, INSTALL_ROOT for qmake) and then merged into it
+        """
         super(Install, self).__init__()
         self.__make_tool = Lazy(make_tool or config['tools']['make'])
+        self.__jobs = Lazy(jobs or (lambda: build_jobs(self.name)))
+        self.__prefix = Lazy(prefix)
 
     @property
     def name(self):
@@ -132,26 +275,37 @@ class Install(Builder):
         soutpath = os.path.join(self._context["build_path"], "stdout.log")
         serrpath = os.path.join(self._context["build_path"], "stderr.log")
 
-        with open(soutpath, "a") as sout:
-            with open(serrpath, "a") as serr:
-                proc = Popen([self.__make_tool(), "install"],
-                             shell=True,
-                             env=config["__environment"],
-                             cwd=self._context["build_path"],
-                             stdout=sout, stderr=serr)
-                proc.communicate()
-                if proc.returncode != 0:
-                    logging.error("failed to install (returncode %s), see %s and %s",
-                                  proc.returncode, soutpath, serrpath)
-                    return False
+        try:
+            with open(soutpath, "a") as sout:
+                with open(serrpath, "a") as serr:
+                    with install_prefix(self.__prefix()).staging(self.name) as staging:
+                        environment = dict(config["__environment"], DESTDIR=staging.root, INSTALL_ROOT=staging.root)
+                        proc = Popen(make_command(self.__make_tool(), self.__jobs(), ["install"], environment),
+                                     shell=True,
+                                     env=environment,
+                                     cwd=self._context["build_path"],
+                                     stdout=sout, stderr=serr)
+                        proc.communicate()
+                        if proc.returncode != 0:
+                            raise Exception("failed to install (returncode %s), see %s and %s" %
+                                            (proc.returncode, soutpath, serrpath))
+        except Exception, e:
+            logging.error(e.message)
+            return False
         return True
 
 
 class Make(Builder):
-    def __init__(self, make_tool=None, environment=None, working_directory=None):
+    def __init__(self, make_tool=None, environment=None, working_directory=None, jobs=None):
+        """
+        :param make_tool: the make tool, possibly with arguments. GNU make, jom, nmake and ninja are recognised
+        :param jobs: number of parallel jobs, by default as many as the machine can take. Ignored if make_tool
+                     specifies them itself
+        """
         super(Make, self).__init__()
         self.__install = False
         self.__make_tool = Lazy(make_tool or config['tools']['make'])
+        self.__jobs = Lazy(jobs or (lambda: build_jobs(self.name)))
         self.__environment = Lazy(environment)
         self.__working_directory = Lazy(working_directory)
 
@@ -181,20 +335,27 @@ class Make(Builder):
                 cwd = str(self.__working_directory()
                           if self.__working_directory() is not None
                           else self._context["build_path"])
-
-                proc = Popen(self.__make_tool().split(" "),
-                             env=environment,
-                             cwd=cwd,
-                             shell=True,
-                             stdout=sout, stderr=serr)
-                proc.communicate()
+                cache = compiler_cache()
+                if cache is not None:
+                    # makefiles that take the compiler from the environment compile through the cache
+                    environment = cache.environment(environment)
+                    environment.setdefault("CC", cache.wrap("cl"))
+                    environment.setdefault("CXX", cache.wrap("cl"))
+
+                with compiler_cache_statistics.measure(self.name, cache, environment):
+                    proc = Popen(make_command(self.__make_tool(), self.__jobs(), environment=environment),
+                                 env=environment,
+                                 cwd=cwd,
+                                 shell=True,
+                                 stdout=sout, stderr=serr)
+                    proc.communicate()
                 if proc.returncode != 0:
                     logging.error("failed to run make (returncode %s), see %s and %s",
                                   proc.returncode, soutpath, serrpath)
                     return False
 
                 if self.__install:
-                    proc = Popen([config['tools']['make'], "install"],
+                    proc = Popen(make_command(self.__make_tool(), self.__jobs(), ["install"], environment),
                                  shell=True,
                                  env=environment,
                                  cwd=cwd,
@@ -16,18 +16,120 @@
 # along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from unibuild.builder import Builder
+from unibuild.builder import Builder, compiler_cache, build_jobs, install_prefix
 from unibuild.utility.enum import enum
 from unibuild.utility.context_objects import on_exit
+from unibuild.utility.cmake_stamp import configure_key, is_current, write_stamp, clear_stamp, reset_generator
+from unibuild.utility.cmake_initial_cache import InitialCache, toolchain_fingerprint
+from unibuild.utility.compiler_cache import compiler_cache_statistics
 from subprocess import Popen, PIPE
 from config import config
 import os.path
 import logging
 import shutil
 import re
+import time
 
 from buildtools import os_utils
 
+
+# generators whose build tool understands -j
+PARALLEL_GENERATORS = ["Ninja", "NMake Makefiles JOM", "Unix Makefiles", "MinGW Makefiles"]
+
+_initial_caches = {}
+
+NINJA_PROGRESS = re.compile(r"^\[(\d+)/(\d+)\]")
+MAKE_PROGRESS = re.compile(r"^\[([0-9 ][0-9 ][0-9])%\]")
+INSTALL_PREFIX = re.compile(r"^-DCMAKE_INSTALL_PREFIX(?::\w+)?=(.*)$")
+
+
+def generator():
+    """
+    generator for command line builds. Ninja is used if it's available since NMake compiles one file at a time
+    """
+    result = config.get('cmake_generator', None)
+    if result is None:
+        result = "Ninja" if config.get('paths.ninja', None) else "NMake Makefiles"
+    return result
+
+
+def generator_arguments():
+    result = ["-G", generator()]
+    if generator() == "Ninja" and config.get('paths.ninja', None):
+        result.append("-DCMAKE_MAKE_PROGRAM={}".format(config.get('paths.ninja')))
+    return result
+
+
+def initial_cache(generator_args):
+    """
+    the initial cache shared by all projects configured with this generator and toolchain, created on
+    first use. None if disabled or the toolchain couldn't be probed
+    """
+    if not config.get('cmake_initial_cache', True):
+        return None
+    fingerprint = toolchain_fingerprint(generator_args, config["__environment"],
+                                        [config["paths"]["cmake"], config.get('paths.ninja', None)])
+    if fingerprint not in _initial_caches:
+        cache = InitialCache(config['paths']['cmake_initial_cache'], fingerprint)
+        if not cache.exists() and not cache.generate(config["paths"]["cmake"], generator_args,
+                                                     config["__environment"]):
+            cache = None
+        _initial_caches[fingerprint] = cache
+    return _initial_caches[fingerprint]
+
+
+def initial_cache_arguments(cache):
+    return ["-C", cache.path] if cache is not None else []
+
+
+def compiler_launcher_arguments(cache):
+    """
+    definitions that run every compile through the compiler cache. Debug information goes into the objects
+    (/Z7) instead of a shared pdb, the caches can't handle the latter
+    """
+    if cache is None:
+        return []
+    launcher = cache.executable.replace("\\", "/")
+    return ["-DCMAKE_C_COMPILER_LAUNCHER={}".format(launcher),
+            "-DCMAKE_CXX_COMPILER_LAUNCHER={}".format(launcher),
+            "-DCMAKE_POLICY_DEFAULT_CMP0141=NEW",
+            "-DCMAKE_MSVC_DEBUG_INFORMATION_FORMAT=Embedded"]
+
+
+def build_command(target=None, jobs=None):
+    result = [config["paths"]["cmake"], "--build", "."]
+    if target is not None:
+        result += ["--target", target]
+    if generator() in PARALLEL_GENERATORS:
+        result += ["--", "-j", str(jobs or build_jobs())]
+    return result
+
+
+def install_prefix_argument(arguments):
+    """
+    :return: the CMAKE_INSTALL_PREFIX set in arguments, None if it isn't
+    """
+    for argument in arguments:
+        match = INSTALL_PREFIX.match(argument)
+        if match is not None:
+            return match.group(1).strip('"')
+    return None
+
+
+def parse_progress(line):
+    """
+    :return: (value, maximum) from a progress line of ninja ("[3/42] ...") or make ("[ 7%] ..."), None if
+             the line isn't one
+    """
+    match = NINJA_PROGRESS.search(line)
+    if match is not None:
+        return int(match.group(1)), int(match.group(2))
+    match = MAKE_PROGRESS.search(line)
+    if match is not None:
+        return int(match.group(1)), 100
+    return None
+
+
 class CMake(Builder):
 
     def __init__(self):
@@ -78,47 +180,80 @@ class CMake(Builder):
             with on_exit(lambda: progress.finish()):
                 with open(soutpath, "w") as sout:
                     with open(serrpath, "w") as serr:
-                        with os_utils.Chdir(self.build_path):
-                            os_utils.cmd([config["paths"]["cmake"], "-G", "NMake Makefiles", ".."] + self.__arguments, echo=True, show_output=True, critical=True)
-                        proc = Popen([config['tools']['make'], "verbose=1"],
-                                     shell=True,
-                                     env=config["__environment"],
-                                     cwd=build_path,
-                                     stdout=PIPE, stderr=serr)
-                        progress.job = "Compiling"
-                        progress.maximum = 100
-                        while proc.poll() is None:
-                            while True:
-                                line = proc.stdout.readline()
-                                if line != '':
-                                    match = re.search("^\\[([0-9 ][0-9 ][0-9])%\\]", line)
-                                    if match is not None:
-                                        progress.value = int(match.group(1))
-                                    sout.write(line)
-                                else:
-                                    break
+                        compiler = compiler_cache()
+                        environment = compiler.environment(config["__environment"]) if compiler is not None \
+                            else config["__environment"]
+                        cache = initial_cache(generator_arguments())
+                        arguments = generator_arguments() + initial_cache_arguments(cache) \
+                            + compiler_launcher_arguments(compiler) + [".."] + self.__arguments
+                        stamp_key = configure_key(arguments, self._context["build_path"], environment,
+                                                  [config["paths"]["cmake"], config.get('paths.ninja', None)])
+                        if is_current(build_path, stamp_key):
+                            logging.info("configuration of %s is unchanged", self._context.name)
+                        else:
+                            clear_stamp(build_path)
+                            if reset_generator(build_path, generator()):
+                                logging.info("generator of %s changed to %s, configuring from scratch",
+                                             self._context.name, generator())
+                            proc = Popen([config["paths"]["cmake"]] + arguments,
+                                         env=environment,
+                                         cwd=build_path,
+                                         stdout=sout, stderr=serr)
+                            proc.communicate()
+                            if proc.returncode != 0:
+                                raise Exception("failed to configure (returncode %s), see %s and %s" %
+                                                (proc.returncode, soutpath, serrpath))
+                            write_stamp(build_path, stamp_key)
+
+                        start = time.time()
+                        with compiler_cache_statistics.measure(self.name, compiler, environment):
+                            proc = Popen(build_command(jobs=build_jobs(self.name)),
+                                         env=environment,
+                                         cwd=build_path,
+                                         stdout=PIPE, stderr=serr)
+                            progress.job = "Compiling"
+                            progress.maximum = 100
+                            for line in iter(proc.stdout.readline, ''):
+                                current = parse_progress(line)
+                                if current is not None:
+                                    progress.maximum = current[1]
+                                    progress.value = current[0]
+                                sout.write(line)
+                            proc.wait()
 
                         if proc.returncode != 0:
                             raise Exception("failed to build (returncode %s), see %s and %s" %
                                             (proc.returncode, soutpath, serrpath))
+                        logging.info("built %s in %.1fs", self._context.name, time.time() - start)
 
                         if self.__install:
-                            proc = Popen([config['tools']['make'], "install"],
-                                         shell=True,
-                                         env=config["__environment"],
-                                         cwd=build_path,
-                                         stdout=sout, stderr=serr)
-                            proc.communicate()
-                            if proc.returncode != 0:
-                                raise Exception("failed to install (returncode %s), see %s and %s" %
-                                                (proc.returncode, soutpath, serrpath))
-                                return False
+                            prefix = install_prefix_argument(self.__arguments)
+                            if prefix is None:
+                                logging.warning("no install prefix set for %s, installing without staging",
+                                                self._context.name)
+                                self.__run_install(environment, build_path, sout, serr)
+                            else:
+                                # install into a staging area (DESTDIR) first and merge that into the prefix
+                                with install_prefix(prefix).staging(self.name) as staging:
+                                    self.__run_install(dict(environment, DESTDIR=staging.root), build_path,
+                                                       sout, serr)
         except Exception, e:
             logging.error(e.message)
             return False
         return True
 
 
+    def __run_install(self, environment, build_path, sout, serr):
+        proc = Popen(build_command("install"),
+                     env=environment,
+                     cwd=build_path,
+                     stdout=sout, stderr=serr)
+        proc.communicate()
+        if proc.returncode != 0:
+            raise Exception("failed to install (returncode %s), see %s and %s" %
+                            (proc.returncode, sout.name, serr.name))
+
+
 class CMakeEdit(Builder):
 
     Type = enum(VC=1, CodeBlocks=2)
@@ -156,7 +291,7 @@ class CMakeEdit(Builder):
             return "Visual Studio {} {}"\
                 .format(config['vc_version'].split('.')[0], self.__vc_year(config['vc_version']))
         elif self.__type == CMakeEdit.Type.CodeBlocks:
-            return "CodeBlocks - NMake Makefiles"
+            return "CodeBlocks - {}".format(generator())
 
     def prepare(self):
         self._context['edit_path'] = os.path.join(self._context['build_path'], "edit")
@@ -176,6 +311,9 @@ class CMakeEdit(Builder):
 
         with open(soutpath, "w") as sout:
             with open(serrpath, "w") as serr:
+                generator_args = ["-G", self.__generator_name()]
+                cache = initial_cache(generator_args)
                 with os_utils.Chdir(self._context['edit_path']):
-                    return os_utils.cmd([config["paths"]["cmake"], "-G", self.__generator_name(), ".."] + self.__arguments, echo=True, show_output=True, critical=False)
+                    result = os_utils.cmd([config["paths"]["cmake"]] + generator_args + initial_cache_arguments(cache) + [".."] + self.__arguments, echo=True, show_output=True, critical=False)
+                return result
         return True
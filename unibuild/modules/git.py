@@ -16,20 +16,220 @@
 # along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from subprocess import Popen
+from subprocess import Popen, PIPE
 from config import config
 from repository import Repository
 import os
+import re
+import time
+import shutil
 import logging
+import threading
 from unibuild import Task
+from unibuild.utility.source_fingerprint import git_fingerprint, git_fingerprints
+from unibuild.utility.git_submodules import list_submodules, select_submodules, update_submodules
 from urlparse import urlparse, urlsplit
 
 
+class MirrorCache(object):
+    """
+    machine-wide cache of bare mirrors, one per remote url. Clones borrow objects from it through
+    alternates so every workspace only fetches what the cache doesn't have yet.
+    Objects are never pruned from a mirror since clones referencing it would break
+    """
+
+    STAMP_FILE = "unibuild-fetched"
+
+    def __init__(self):
+        self.__refreshed = set()
+
+    @staticmethod
+    def path(url):
+        parts = urlsplit(url)
+        name = parts.path.strip("/")
+        if not name.endswith(".git"):
+            name += ".git"
+        return os.path.join(config['paths']['git_mirrors'], parts.hostname or "local", *name.split("/"))
+
+    @staticmethod
+    def __git(args, cwd=None):
+        proc = Popen([config['paths']['git']] + args,
+                     cwd=cwd,
+                     env=config["__environment"])
+        proc.communicate()
+        return proc.returncode
+
+    def __is_stale(self, mirror_path):
+        stamp_path = os.path.join(mirror_path, MirrorCache.STAMP_FILE)
+        if not os.path.isfile(stamp_path):
+            return True
+        return time.time() - os.path.getmtime(stamp_path) > config.get('git_mirror_update_frequency', 60 * 60)
+
+    @staticmethod
+    def __touch(mirror_path):
+        with open(os.path.join(mirror_path, MirrorCache.STAMP_FILE), "w") as f:
+            f.write(str(time.time()))
+
+    def update(self, url):
+        """
+        create or refresh the mirror of url if it's stale
+        :return: path of the mirror or None if there is no usable mirror
+        """
+        if not config.get('git_mirror_cache', True):
+            return None
+        mirror_path = MirrorCache.path(url)
+        if url in self.__refreshed:
+            return mirror_path
+
+        if not os.path.isdir(mirror_path):
+            if config.get('offline', False):
+                return None
+            # clone next to the final location and rename so other workspaces never see a partial mirror
+            temp_path = "{}.tmp{}".format(mirror_path, os.getpid())
+            if os.path.isdir(temp_path):
+                shutil.rmtree(temp_path)
+            if MirrorCache.__git(["clone", "--mirror", url, temp_path]) != 0:
+                logging.warning("failed to create mirror of %s, cloning without it", url)
+                return None
+            MirrorCache.__git(["config", "gc.auto", "0"], temp_path)
+            MirrorCache.__touch(temp_path)
+            try:
+                os.rename(temp_path, mirror_path)
+            except OSError:
+                # another workspace created the mirror in the meantime
+                shutil.rmtree(temp_path)
+        elif self.__is_stale(mirror_path) and not config.get('offline', False):
+            if MirrorCache.__git(["fetch", "--tags", "origin"], mirror_path) == 0:
+                MirrorCache.__touch(mirror_path)
+            else:
+                # an outdated mirror still saves most of the transfer
+                logging.warning("failed to update mirror of %s", url)
+
+        self.__refreshed.add(url)
+        return mirror_path
+
+
+mirror_cache = MirrorCache()
+
+
+class RemoteHeads(object):
+    """
+    remote branch heads of all clones. The first lookup queries every clone that is due for an update
+    concurrently so unchanged repositories don't need a pull
+    """
+
+    def __init__(self):
+        self.__clones = []
+        self.__heads = None
+        self.__lock = threading.Lock()
+
+    def add(self, clone):
+        self.__clones.append(clone)
+
+    @staticmethod
+    def __ls_remote(url, branch):
+        proc = Popen([config['paths']['git'], "ls-remote", url, "refs/heads/{}".format(branch)],
+                     env=config["__environment"],
+                     stdout=PIPE, stderr=PIPE)
+        stdout, stderr = proc.communicate()
+        if proc.returncode != 0 or not stdout.strip():
+            logging.warning("failed to query remote head of %s: %s", url, stderr.strip())
+            return None
+        return stdout.split()[0]
+
+    def __query(self, keys):
+        heads = {}
+        queue = list(keys)
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    url, branch = queue.pop(0)
+                head = RemoteHeads.__ls_remote(url, branch)
+                with lock:
+                    heads[(url, branch)] = head
+
+        threads = [threading.Thread(target=worker)
+                   for _ in range(max(1, min(config.get('git_jobs', 8), len(queue))))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return heads
+
+    def get(self, clone):
+        """
+        :return: the sha of the remote branch head or None if it couldn't be determined
+        """
+        key = (clone.url, clone.branch)
+        with self.__lock:
+            if self.__heads is None:
+                keys = set((c.url, c.branch) for c in self.__clones if c.needs_update_check())
+                logging.info("checking %d repositories for remote changes", len(keys))
+                self.__heads = self.__query(keys)
+            if key not in self.__heads:
+                self.__heads.update(self.__query([key]))
+            return self.__heads[key]
+
+
+remote_heads = RemoteHeads()
+
+
+class SourceFingerprints(object):
+    """
+    source fingerprints of all clone destinations, computed concurrently on the first lookup. Clones are
+    registered rather than paths because their destination may still change until then
+    """
+
+    def __init__(self):
+        self.__clones = []
+        self.__fingerprints = None
+        self.__lock = threading.Lock()
+
+    def add(self, clone):
+        self.__clones.append(clone)
+
+    def get(self, path):
+        with self.__lock:
+            if self.__fingerprints is None:
+                paths = set(clone.output_path for clone in self.__clones)
+                self.__fingerprints = git_fingerprints(config['paths']['git'],
+                                                       [p for p in paths if os.path.isdir(p)],
+                                                       config['__environment'],
+                                                       config.get('git_fsmonitor', False),
+                                                       config.get('git_jobs', 8))
+            if path not in self.__fingerprints:
+                self.__fingerprints[path] = self.__compute(path)
+            return self.__fingerprints[path]
+
+    def refresh(self, path):
+        """
+        fingerprint path again after its sources were updated
+        """
+        fingerprint = self.__compute(path)
+        with self.__lock:
+            if self.__fingerprints is not None:
+                self.__fingerprints[path] = fingerprint
+        return fingerprint
+
+    @staticmethod
+    def __compute(path):
+        return git_fingerprint(config['paths']['git'], path, config['__environment'],
+                               config.get('git_fsmonitor', False))
+
+
+source_fingerprints = SourceFingerprints()
+
+
 class SuperRepository(Task):
     def __init__(self, name):
         super(SuperRepository, self).__init__()
         self.__name = name
         self.__context_data = {}
+        self.__children = []
         self.prepare()
 
     def prepare(self):
@@ -52,6 +252,75 @@ class SuperRepository(Task):
     def __contains__(self, keys):
         return self.__context_data.__contains__(keys)
 
+    def add_child(self, clone):
+        """
+        register a repository that lives in this super repository so it can be fetched in a batch
+        """
+        self.__children.append(clone)
+
+    def __missing_children(self):
+        return [child for child in self.__children
+                if not os.path.exists(os.path.join(child.output_path, ".git"))]
+
+    def already_processed(self):
+        # children added to the build script since the last run still have to be fetched
+        return super(SuperRepository, self).already_processed() and not self.__missing_children()
+
+    def __fetch_children(self, progress):
+        """
+        clone all missing children concurrently, then register them as submodules one by one since
+        that modifies the index and .gitmodules of the super repository
+        """
+        pending = self.__missing_children()
+        if not pending:
+            return
+
+        jobs = max(1, min(config.get('git_jobs', 8), len(pending)))
+        logging.info("fetching %d repositories of %s with %d jobs", len(pending), self.__name, jobs)
+        progress.maximum = len(pending)
+        progress.value = 0
+        queue = list(pending)
+        cloned = []
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    child = queue.pop(0)
+                success = child.prefetch()
+                with lock:
+                    if success:
+                        cloned.append(child)
+                    progress.job = "Fetched {}".format(child.submodule_name)
+                    progress.value += 1
+                    logging.info("%s %s (%d/%d)", "fetched" if success else "failed to fetch",
+                                 child.submodule_name, progress.value, len(pending))
+
+        threads = [threading.Thread(target=worker) for _ in range(jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        progress.finish()
+
+        # children that failed here fall back to adding themselves when they are processed
+        for child in cloned:
+            proc = Popen([config['paths']['git'], "submodule", "add", "--force", "--name", child.submodule_name,
+                          child.url, child.submodule_name],
+                         cwd=self.path,
+                         env=config['__environment'])
+            proc.communicate()
+            if proc.returncode == 0:
+                proc = Popen([config['paths']['git'], "submodule", "absorbgitdirs", "--", child.submodule_name],
+                             cwd=self.path,
+                             env=config['__environment'])
+                proc.communicate()
+            if proc.returncode != 0:
+                logging.warning("failed to register submodule %s (returncode %s)",
+                                child.submodule_name, proc.returncode)
+
     def process(self, progress):
         if not os.path.isdir(self.path):
             os.makedirs(self.path)
@@ -60,22 +329,39 @@ class SuperRepository(Task):
                          env=config['__environment'])
             proc.communicate()
             if proc.returncode != 0:
-                logging.error("failed to init superproject %s (returncode %s)", self._name, proc.returncode)
+                logging.error("failed to init superproject %s (returncode %s)", self.__name, proc.returncode)
                 return False
 
+        self.__fetch_children(progress)
+        # newly fetched children are reported as changed by their own tasks
+        self._changed = False
         return True
 
 
 class Clone(Repository):
-    def __init__(self, url, branch, super_repository=None, update=True):
+    def __init__(self, url, branch, super_repository=None, update=True, depth=None, clone_filter=None, commit=None):
+        """
+        :param depth: create a shallow clone with this many commits of history (git_clone_depth setting
+                      if not set)
+        :param clone_filter: partial clone filter like "blob:none" (git_clone_filter setting if not set)
+        :param commit: pin the checkout to this commit. Only that commit is fetched, the branch is ignored
+        """
         super(Clone, self).__init__(url, branch)
 
         self.__super_repository = super_repository
         self.__base_name = os.path.basename(self._url)
         self.__update = update
+        self.__depth = depth if depth is not None else config.get('git_clone_depth', None)
+        self.__filter = clone_filter if clone_filter is not None else config.get('git_clone_filter', None)
+        self.__commit = commit
+        self.__mirror = None
+        self.__fresh = False
         if self.__super_repository is not None:
             self._output_file_path = os.path.join(self.__super_repository.path, self.__determine_name())
             self.depend(super_repository)
+            super_repository.add_child(self)
+        remote_heads.add(self)
+        source_fingerprints.add(self)
 
     def __determine_name(self):
         return self.__base_name
@@ -83,34 +369,257 @@ class Clone(Repository):
     def prepare(self):
         self._context['build_path'] = self._output_file_path
 
+    def __git(self, args, cwd=None):
+        proc = Popen([config['paths']['git']] + args,
+                     cwd=cwd,
+                     env=config["__environment"])
+        proc.communicate()
+        return proc.returncode
+
+    def __git_output(self, args, cwd):
+        proc = Popen([config['paths']['git']] + args,
+                     cwd=cwd,
+                     env=config["__environment"],
+                     stdout=PIPE, stderr=PIPE)
+        stdout, stderr = proc.communicate()
+        return stdout.strip() if proc.returncode == 0 else None
+
+    def __fetch_options(self):
+        options = []
+        if self.__depth:
+            options.append("--depth={}".format(self.__depth))
+        if self.__filter:
+            options.append("--filter={}".format(self.__filter))
+        return options
+
+    def __checkout_commit(self):
+        """
+        fetch exactly the pinned commit into the repository and check it out
+        """
+        if self.__git_output(["rev-parse", "HEAD"], self._output_file_path) == self.__commit:
+            return 0
+
+        source = self._url
+        if self.__mirror is not None and self.__git(["--git-dir", self.__mirror, "cat-file", "-e",
+                                                     self.__commit + "^{commit}"]) == 0:
+            source = self.__mirror
+        elif config.get('offline', False):
+            if self.__git(["cat-file", "-e", self.__commit + "^{commit}"], self._output_file_path) != 0:
+                logging.error("pinned commit %s of %s not available offline", self.__commit, self._url)
+                return 1
+            return self.__git(["checkout", "--detach", self.__commit], self._output_file_path)
+        returncode = self.__git(["fetch"] + self.__fetch_options() + [source, self.__commit],
+                                self._output_file_path)
+        if returncode != 0:
+            # not every server allows fetching unadvertised commits, fetch the branch and hope it's in there
+            logging.warning("fetching commit %s from %s failed, fetching %s instead",
+                            self.__commit, self._url, self._branch)
+            returncode = self.__git(["fetch", self._url, self._branch], self._output_file_path)
+            if returncode != 0:
+                return returncode
+        return self.__git(["checkout", "--detach", self.__commit], self._output_file_path)
+
+    @property
+    def url(self):
+        return self._url
+
+    @property
+    def branch(self):
+        return self._branch
+
+    @property
+    def output_path(self):
+        return self._output_file_path
+
+    @property
+    def submodule_name(self):
+        return self.__base_name
+
+    def prefetch(self):
+        """
+        clone into the work tree of the super repository without registering the submodule.
+        Safe to run concurrently with siblings
+        """
+        self.__mirror = mirror_cache.update(self._url)
+        args = [config['paths']['git'], "clone", "-q"]
+        if self.__mirror is not None:
+            args += ["--reference-if-able", self.__mirror]
+        if self.__depth:
+            args.append("--depth={}".format(self.__depth))
+        proc = Popen(args + [self.__clone_source(), self._output_file_path],
+                     env=config["__environment"],
+                     stdout=PIPE, stderr=PIPE)
+        stdout, stderr = proc.communicate()
+        if proc.returncode == 0 and self.__clone_source() != self._url:
+            proc = Popen([config['paths']['git'], "remote", "set-url", "origin", self._url],
+                         cwd=self._output_file_path,
+                         env=config["__environment"],
+                         stdout=PIPE, stderr=PIPE)
+            stdout, stderr = proc.communicate()
+        if proc.returncode != 0:
+            logging.error("failed to clone %s (returncode %s): %s", self._url, proc.returncode, stderr.strip())
+            if os.path.isdir(self._output_file_path):
+                shutil.rmtree(self._output_file_path)
+            return False
+        self.__fresh = True
+        return True
+
+    def __clone_source(self):
+        """
+        the mirror stands in for the remote when working offline, e.g. after importing a bundle
+        """
+        if config.get('offline', False) and self.__mirror is not None:
+            return self.__mirror
+        return self._url
+
+    def bundle_items(self):
+        mirror_path = mirror_cache.update(self._url)
+        if mirror_path is None:
+            return []
+        return [{"kind": "git_mirror",
+                 "source": mirror_path,
+                 "target": os.path.relpath(mirror_path, config['paths']['git_mirrors']).replace(os.sep, "/"),
+                 "url": self._url}]
+
+    def __is_shallow(self):
+        # .git is a file rather than a directory in submodules and worktrees, so ask git
+        return self.__git_output(["rev-parse", "--is-shallow-repository"], self._output_file_path) == "true"
+
+    def __use_mirror(self):
+        """
+        borrow objects from the mirror through alternates. Only done for repositories that don't have
+        their own alternates yet
+        """
+        alternates_path = os.path.join(self._output_file_path, ".git", "objects", "info", "alternates")
+        if self.__mirror is None or os.path.exists(alternates_path):
+            return
+        with open(alternates_path, "w") as f:
+            f.write(os.path.join(self.__mirror, "objects").replace("\\", "/") + "\n")
+
+    def __is_current(self):
+        """
+        compare the local HEAD against the remote branch head found by the batched ls-remote
+        """
+        remote_head = remote_heads.get(self)
+        return remote_head is not None and \
+            remote_head == self.__git_output(["rev-parse", "HEAD"], self._output_file_path)
+
+    def __update_due(self):
+        """
+        whether repo_update_frequency has passed since the last update. Local modifications don't count
+        """
+        try:
+            return not super(Clone, self).already_processed()
+        except (TypeError, KeyError):
+            return True
+
+    def needs_update_check(self):
+        if self.__commit is not None or not self.__update or self.__fresh:
+            return False
+        if not os.path.exists(os.path.join(self._output_file_path, ".git")):
+            return False
+        return self.__update_due()
+
     def process(self, progress):
-        proc = None
+        returncode = 0
+        self._changed = True
         if os.path.exists(os.path.join(self._output_file_path, ".git")):
-            if self.__update and not config.get('offline', False):
-                proc = Popen([config['paths']['git'], "pull"],
-                             cwd=self._output_file_path,
-                             env=config["__environment"])
+            if self.__commit is not None:
+                if self.__git_output(["rev-parse", "HEAD"], self._output_file_path) == self.__commit:
+                    self._changed = False
+                else:
+                    # pinned repositories are moved to a different pin in place rather than cloned again
+                    self.__mirror = mirror_cache.update(self._url)
+                    returncode = self.__checkout_commit()
+            elif not self.__update or config.get('offline', False):
+                self._changed = False
+            elif not self.__fresh and not self.__update_due():
+                # only here because the sources were modified locally, the fingerprint below tells
+                self._changed = False
+            elif not self.__fresh:
+                if self.__is_current():
+                    logging.info("%s is up to date", self._url)
+                    self._changed = False
+                else:
+                    if not self.__depth and self.__is_shallow():
+                        returncode = self.__git(["fetch", "--unshallow"], self._output_file_path)
+                    if returncode == 0:
+                        returncode = self.__git(["pull"], self._output_file_path)
         else:
+            self.__mirror = mirror_cache.update(self._url)
+            reference = ["--reference-if-able", self.__mirror] if self.__mirror is not None else []
             if self.__super_repository is not None:
-                proc = Popen([config['paths']['git'], "submodule", "add",
-                              "--force", "--name", self.__base_name,
-                              self._url, self.__base_name
-                              ],
-                             cwd=self.__super_repository.path,
-                             env=config['__environment'])
+                args = ["submodule", "add", "--force", "--name", self.__base_name]
+                if self.__mirror is not None:
+                    args += ["--reference", self.__mirror]
+                if self.__depth:
+                    args.append("--depth={}".format(self.__depth))
+                returncode = self.__git(args + [self._url, self.__base_name], self.__super_repository.path)
+                if returncode == 0 and self.__commit is not None:
+                    returncode = self.__checkout_commit()
+            elif self.__commit is not None:
+                os.makedirs(self._output_file_path)
+                returncode = self.__git(["init"], self._output_file_path)
+                if returncode == 0:
+                    self.__use_mirror()
+                    returncode = self.__git(["remote", "add", "origin", self._url], self._output_file_path)
+                if returncode == 0:
+                    returncode = self.__checkout_commit()
             else:
-                proc = Popen([config['paths']['git'], "clone", "-b", self._branch,
-                              self._url, self._context["build_path"]],
-                             env=config["__environment"])
+                returncode = self.__git(["clone", "-b", self._branch] + reference + self.__fetch_options() +
+                                        [self.__clone_source(), self._context["build_path"]])
+                if returncode == 0 and self.__clone_source() != self._url:
+                    returncode = self.__git(["remote", "set-url", "origin", self._url], self._output_file_path)
 
-        if proc is not None:
-            proc.communicate()
-            if proc.returncode != 0:
-                logging.error("failed to clone repository %s (returncode %s)", self._url, proc.returncode)
-                return False
+        if returncode != 0:
+            logging.error("failed to clone repository %s (returncode %s)", self._url, returncode)
+            return False
+
+        fingerprint = source_fingerprints.refresh(self._output_file_path)
+        if fingerprint is not None:
+            self._changed = fingerprint != self.__stored_fingerprint()
+            if not os.path.isdir(os.path.dirname(self.__fingerprint_path())):
+                os.makedirs(os.path.dirname(self.__fingerprint_path()))
+            with open(self.__fingerprint_path(), "w") as f:
+                f.write(fingerprint)
+            if os.path.isfile(self.__legacy_fingerprint_path()):
+                os.remove(self.__legacy_fingerprint_path())
 
         return True
 
+    def __fingerprint_path(self):
+        # kept out of the build directory, a file next to a submodule would show up in the super repository
+        name = os.path.relpath(self._output_file_path, config['paths']['build'])
+        return os.path.join(config['paths']['progress'], "fingerprints",
+                            "{}.fingerprint".format(re.sub(r"[^\w.-]+", "_", name)))
+
+    def __legacy_fingerprint_path(self):
+        # where earlier versions stored the fingerprint, inside the super repository for submodules
+        return "{}.fingerprint".format(self._output_file_path.rstrip("\\/"))
+
+    def __stored_fingerprint(self):
+        for file_path in [self.__fingerprint_path(), self.__legacy_fingerprint_path()]:
+            try:
+                with open(file_path, "r") as f:
+                    return f.read().strip()
+            except IOError:
+                pass
+        return None
+
+    def fingerprint(self):
+        """
+        fingerprint of the sources in the work tree, see source_fingerprint.git_fingerprint
+        """
+        return source_fingerprints.get(self._output_file_path)
+
+    def sources_modified(self):
+        stored = self.__stored_fingerprint()
+        return stored is not None and stored != self.fingerprint()
+
+    def already_processed(self):
+        # sources modified locally since the last run count as a change as well
+        return super(Clone, self).already_processed() and not self.sources_modified()
+
     @staticmethod
     def _expiration():
         return config.get('repo_update_frequency', 60 * 60 * 24)   # default: one day
@@ -122,3 +631,44 @@ class Clone(Repository):
         else:
             self._output_file_path = os.path.join(config["paths"]["build"], self.__base_name)
         return self
+
+
+class SubmoduleUpdate(Task):
+    """
+    initialise only the needed submodules of the repository in the build path, shallow and concurrently
+    """
+
+    def __init__(self, skip=None, skip_suffixes=None, depth=1, name="update submodules"):
+        """
+        :param skip: names or paths of submodules that aren't needed
+        :param skip_suffixes: submodules whose path ends in one of these aren't needed either
+        :param depth: history depth of the submodule checkouts, None for complete history
+        """
+        super(SubmoduleUpdate, self).__init__()
+        self.__skip = skip or []
+        self.__skip_suffixes = skip_suffixes or []
+        self.__depth = depth
+        self.__name = name
+
+    @property
+    def name(self):
+        if self._context is None:
+            return self.__name
+        return "{} {}".format(self._context.name, self.__name)
+
+    def process(self, progress):
+        repo_path = self._context['build_path']
+        try:
+            submodules = list_submodules(config['paths']['git'], repo_path, config['__environment'])
+        except IOError, e:
+            logging.error("%s", e)
+            return False
+
+        paths = select_submodules(submodules, self.__skip, self.__skip_suffixes)
+        logging.info("initialising %d of %d submodules: %s", len(paths), len(submodules), ", ".join(paths))
+        returncode = update_submodules(config['paths']['git'], repo_path, paths, self.__depth,
+                                       config.get('git_jobs', 8), config['__environment'])
+        if returncode != 0:
+            logging.error("failed to update submodules of %s (returncode %s)", repo_path, returncode)
+            return False
+        return True
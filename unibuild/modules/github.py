@@ -21,22 +21,25 @@ from git import Clone
 
 
 class Release(URLDownload):
-    def __init__(self, author, project, version, filename, extension="zip"):
+    def __init__(self, author, project, version, filename, extension="zip", include=None):
         super(Release, self) \
             .__init__("https://github.com/{author}/{project}/releases/download/{version}/"
                       "{filename}.{extension}".format(author=author,
                                                       project=project,
                                                       version=version,
                                                       filename=filename,
-                                                      extension=extension))
+                                                      extension=extension),
+                      include=include)
 
 
 class Source(Clone):
-    def __init__(self, author, project, tag, super_repository=None, update=True):
+    def __init__(self, author, project, tag, super_repository=None, update=True, depth=None, clone_filter=None,
+                 commit=None):
         super(Source, self).__init__("https://github.com/{author}/{project}.git".format(author=author,
                                                                                         project=project,
                                                                                         tag=tag),
-                                     "master", super_repository, update)
+                                     "master", super_repository, update,
+                                     depth=depth, clone_filter=clone_filter, commit=commit)
         #super(Source, self).__init__("https://github.com/{author}/{project}/archive/{tag}.zip".format(), 1)
         # don't use the tag as the file name, otherwise we get name collisions on "master" or other generic names
         #self.set_destination(project)
@@ -5,8 +5,11 @@ from urldownload import URLDownload
 
 
 class Release(URLDownload):
-    def __init__(self, project, filename, tree_depth=0):
+    def __init__(self, project, filename, tree_depth=0, mirrors=None):
+        """
+        :param mirrors: further urls serving the same file
+        """
         super(Release, self)\
             .__init__("http://{project}.googlecode.com/files/{filename}".format(project=project,
                                                                                 filename=filename)
-                      , tree_depth)
+                      , tree_depth, mirrors=mirrors)
@@ -17,12 +17,88 @@
 
 
 from unibuild.modules.repository import Repository
-from subprocess import Popen
+from subprocess import Popen, PIPE
+from urlparse import urlsplit
 from config import config
 import os
+import shutil
 import logging
 
 
+def _hg(args, cwd=None):
+    proc = Popen([config['paths']['hg'], "--config", "extensions.share="] + args,
+                 cwd=cwd,
+                 env=config["__environment"])
+    proc.communicate()
+    return proc.returncode
+
+
+def _hg_id(revision, cwd):
+    """
+    :return: changeset id of revision, None if it can't be determined
+    """
+    proc = Popen([config['paths']['hg'], "id", "-i", "-r", revision],
+                 cwd=cwd,
+                 env=config["__environment"],
+                 stdout=PIPE)
+    output = proc.communicate()[0].strip()
+    return output if proc.returncode == 0 and output else None
+
+
+class SharePool(object):
+    """
+    machine-wide pool of repository stores. Work copies are created with "hg share" so the history of a
+    repository is only transferred and stored once per machine
+    """
+
+    @staticmethod
+    def path(url):
+        parts = urlsplit(url)
+        return os.path.join(config['paths']['hg_share_pool'], parts.hostname or "local",
+                            *parts.path.strip("/").split("/"))
+
+    @staticmethod
+    def has_incoming(url, repository_path):
+        """
+        :return: True if url has changesets repository_path doesn't have yet, also if that can't be determined
+        """
+        # incoming returns 1 if there is nothing to pull
+        return _hg(["incoming", "-q", url], repository_path) != 1
+
+    def update(self, url):
+        """
+        make sure the pooled store of url exists and is current
+        :return: path of the store and whether it changed, None for the path on failure
+        """
+        store_path = SharePool.path(url)
+        if not os.path.isdir(os.path.join(store_path, ".hg")):
+            # stream clones transfer the store files as they are, the server falls back to a regular clone
+            # if it doesn't allow them
+            temp_path = "{}.tmp{}".format(store_path, os.getpid())
+            if os.path.isdir(temp_path):
+                shutil.rmtree(temp_path)
+            if not os.path.isdir(os.path.dirname(store_path)):
+                os.makedirs(os.path.dirname(store_path))
+            if _hg(["clone", "-U", "--stream", url, temp_path]) != 0:
+                return None, False
+            try:
+                os.rename(temp_path, store_path)
+            except OSError:
+                # created by another workspace in the meantime
+                shutil.rmtree(temp_path)
+            return store_path, True
+
+        if config.get('offline', False) or not SharePool.has_incoming(url, store_path):
+            return store_path, False
+        if _hg(["pull", url], store_path) != 0:
+            logging.warning("failed to update the pooled store of %s", url)
+            return store_path, False
+        return store_path, True
+
+
+share_pool = SharePool()
+
+
 class Clone(Repository):
     def __init__(self, url, branch="default"):
         super(Clone, self).__init__(url, branch)
@@ -30,22 +106,60 @@ class Clone(Repository):
     def prepare(self):
         self._context["build_path"] = self._output_file_path
 
-    def process(self, progress):
+    def __is_shared(self):
+        return os.path.isfile(os.path.join(self._output_file_path, ".hg", "sharedpath"))
+
+    def __process_shared(self):
+        store_path = share_pool.update(self._url)[0]
+        if store_path is None:
+            return None
+        if not os.path.isdir(self._output_file_path):
+            returncode = _hg(["share", "-U", store_path, self._output_file_path])
+            if returncode == 0:
+                returncode = _hg(["update", self._branch], self._output_file_path)
+            return returncode
+        # another work copy may have pulled into the shared store already, so whether this one is current
+        # has to be checked against the store rather than derived from whether the store changed
+        parent = _hg_id(".", self._output_file_path)
+        if parent is not None and parent == _hg_id(self._branch, self._output_file_path):
+            self._changed = False
+            return 0
+        # the history is already there through the shared store, only the work copy needs updating
+        return _hg(["update", self._branch], self._output_file_path)
+
+    def __process_standalone(self):
         if os.path.isdir(self._output_file_path):
-            proc = Popen([config['paths']['hg'], "pull", "-u"],
-                         cwd=self._output_file_path,
-                         env=config["__environment"])
+            if config.get('offline', False) or not SharePool.has_incoming(self._url, self._output_file_path):
+                self._changed = False
+                return 0
+            return _hg(["pull", "-u"], self._output_file_path)
         else:
-            proc = Popen([config['paths']['hg'], "clone", "-b", self._branch,
-                          self._url, self._context["build_path"]],
-                         env=config["__environment"])
-        proc.communicate()
-        if proc.returncode != 0:
-            logging.error("failed to clone repository %s (returncode %s)", self._url, proc.returncode)
+            return _hg(["clone", "--stream", "-b", self._branch, self._url, self._context["build_path"]])
+
+    def process(self, progress):
+        self._changed = True
+        returncode = None
+        if config.get('hg_share_pool', True) and (self.__is_shared() or not os.path.isdir(self._output_file_path)):
+            returncode = self.__process_shared()
+            if returncode is None:
+                logging.warning("pooled store for %s not available, cloning without it", self._url)
+        if returncode is None:
+            returncode = self.__process_standalone()
+        if returncode != 0:
+            logging.error("failed to clone repository %s (returncode %s)", self._url, returncode)
             return False
 
         return True
 
+    def bundle_items(self):
+        store_path, store_changed = share_pool.update(self._url)
+        if store_path is None:
+            return []
+        return [{"kind": "hg_store",
+                 "source": store_path,
+                 "target": os.path.relpath(store_path, config['paths']['hg_share_pool']).replace(os.sep, "/"),
+                 "url": self._url}]
+
     @staticmethod
     def _expiration():
         return config.get('repo_update_frequency', 60 * 60 * 24)   # default: one day
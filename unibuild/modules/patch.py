@@ -1,5 +1,6 @@
 from unibuild.task import Task
 from unibuild.utility.lazy import Lazy
+from unibuild.utility.tree_cache import break_link
 import os.path
 import shutil
 
@@ -23,6 +24,7 @@ class Replace(Task):
 
         data = data.replace(self.__search, self.__substitute)
 
+        break_link(full_path)
         with open(full_path, "w") as f:
             f.write(data)
         return True
@@ -55,6 +57,10 @@ class Copy(Task):
                 source = os.path.join(self._context["build_path"], source)
             if not os.path.exists(full_destination):
                 os.makedirs(full_destination)
+            if os.path.isdir(full_destination):
+                break_link(os.path.join(full_destination, os.path.basename(source)))
+            else:
+                break_link(full_destination)
             shutil.copy(source, full_destination)
         return True
 
@@ -74,6 +80,7 @@ class CreateFile(Task):
 
     def process(self, progress):
         full_path = os.path.join(self._context["build_path"], self.__filename)
+        break_link(full_path)
         with open(full_path, 'w') as f:
             # the call to str is necessary to ensure a lazy initialised content is evaluated now
             f.write(self.__content())
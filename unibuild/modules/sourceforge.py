@@ -2,11 +2,21 @@ __author__ = 'Tannin'
 
 
 from urldownload import URLDownload
+from config import config
 
 
 class Release(URLDownload):
-    def __init__(self, project, path, tree_depth=0):
+    def __init__(self, project, path, tree_depth=0, revalidate=False, mirrors=None):
+        """
+        :param mirrors: names of sourceforge mirrors ("netix", "kent", ...) to try besides the redirector,
+                        defaults to the sourceforge_mirrors setting
+        """
+        if mirrors is None:
+            mirrors = config.get('sourceforge_mirrors', [])
         super(Release, self)\
             .__init__("http://downloads.sourceforge.net/project/{project}/{path}".format(project=project,
                                                                                          path=path),
-                      tree_depth)
+                      tree_depth, revalidate=revalidate,
+                      mirrors=["https://{mirror}.dl.sourceforge.net/project/{project}/{path}"
+                               .format(mirror=mirror, project=project, path=path)
+                               for mirror in mirrors])
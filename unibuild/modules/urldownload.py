@@ -23,23 +23,44 @@ import sys
 import logging
 from urlparse import urlparse
 from buildtools import os_utils, utils
-import urllib2
 import tarfile
 import zipfile
 import subprocess
 import shutil
+import json
+import hashlib
+import tempfile
+import time
+import socket
+import httplib
 from unibuild.utility import ProgressFile
+from unibuild.utility.archive import file_hash, strip_members, match_members, cached_members,\
+    store_members
+from unibuild.utility.tree_cache import TreeCache, reflinks_supported
+from unibuild.utility.http_client import HTTPClient
+from unibuild.utility.mirrors import MirrorDownload, MirrorStats
 from unibuild.utility.context_objects import on_failure
 
 
 class URLDownload(Retrieval):
 
-    BLOCK_SIZE = 8192
+    INSTALLER_EXTENSIONS = [".exe", ".msi"]
 
-    def __init__(self, url, tree_depth=0):
+    def __init__(self, url, tree_depth=0, include=None, revalidate=False, mirrors=None):
+        """
+        :param include: optional list of fnmatch patterns. If set, only archive members whose full path
+                        matches one of them are extracted
+        :param revalidate: set for urls whose content changes over time ("latest" builds). The cached
+                           download is then checked with a conditional request once it expires
+        :param mirrors: further urls serving the same file. All of them get probed and the download uses
+                        the fastest, switching mirrors if a transfer stalls
+        """
         super(URLDownload, self).__init__()
         self.__url = url
         self.__tree_depth = tree_depth
+        self.__include = include
+        self.__revalidate = revalidate
+        self.__mirrors = mirrors or []
         self.__file_name = os.path.basename(urlparse(self.__url).path)
 
     @property
@@ -54,6 +75,23 @@ class URLDownload(Retrieval):
         self.__file_name = destination_name + ext
         return self
 
+    def bundle_items(self):
+        archive_file_path = os.path.join(config['paths']['download'], self.__file_name)
+        if not os.path.isfile(archive_file_path):
+            return []
+        # the member list and validators come along so the archive isn't listed or revalidated again
+        return [{"kind": "download", "source": file_path, "target": os.path.basename(file_path), "url": self.__url}
+                for file_path in [archive_file_path,
+                                  "{}.members".format(archive_file_path),
+                                  URLDownload.__validators_path(archive_file_path)]
+                if os.path.isfile(file_path)]
+
+    def _expiration(self):
+        if self.__revalidate:
+            return config.get('download_revalidate_frequency', 60 * 60 * 24)   # default: one day
+        else:
+            return None
+
     def prepare(self):
         name, ext = os.path.splitext(self.__file_name)
         if name.lower().endswith(".tar"):
@@ -68,55 +106,184 @@ class URLDownload(Retrieval):
         output_file_path = self._context['build_path']
         archive_file_path = os.path.join(config['paths']['download'], self.__file_name)
 
-        if os.path.isfile(output_file_path):
-            logging.info("File already extracted: {0}".format(archive_file_path))
+        downloaded = False
+        if os.path.isfile(archive_file_path):
+            logging.info("File already downloaded: {0}".format(archive_file_path))
+            if self.__needs_revalidation(archive_file_path):
+                downloaded = self.download(archive_file_path, progress,
+                                           URLDownload.__read_validators(archive_file_path))
+                progress.finish()
         else:
-            if os.path.isfile(archive_file_path):
-                logging.info("File already downloaded: {0}".format(archive_file_path))
-            else:
-                logging.info("File not yet downloaded: {0}".format(archive_file_path))
-                self.download(archive_file_path, progress)
+            logging.info("File not yet downloaded: {0}".format(archive_file_path))
+            downloaded = self.download(archive_file_path, progress)
             progress.finish()
 
-        if not self.extract(archive_file_path, output_file_path, progress):
-            return False
-        progress.finish()
+        manifest_path = URLDownload.__manifest_path(output_file_path)
+        if downloaded and os.path.isfile(manifest_path):
+            # the tree was extracted from the previous content, "fast" verification wouldn't notice
+            os.remove(manifest_path)
+
+        self._changed = not self.__is_extracted(archive_file_path, output_file_path)
+        if not self._changed:
+            logging.info("File already extracted: {0}".format(archive_file_path))
+        else:
+            if not self.extract(archive_file_path, output_file_path, progress):
+                return False
+            progress.finish()
 
         builddir = os.listdir(self._context["build_path"])
         if len(builddir) == 1:
             self._context["build_path"] = os.path.join(self._context["build_path"], builddir[0])
         return True
 
-    def download(self, output_file_path, progress):
+    @staticmethod
+    def __manifest_path(output_file_path):
+        return "{}.manifest".format(output_file_path.rstrip("\\/"))
+
+    def __is_extracted(self, archive_file_path, output_file_path):
+        """
+        check the extraction manifest written by a previous run. In "full" verify mode the archive hash
+        has to match, in "fast" mode only the recorded member list is compared against the tree
+        """
+        manifest_path = URLDownload.__manifest_path(output_file_path)
+        if not os.path.isdir(output_file_path) or not os.path.isfile(manifest_path):
+            return False
+
+        try:
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+        except ValueError:
+            logging.warning("ignoring unreadable extraction manifest %s", manifest_path)
+            return False
+
+        if manifest.get("tree_depth") != self.__tree_depth or manifest.get("include") != self.__include:
+            return False
+
+        members = manifest.get("members", [])
+
+        if config.get('extract_verify', "full") != "fast":
+            if manifest.get("archive_hash") != file_hash(archive_file_path):
+                logging.info("archive changed since it was extracted: {0}".format(archive_file_path))
+                return False
+
+        for member in members:
+            if not os.path.lexists(os.path.join(output_file_path, *member.split("/"))):
+                logging.info("extracted tree incomplete, missing {0}".format(member))
+                return False
+        return True
+
+    def __write_manifest(self, archive_hash, output_file_path, members):
+        with open(URLDownload.__manifest_path(output_file_path), "w") as f:
+            json.dump({
+                "archive": self.__file_name,
+                "archive_hash": archive_hash,
+                "tree_depth": self.__tree_depth,
+                "include": self.__include,
+                "member_count": len(members),
+                "members": members
+            }, f, indent=1)
+
+    @staticmethod
+    def __validators_path(archive_file_path):
+        return "{}.validators".format(archive_file_path)
+
+    @staticmethod
+    def __read_validators(archive_file_path):
+        try:
+            with open(URLDownload.__validators_path(archive_file_path), "r") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    @staticmethod
+    def __write_validators(archive_file_path, validators):
+        with open(URLDownload.__validators_path(archive_file_path), "w") as f:
+            json.dump(validators, f, indent=1)
+
+    def __needs_revalidation(self, archive_file_path):
+        if not self.__revalidate or config.get('offline', False):
+            return False
+        validators = URLDownload.__read_validators(archive_file_path)
+        return validators.get("checked", 0) + self._expiration() <= time.time()
+
+    def download(self, output_file_path, progress, validators=None):
+        """
+        download the url to output_file_path. If validators from an earlier download are passed, the
+        request is conditional and a "304 Not Modified" response leaves the file alone
+        :return: True if the file was (re-)downloaded, False if it was still current
+        """
         logging.info("Downloading {} to {}".format(self.__url, output_file_path))
         progress.job = "Downloading"
-        data = urllib2.urlopen(self.__url)
-        with open(output_file_path, 'wb') as outfile:
-            meta = data.info()
-            length_str = meta.getheaders("Content-Length")
-            if length_str:
-                progress.maximum = int(length_str[0])
-            else:
-                progress.maximum = sys.maxint
+        headers = {}
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
 
-            bytes_read = 0
-            while True:
-                block = data.read(URLDownload.BLOCK_SIZE)
-                if not block:
-                    break
-                bytes_read += len(block)
-                outfile.write(block)
-                progress.value = bytes_read
+        def progress_func(bytes_read, length):
+            progress.maximum = length or sys.maxint
+            progress.value = bytes_read
 
-    def extract(self, archive_file_path, output_file_path, progress):
-        def progress_func(pos, size):
-            progress.value = int(pos * 100 / size)
+        if self.__mirrors and not headers:
+            stats = MirrorStats(os.path.join(config['paths']['download'], "mirrors.json"))
+            mirror_download = MirrorDownload([self.__url] + self.__mirrors, URLDownload.http_client(), stats,
+                                             min_throughput=config.get('mirror_min_throughput', 32 * 1024))
+            try:
+                url = mirror_download.download(output_file_path, progress_func)
+            finally:
+                stats.save()
+            URLDownload.__write_validators(output_file_path, dict(mirror_download.validators,
+                                                                  url=url, checked=time.time()))
+            return True
 
+        # validators are only meaningful to the server that sent them, which may have been a mirror
+        url = validators.get("url", self.__url) if headers else self.__url
+        try:
+            meta = URLDownload.http_client().download(url, output_file_path, headers, progress_func)
+        except (IOError, socket.error, httplib.HTTPException), e:
+            if url == self.__url:
+                raise
+            logging.warning("can't revalidate {} with mirror {} ({}), keeping the current file".format(
+                self.__file_name, url, e))
+            return False
+        if meta is None:
+            logging.info("{} not modified since last download".format(self.__url))
+            validators["checked"] = time.time()
+            URLDownload.__write_validators(output_file_path, validators)
+            return False
+
+        URLDownload.__write_validators(output_file_path, {
+            "url": url,
+            "etag": meta.getheader("ETag"),
+            "last_modified": meta.getheader("Last-Modified"),
+            "checked": time.time()
+        })
+        return True
+
+    @staticmethod
+    def http_client():
+        return HTTPClient().configure(max_per_host=config.get('download_connections_per_host', 4),
+                                      retries=config.get('download_retries', 4))
+
+    def extract(self, archive_file_path, output_file_path, progress):
         logging.info("Extracting {0}".format(self.__url))
 
         progress.value = 0
         progress.job = "Extracting"
+        filename, extension = os.path.splitext(self.__file_name)
+        if extension in URLDownload.INSTALLER_EXTENSIONS:
+            # installers need to be handled by the caller, which may install into the output directory.
+            # The manifest without members keeps the download from counting as changed on every run
+            if not os.path.isdir(output_file_path):
+                os.makedirs(output_file_path)
+            self.__write_manifest(file_hash(archive_file_path), output_file_path, [])
+            return True
+
         #output_file_path = u"\\\\?\\" + os.path.abspath(output_file_path)
+        manifest_path = URLDownload.__manifest_path(output_file_path)
+        if os.path.isfile(manifest_path):
+            os.remove(manifest_path)
         if os.path.isdir(output_file_path):
             shutil.rmtree(output_file_path,False)
         try:
@@ -125,44 +292,130 @@ class URLDownload(Retrieval):
             # doesn't matter if the directory already exists.
             pass
 
+        archive_hash = file_hash(archive_file_path)
         with on_failure(lambda: shutil.rmtree(output_file_path)):
-            filename, extension = os.path.splitext(self.__file_name)
-            if extension == ".gz" or extension == ".tgz":
-                archive_file = ProgressFile(archive_file_path, progress_func)
-                with tarfile.open(fileobj=archive_file, mode='r:gz') as arch:
-                    arch.extractall(output_file_path)
-                archive_file.close()
-            elif extension == ".bz2":
-                archive_file = ProgressFile(archive_file_path, progress_func)
-                with tarfile.open(fileobj=archive_file, mode='r:bz2') as arch:
-                    arch.extractall(output_file_path)
-                archive_file.close()
-            elif extension == ".zip":
-                archive_file = ProgressFile(archive_file_path, progress_func)
-                with zipfile.ZipFile(archive_file) as arch:
-                    arch.extractall(output_file_path)
-                archive_file.close()
-            elif extension == ".7z":
-                os_utils.ensureDirExists(output_file_path)
-                proc = subprocess.Popen([config['paths']['7z'], "x", '-aoa', os_utils.cygpath(os.path.abspath(archive_file_path)), "-o{}".format(os_utils.cygpath(os.path.abspath(output_file_path)))])
-                if proc.wait() != 0:
-                    return False
-            elif extension in [".exe", ".msi"]:
-                # installers need to be handled by the caller
-                return True
+            if self.__use_tree_cache(output_file_path):
+                members = self.__extract_cached(archive_file_path, archive_hash, output_file_path, progress)
             else:
-                logging.error("unsupported file extension {0}".format(extension))
+                members = self.__unpack(archive_file_path, output_file_path, progress)
+            if members is None:
                 return False
 
-            for i in range(self.__tree_depth):
-                sub_dirs = os.listdir(output_file_path)
-                if len(sub_dirs) != 1:
-                    raise ValueError("unexpected archive structure,"
-                                    " expected exactly one directory in {}".format(output_file_path))
-                source_dir = os.path.join(output_file_path, sub_dirs[0])
+            self.__write_manifest(archive_hash, output_file_path, members)
+        return True
 
-                for src in os.listdir(source_dir):
-                    shutil.move(os.path.join(source_dir, src), output_file_path)
+    @staticmethod
+    def __use_tree_cache(output_file_path):
+        """
+        the tree cache is only worth it by default if the trees can be reflinked out of it, otherwise every
+        tree would be stored in the cache and fully copied into the build directory
+        """
+        use_cache = config.get('tree_cache')
+        if use_cache is None:
+            use_cache = reflinks_supported(config['paths']['tree_cache'], os.path.dirname(output_file_path))
+        return use_cache
 
-                shutil.rmtree(source_dir)
-        return True
+    def __extract_cached(self, archive_file_path, archive_hash, output_file_path, progress):
+        """
+        populate the output directory from the unpacked tree cache, unpacking into the cache first if
+        this archive wasn't seen before
+        """
+        cache = TreeCache(config['paths']['tree_cache'])
+        key = "{}-{}".format(archive_hash, self.__tree_depth)
+        if self.__include:
+            key += "-{}".format(hashlib.sha1(json.dumps(self.__include)).hexdigest()[:12])
+        allow_hardlinks = config.get('tree_cache_hardlinks', False)
+
+        entry = cache.lookup(key)
+        if entry is not None:
+            try:
+                cloner = cache.checkout(key, entry, output_file_path, allow_hardlinks)
+                logging.info("populated {} from tree cache ({})".format(
+                    output_file_path, ", ".join("{} {}".format(count, method)
+                                                for method, count in cloner.counts.items())))
+                return entry["members"]
+            except (IOError, OSError), e:
+                logging.warning("discarding tree cache entry for {}: {}".format(self.__file_name, e))
+                cache.discard(key)
+                shutil.rmtree(output_file_path)
+                os.makedirs(output_file_path)
+
+        entry = cache.add(key, lambda path: self.__unpack(archive_file_path, path, progress))
+        if entry is None:
+            return None
+        cache.checkout(key, entry, output_file_path, allow_hardlinks)
+        return entry["members"]
+
+    def __unpack(self, archive_file_path, output_file_path, progress):
+        """
+        unpack the archive into an existing, empty directory and strip tree_depth levels
+        :return: list of members relative to output_file_path or None on failure
+        """
+        def progress_func(pos, size):
+            progress.value = int(pos * 100 / size)
+
+        filename, extension = os.path.splitext(self.__file_name)
+        selected = None
+        if self.__include:
+            selected = match_members(cached_members(archive_file_path, extension, config['paths']['7z']),
+                                     self.__include)
+            if not selected:
+                logging.error("no member of {} matches {}".format(self.__file_name, self.__include))
+                return None
+            logging.info("extracting {} of the members of {}".format(len(selected), self.__file_name))
+
+        if extension == ".gz" or extension == ".tgz" or extension == ".bz2":
+            archive_file = ProgressFile(archive_file_path, progress_func)
+            with tarfile.open(fileobj=archive_file, mode='r:gz' if extension != ".bz2" else 'r:bz2') as arch:
+                if selected is None:
+                    arch.extractall(output_file_path)
+                    members = arch.getnames()
+                    store_members(archive_file_path, members)
+                else:
+                    selected_set = set(selected)
+                    arch.extractall(output_file_path, members=[member for member in arch.getmembers()
+                                                               if member.name in selected_set])
+                    members = selected
+            archive_file.close()
+        elif extension == ".zip":
+            archive_file = ProgressFile(archive_file_path, progress_func)
+            with zipfile.ZipFile(archive_file) as arch:
+                arch.extractall(output_file_path, members=selected)
+                members = selected if selected is not None else arch.namelist()
+            archive_file.close()
+        elif extension == ".7z":
+            os_utils.ensureDirExists(output_file_path)
+            cmdline = [config['paths']['7z'], "x", '-aoa', os_utils.cygpath(os.path.abspath(archive_file_path)),
+                       "-o{}".format(os_utils.cygpath(os.path.abspath(output_file_path)))]
+            list_file_path = None
+            if selected is not None:
+                list_fd, list_file_path = tempfile.mkstemp(suffix=".txt")
+                with os.fdopen(list_fd, "w") as list_file:
+                    list_file.write("\n".join(selected))
+                cmdline.append("@{}".format(list_file_path))
+            try:
+                proc = subprocess.Popen(cmdline)
+                if proc.wait() != 0:
+                    return None
+            finally:
+                if list_file_path is not None:
+                    os.remove(list_file_path)
+            members = selected if selected is not None else cached_members(archive_file_path, extension,
+                                                                           config['paths']['7z'])
+        else:
+            logging.error("unsupported file extension {0}".format(extension))
+            return None
+
+        for i in range(self.__tree_depth):
+            sub_dirs = os.listdir(output_file_path)
+            if len(sub_dirs) != 1:
+                raise ValueError("unexpected archive structure,"
+                                " expected exactly one directory in {}".format(output_file_path))
+            source_dir = os.path.join(output_file_path, sub_dirs[0])
+
+            for src in os.listdir(source_dir):
+                shutil.move(os.path.join(source_dir, src), output_file_path)
+
+            shutil.rmtree(source_dir)
+
+        return strip_members(members, self.__tree_depth)
@@ -18,6 +18,7 @@
 
 from unibuild import Project
 from unibuild.modules import cmake, github, build
+from unibuild.builder import install_prefix
 from config import config
 import os
 import shutil
@@ -28,9 +29,11 @@ googletest_version = "1.7.0"
 
 
 def install(context):
-    for root, dirnames, filenames in os.walk(os.path.join(context['build_path'], "build")):
-        for filename in fnmatch.filter(filenames, "*.lib"):
-            shutil.copy(os.path.join(root, filename), os.path.join(config['__build_base_path'], "install", "libs"))
+    with install_prefix().staging("GTest") as staging:
+        os.makedirs(os.path.join(staging.path, "libs"))
+        for root, dirnames, filenames in os.walk(os.path.join(context['build_path'], "build")):
+            for filename in fnmatch.filter(filenames, "*.lib"):
+                shutil.copy(os.path.join(root, filename), os.path.join(staging.path, "libs"))
 
     return True
 
@@ -18,6 +18,7 @@
 
 from unibuild.project import Project
 from unibuild.modules import urldownload, msbuild, build
+from unibuild.builder import install_prefix
 from config import config
 import os
 import shutil
@@ -73,8 +74,10 @@ else:
         if config['architecture'] == "x86_64":
             path_segments.append("amd64")
         path_segments.append("*.lib")
-        for f in glob(os.path.join(*path_segments)):
-            shutil.copy(f, os.path.join(config["__build_base_path"], "install", "libs"))
+        with install_prefix().staging("Python") as staging:
+            os.makedirs(os.path.join(staging.path, "libs"))
+            for f in glob(os.path.join(*path_segments)):
+                shutil.copy(f, os.path.join(staging.path, "libs"))
         return True
 
     python = Project("Python") \
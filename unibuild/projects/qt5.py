@@ -20,7 +20,6 @@ from unibuild import Project, Task
 from unibuild.modules import build, patch, git, urldownload, sourceforge, dummy
 from config import config
 import os
-import multiprocessing
 import itertools
 
 
@@ -64,8 +63,6 @@ else:
 
     nomake_list = ["tests", "examples"]
 
-    num_jobs = multiprocessing.cpu_count() * 2
-
     configure_cmd = ['cmd','/c',"configure.bat",
                                       "-platform", platform,
                                       "-debug-and-release", "-force-debug-info",
@@ -81,7 +78,7 @@ else:
                                      + list(itertools.chain(*[("-nomake", n) for n in nomake_list]))
 
     jom = Project("jom") \
-        .depend(urldownload.URLDownload("http://download.qt.io/official_releases/jom/jom.zip"))
+        .depend(urldownload.URLDownload("http://download.qt.io/official_releases/jom/jom.zip", revalidate=True))
 
     grep = Project('grep') \
         .depend(sourceforge.Release("gnuwin32", "grep/{0}/grep-{0}-bin.zip".format(grep_version))
@@ -90,7 +87,7 @@ else:
                 .set_destination("grep"))
 
     flex = Project('flex') \
-        .depend(sourceforge.Release("winflexbison", "win_flex_bison-latest.zip"))
+        .depend(sourceforge.Release("winflexbison", "win_flex_bison-latest.zip", revalidate=True))
 
     def webkit_env():
         result = config['__environment'].copy()
@@ -119,15 +116,16 @@ else:
     # comment to build webkit
     #build_webkit = dummy.Success("webkit")
 
-    init_repo = build.Run([config.get('paths.perl'),'init-repository'], name="init qt repository") \
-        .set_fail_behaviour(Task.FailBehaviour.CONTINUE) \
+    # only the modules configure doesn't skip are fetched. Examples are only needed if they're built
+    init_repo = git.SubmoduleUpdate(skip=skip_list,
+                                    skip_suffixes=["-examples"] if "examples" in nomake_list else [],
+                                    depth=1, name="init qt repository") \
         .depend(git.Clone("git://code.qt.io/qt/qt5.git", qt_version))
 
     qt5 = Project("Qt5") \
-        .depend(build.Install()
+        .depend(build.Install(prefix=qt_inst_path)
                 .depend(build_webkit
-                        .depend(build.Make(lambda: os.path.join(jom["build_path"],
-                                                                "jom.exe -j {}".format(num_jobs)))
+                        .depend(build.Make(lambda: [os.path.join(jom["build_path"], "jom.exe")])
                                 .depend(jom)
                                 .depend(build.Run(configure_cmd, name="configure qt")
                                         .depend(patch.Replace("qtbase/configure.bat",
@@ -18,6 +18,7 @@
 
 from unibuild import Project
 from unibuild.modules import build, sourceforge
+from unibuild.builder import install_prefix
 from config import config
 from glob import glob
 import shutil
@@ -29,8 +30,10 @@ udis_version_minor = "2"
 
 
 def install(context):
-    for f in glob(os.path.join(context['build_path'], "*.lib")):
-        shutil.copy(f, os.path.join(config["__build_base_path"], "install", "libs"))
+    with install_prefix().staging("Udis86") as staging:
+        os.makedirs(os.path.join(staging.path, "libs"))
+        for f in glob(os.path.join(context['build_path'], "*.lib")):
+            shutil.copy(f, os.path.join(staging.path, "libs"))
     return True
 
 
@@ -25,5 +25,11 @@ class Retrieval(Task):
     def name(self):
         return
 
+    def bundle_items(self):
+        """
+        cached sources of this retrieval for an offline bundle, see utility.bundle.export_bundle
+        """
+        return []
+
     def process(self, progress):
         return
@@ -35,6 +35,7 @@ class Task(object):
     def __init__(self):
         self.__dependencies = []
         self._context = None
+        self._changed = True
         self.__fail_behaviour = Task.FailBehaviour.FAIL
 
     @property
@@ -57,6 +58,14 @@ class Task(object):
     def enabled(self, value):
         pass
 
+    @property
+    def changed(self):
+        """
+        whether the last call to process changed anything. Tasks that depend on a task that changed
+        are processed again even if they succeeded before
+        """
+        return self._changed
+
     @property
     def fail_behaviour(self):
         return self.__fail_behaviour
@@ -85,6 +94,12 @@ class Task(object):
         else:
             return True
 
+    def sources_modified(self):
+        """
+        whether the sources this task provides were modified locally since it last ran
+        """
+        return False
+
     def mark_success(self):
         with open(self.__success_path(), "w"):
             pass
@@ -0,0 +1,137 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import tarfile
+import zipfile
+
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(file_path):
+    """
+    sha256 of a file, read in blocks so large archives don't end up in memory
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def split_member(name):
+    return [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+
+
+def strip_members(names, tree_depth):
+    """
+    turn archive member names into paths relative to the extraction directory after the
+    top tree_depth directory levels have been removed
+    """
+    result = set()
+    for name in names:
+        parts = split_member(name)
+        if len(parts) > tree_depth:
+            result.add("/".join(parts[tree_depth:]))
+    return sorted(result)
+
+
+def list_7z_members(seven_zip, archive_file_path):
+    """
+    list members of an archive through the 7z command line tool
+    """
+    proc = subprocess.Popen([seven_zip, "l", "-slt", archive_file_path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    if proc.returncode != 0:
+        raise IOError("failed to list {} (returncode {}): {}".format(archive_file_path, proc.returncode, stderr))
+
+    members = []
+    in_listing = False
+    for line in stdout.splitlines():
+        line = line.strip()
+        if line.startswith("----------"):
+            # everything before the separator describes the archive itself
+            in_listing = True
+        elif in_listing and line.startswith("Path = "):
+            members.append(line[len("Path = "):])
+    return members
+
+
+def match_members(names, patterns):
+    """
+    select the members matching any of the fnmatch patterns. Patterns are matched against the full
+    member path inside the archive with forward slashes, "*" also matches across directories
+    """
+    return [name for name in names
+            if any(fnmatch.fnmatch("/".join(split_member(name)), pattern) for pattern in patterns)]
+
+
+def list_members(archive_file_path, extension, seven_zip=None):
+    if extension in [".gz", ".tgz", ".bz2"]:
+        with tarfile.open(archive_file_path, mode="r:*") as arch:
+            return arch.getnames()
+    elif extension == ".zip":
+        with zipfile.ZipFile(archive_file_path) as arch:
+            return arch.namelist()
+    elif extension == ".7z":
+        return list_7z_members(seven_zip, archive_file_path)
+    else:
+        raise ValueError("unsupported file extension {0}".format(extension))
+
+
+def _member_cache_path(archive_file_path):
+    return "{}.members".format(archive_file_path)
+
+
+def _archive_signature(archive_file_path):
+    stat = os.stat(archive_file_path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def store_members(archive_file_path, names):
+    with open(_member_cache_path(archive_file_path), "w") as f:
+        json.dump({"signature": _archive_signature(archive_file_path), "members": names}, f)
+
+
+def cached_members(archive_file_path, extension, seven_zip=None):
+    """
+    list of archive members, read from the member cache next to the archive if it is still current
+    and from the archive itself (updating the cache) otherwise
+    """
+    cache_path = _member_cache_path(archive_file_path)
+    if os.path.isfile(cache_path):
+        try:
+            with open(cache_path, "r") as f:
+                data = json.load(f)
+            if data.get("signature") == _archive_signature(archive_file_path):
+                return data["members"]
+        except ValueError:
+            pass
+
+    names = list_members(archive_file_path, extension, seven_zip)
+    store_members(archive_file_path, names)
+    return names
@@ -0,0 +1,224 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import json
+import logging
+import os
+import Queue
+from StringIO import StringIO
+import shutil
+import tarfile
+import threading
+import time
+
+
+MANIFEST_NAME = "manifest.json"
+BUNDLE_VERSION = 1
+BLOCK_SIZE = 1024 * 1024
+
+
+class BundleError(Exception):
+    pass
+
+
+class _Section(object):
+    """
+    read-only view of size bytes of a file starting at the current position, hashing what's read
+    """
+
+    def __init__(self, fileobj, size):
+        self.__file = fileobj
+        self.__remaining = size
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.__remaining:
+            size = self.__remaining
+        data = self.__file.read(size)
+        self.__remaining -= len(data)
+        self.digest.update(data)
+        return data
+
+    def drain(self):
+        while self.read(BLOCK_SIZE):
+            pass
+
+
+def _run_parallel(function, arguments, jobs):
+    """
+    call function for each element of arguments on up to jobs threads
+    :return: list of the exceptions raised
+    """
+    queue = list(arguments)
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not queue or errors:
+                    return
+                argument = queue.pop(0)
+            try:
+                function(argument)
+            except Exception, e:
+                with lock:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(jobs, len(queue))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def export_bundle(bundle_path, items, jobs=4, compresslevel=1):
+    """
+    pack files and directories into one bundle. Every item is compressed on its own, concurrently, and
+    appended to the bundle as soon as it's done, followed by a manifest describing all items.
+    :param items: list of dictionaries with "kind", "source" (file or directory to pack) and "target"
+                  (slash separated path relative to the root of that kind on import). Other keys are
+                  stored in the manifest as they are
+    :return: the manifest
+    """
+    finished = Queue.Queue()
+    temp_prefix = "{}.tmp{}".format(bundle_path, os.getpid())
+
+    def compress(index):
+        item = items[index]
+        temp_path = "{}-{}".format(temp_prefix, index)
+        try:
+            with tarfile.open(temp_path, "w:gz", compresslevel=compresslevel) as archive:
+                archive.add(item["source"], arcname=item["target"].split("/")[-1])
+        except:
+            if os.path.isfile(temp_path):
+                os.remove(temp_path)
+            raise
+        finished.put((index, temp_path))
+
+    manifest_items = []
+    start = time.time()
+    with tarfile.open(bundle_path, "w") as bundle:
+        workers = threading.Thread(target=lambda: finished.put(_run_parallel(compress, range(len(items)), jobs)))
+        workers.start()
+        while True:
+            result = finished.get()
+            if isinstance(result, list):
+                # all workers are done, this is the list of errors
+                if result:
+                    raise BundleError("failed to pack bundle: {}".format(result[0]))
+                break
+            index, temp_path = result
+            item = items[index]
+            member = "items/{}.tar.gz".format(index)
+            info = tarfile.TarInfo(member)
+            info.size = os.path.getsize(temp_path)
+            info.mtime = int(time.time())
+            with open(temp_path, "rb") as f:
+                section = _Section(f, info.size)
+                bundle.addfile(info, section)
+            os.remove(temp_path)
+
+            entry = dict((key, value) for key, value in item.items() if key != "source")
+            entry.update({"member": member, "size": info.size, "sha256": section.digest.hexdigest()})
+            manifest_items.append(entry)
+            logging.info("packed %s (%d/%d, %.1f MB)", item["target"], len(manifest_items), len(items),
+                         info.size / (1024.0 * 1024.0))
+
+        manifest = {"version": BUNDLE_VERSION, "created": time.time(), "items": manifest_items}
+        data = json.dumps(manifest, indent=1)
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        bundle.addfile(info, StringIO(data))
+
+    logging.info("bundle %s written in %.1fs", bundle_path, time.time() - start)
+    return manifest
+
+
+def read_manifest(bundle_path):
+    """
+    :return: the manifest and a dictionary of member name -> (data offset, size)
+    """
+    with tarfile.open(bundle_path, "r:") as bundle:
+        members = dict((member.name, (member.offset_data, member.size)) for member in bundle.getmembers())
+        if MANIFEST_NAME not in members:
+            raise BundleError("{} has no manifest".format(bundle_path))
+        manifest = json.load(bundle.extractfile(MANIFEST_NAME))
+    if manifest.get("version") != BUNDLE_VERSION:
+        raise BundleError("unsupported bundle version {}".format(manifest.get("version")))
+    return manifest, members
+
+
+def _safe_members(archive, destination):
+    for member in archive:
+        path = os.path.normpath(os.path.join(destination, member.name))
+        if not path.startswith(os.path.normpath(destination) + os.sep) or member.issym() or member.islnk():
+            raise BundleError("refusing to extract {}".format(member.name))
+        yield member
+
+
+def import_bundle(bundle_path, roots, jobs=4):
+    """
+    unpack a bundle created by export_bundle. Items are decompressed concurrently, each straight from its
+    position in the bundle, and only moved into place once complete and verified. Items whose target
+    exists already are left alone.
+    :param roots: dictionary of item kind -> directory the targets of that kind are relative to
+    :return: the manifest and the list of items that were unpacked
+    """
+    manifest, members = read_manifest(bundle_path)
+    imported = []
+    lock = threading.Lock()
+
+    def unpack(item):
+        if item["kind"] not in roots:
+            logging.warning("skipping %s, unknown kind %s", item["target"], item["kind"])
+            return
+        target_path = os.path.join(roots[item["kind"]], *item["target"].split("/"))
+        if os.path.exists(target_path):
+            logging.info("%s already present", target_path)
+            return
+
+        staging_path = "{}.import{}".format(target_path, os.getpid())
+        if os.path.isdir(staging_path):
+            shutil.rmtree(staging_path)
+        os.makedirs(staging_path)
+        try:
+            offset, size = members[item["member"]]
+            with open(bundle_path, "rb") as f:
+                f.seek(offset)
+                section = _Section(f, size)
+                with tarfile.open(fileobj=section, mode="r|gz") as archive:
+                    archive.extractall(staging_path, members=_safe_members(archive, staging_path))
+                section.drain()
+            if section.digest.hexdigest() != item["sha256"]:
+                raise BundleError("checksum mismatch for {}".format(item["target"]))
+            os.rename(os.path.join(staging_path, item["target"].split("/")[-1]), target_path)
+        finally:
+            shutil.rmtree(staging_path)
+
+        with lock:
+            imported.append(item)
+            logging.info("unpacked %s (%d/%d)", item["target"], len(imported), len(manifest["items"]))
+
+    errors = _run_parallel(unpack, manifest["items"], jobs)
+    if errors:
+        raise BundleError("failed to unpack bundle: {}".format(errors[0]))
+    return manifest, imported
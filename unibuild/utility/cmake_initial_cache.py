@@ -0,0 +1,145 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+from cmake_stamp import ENVIRONMENT_KEYS, tool_signature
+
+
+# resolved tools worth sharing between projects using the same toolchain
+TOOL_ENTRIES = ["CMAKE_C_COMPILER", "CMAKE_CXX_COMPILER", "CMAKE_LINKER", "CMAKE_AR", "CMAKE_RC_COMPILER",
+                "CMAKE_MT", "CMAKE_NM", "CMAKE_RANLIB", "CMAKE_OBJDUMP", "CMAKE_MAKE_PROGRAM"]
+
+# everything the initial cache holds: the tools and that the compilers work
+SHARED_ENTRIES = set(TOOL_ENTRIES + ["CMAKE_C_COMPILER_WORKS", "CMAKE_CXX_COMPILER_WORKS"])
+
+CACHE_LINE = re.compile(r"^([^#/:][^:]*):([A-Z]+)=(.*)$")
+
+PROBE_PROJECT = "cmake_minimum_required(VERSION 2.8)\nproject(probe C CXX)\n"
+
+
+def read_cmake_cache(cache_path):
+    """
+    :return: dictionary of entry name -> (type, value)
+    """
+    result = {}
+    with open(cache_path, "r") as f:
+        for line in f:
+            match = CACHE_LINE.match(line.rstrip("\r\n"))
+            if match is not None:
+                result[match.group(1)] = (match.group(2), match.group(3))
+    return result
+
+
+def toolchain_fingerprint(generator_arguments, environment=None, tools=None):
+    environment = environment or {}
+    data = {
+        "generator": generator_arguments,
+        "environment": dict((key, environment.get(key)) for key in ENVIRONMENT_KEYS),
+        "tools": [tool_signature(tool) for tool in tools or []],
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True)).hexdigest()[:16]
+
+
+class InitialCache(object):
+    """
+    initial cache (cmake -C) shared by all projects configured with the same toolchain. It holds the tools
+    found by configuring an empty project and spares each project the test compile. Compiler identification
+    and the ABI probes aren't cached entries, cmake repeats them in every new build directory. Feature test
+    results (HAVE_*, COMPILER_SUPPORTS_*) are not shared, they depend on the flags and include paths of the
+    project that ran them
+    """
+
+    def __init__(self, root, fingerprint):
+        self.__root = root
+        self.__fingerprint = fingerprint
+
+    @property
+    def path(self):
+        return os.path.join(self.__root, "{}.cmake".format(self.__fingerprint))
+
+    def __data_path(self):
+        return os.path.join(self.__root, "{}.json".format(self.__fingerprint))
+
+    def __load(self):
+        try:
+            with open(self.__data_path(), "r") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def __save(self, entries):
+        temp_path = "{}.tmp{}".format(self.__data_path(), os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        script_temp_path = "{}.tmp{}".format(self.path, os.getpid())
+        with open(script_temp_path, "w") as f:
+            for name in sorted(entries):
+                entry_type, value = entries[name]
+                f.write("set({} \"{}\" CACHE {} \"\")\n".format(name, value.replace("\\", "/").replace('"', '\\"'),
+                                                             entry_type))
+        for source, destination in [(temp_path, self.__data_path()), (script_temp_path, self.path)]:
+            if os.path.exists(destination):
+                os.remove(destination)
+            os.rename(source, destination)
+
+    def exists(self):
+        """
+        True if the cache was generated. Caches that also hold feature test results of other projects, as
+        earlier versions collected them, don't count
+        """
+        entries = self.__load()
+        return os.path.isfile(self.path) and entries is not None \
+            and set(entries).issubset(SHARED_ENTRIES)
+
+    def generate(self, cmake, generator_arguments, environment=None):
+        """
+        configure an empty C/C++ project with the toolchain and keep the tools it resolved
+        :return: True on success
+        """
+        if not os.path.isdir(self.__root):
+            os.makedirs(self.__root)
+        probe_path = os.path.join(self.__root, "{}.probe{}".format(self.__fingerprint, os.getpid()))
+        if os.path.isdir(probe_path):
+            shutil.rmtree(probe_path)
+        os.makedirs(probe_path)
+        try:
+            with open(os.path.join(probe_path, "CMakeLists.txt"), "w") as f:
+                f.write(PROBE_PROJECT)
+            proc = subprocess.Popen([cmake] + generator_arguments + ["."], cwd=probe_path, env=environment,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = proc.communicate()
+            if proc.returncode != 0:
+                logging.warning("failed to probe the toolchain for the initial cmake cache: %s", stderr.strip())
+                return False
+            cache = read_cmake_cache(os.path.join(probe_path, "CMakeCache.txt"))
+        finally:
+            shutil.rmtree(probe_path, ignore_errors=True)
+
+        entries = dict((name, cache[name]) for name in TOOL_ENTRIES if name in cache and cache[name][1])
+        # the compilers were just shown to work, spare every project the test compile
+        for language in ["C", "CXX"]:
+            entries["CMAKE_{}_COMPILER_WORKS".format(language)] = ("INTERNAL", "1")
+        self.__save(entries)
+        logging.info("initial cmake cache %s created", self.path)
+        return True
@@ -0,0 +1,89 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+
+
+HEADER = """# generated by unibuild, included after every project() call through CMAKE_PROJECT_INCLUDE
+if(NOT CMAKE_CURRENT_SOURCE_DIR STREQUAL CMAKE_SOURCE_DIR OR CMAKE_VERSION VERSION_LESS 3.19)
+  return()
+endif()
+get_property(_unibuild_included GLOBAL PROPERTY UNIBUILD_PROJECT_INCLUDE SET)
+if(_unibuild_included)
+  return()
+endif()
+set_property(GLOBAL PROPERTY UNIBUILD_PROJECT_INCLUDE ON)
+"""
+
+UNITY_BUILD = """
+set(CMAKE_UNITY_BUILD ON)
+set(CMAKE_UNITY_BUILD_BATCH_SIZE {batch_size})
+"""
+
+PRECOMPILED_HEADERS = """
+# targets only exist once the whole project is read, so the headers are added at the end of the top directory
+function(_unibuild_precompile_headers directory)
+  get_property(targets DIRECTORY "${{directory}}" PROPERTY BUILDSYSTEM_TARGETS)
+  foreach(target IN LISTS targets)
+    get_target_property(type ${{target}} TYPE)
+    get_target_property(imported ${{target}} IMPORTED)
+    if(type MATCHES "^(EXECUTABLE|SHARED_LIBRARY|STATIC_LIBRARY|MODULE_LIBRARY)$" AND NOT imported)
+      target_precompile_headers(${{target}} PRIVATE {headers})
+    endif()
+  endforeach()
+  get_property(subdirectories DIRECTORY "${{directory}}" PROPERTY SUBDIRECTORIES)
+  foreach(subdirectory IN LISTS subdirectories)
+    _unibuild_precompile_headers("${{subdirectory}}")
+  endforeach()
+endfunction()
+cmake_language(DEFER DIRECTORY "${{CMAKE_SOURCE_DIR}}" CALL _unibuild_precompile_headers "${{CMAKE_SOURCE_DIR}}")
+"""
+
+
+def _cxx_only(header):
+    """
+    generator expression that adds header to C++ precompiled headers only, a mixed target gets a C one as well
+    """
+    return "\"$<$<COMPILE_LANGUAGE:CXX>:{}>\"".format(header.replace('"', '\\"').replace(">", "$<ANGLE-R>"))
+
+
+def project_include(directory, precompiled_headers=None, unity_build=False, unity_batch_size=8):
+    """
+    write a script for CMAKE_PROJECT_INCLUDE that turns on unity builds and adds precompiled headers to every
+    target of the top level project. Nothing happens with cmake before 3.19.
+    The file name is derived from the content, so changing the settings changes the cmake arguments and with
+    them the configure stamp
+    :param precompiled_headers: headers to precompile for C++ sources, e.g. "<QString>" or "\"common.h\""
+    :return: path of the script, None if there is nothing to inject
+    """
+    if not precompiled_headers and not unity_build:
+        return None
+    content = HEADER
+    if unity_build:
+        content += UNITY_BUILD.format(batch_size=unity_batch_size)
+    if precompiled_headers:
+        content += PRECOMPILED_HEADERS.format(headers=" ".join(_cxx_only(header) for header in precompiled_headers))
+
+    path = os.path.join(directory, "project_include_{}.cmake".format(hashlib.sha1(content).hexdigest()[:12]))
+    if not os.path.isfile(path):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, "w") as f:
+            f.write(content)
+    return path
@@ -0,0 +1,138 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+
+
+STAMP_FILE = ".unibuild-configure"
+
+# environment variables that influence what cmake finds while configuring
+ENVIRONMENT_KEYS = ["PATH", "INCLUDE", "LIB", "LIBPATH", "CC", "CXX", "CFLAGS", "CXXFLAGS", "LDFLAGS",
+                    "CMAKE_PREFIX_PATH", "BOOST_ROOT", "QTDIR", "VCINSTALLDIR", "WindowsSdkDir"]
+
+INPUT_PATTERNS = ["CMakeLists.txt", "*.cmake"]
+SKIP_DIRECTORIES = [".git", ".hg", ".svn", "CMakeFiles"]
+
+
+def _file_digest(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def tool_signature(file_path):
+    if not file_path or not os.path.isfile(file_path):
+        return None
+    stat = os.stat(file_path)
+    return [file_path, stat.st_size, int(stat.st_mtime)]
+
+
+def configure_inputs(source_path):
+    """
+    content hashes of all CMakeLists.txt and *.cmake files of a source tree. Build directories inside it
+    (recognised by their CMakeCache.txt) are skipped. Files cmake regenerates in an in-source build come
+    out identical as long as the configuration doesn't change, so hashing contents keeps those stable
+    """
+    result = []
+    for root, dirs, files in os.walk(source_path):
+        dirs[:] = sorted(d for d in dirs
+                         if d not in SKIP_DIRECTORIES
+                         and not os.path.isfile(os.path.join(root, d, "CMakeCache.txt")))
+        for file_name in sorted(files):
+            if any(fnmatch.fnmatch(file_name, pattern) for pattern in INPUT_PATTERNS):
+                file_path = os.path.join(root, file_name)
+                result.append([os.path.relpath(file_path, source_path).replace(os.sep, "/"),
+                               _file_digest(file_path)])
+    return result
+
+
+def configure_key(arguments, source_path, environment=None, toolchain=None):
+    """
+    hash of everything a cmake configure run depends on
+    :param arguments: the cmake command line (generator, definitions, ...)
+    :param environment: the environment cmake runs in, only ENVIRONMENT_KEYS are considered
+    :param toolchain: paths of tools involved (cmake, the build tool, compilers)
+    """
+    environment = environment or {}
+    data = {
+        "arguments": arguments,
+        "environment": dict((key, environment.get(key)) for key in ENVIRONMENT_KEYS),
+        "toolchain": [tool_signature(tool) for tool in toolchain or []],
+        "inputs": configure_inputs(source_path),
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str)).hexdigest()
+
+
+def _stamp_path(build_path):
+    return os.path.join(build_path, STAMP_FILE)
+
+
+def is_current(build_path, key):
+    """
+    True if build_path was configured with exactly this key and the configuration is still there
+    """
+    if not os.path.isfile(os.path.join(build_path, "CMakeCache.txt")):
+        return False
+    try:
+        with open(_stamp_path(build_path), "r") as f:
+            return f.read().strip() == key
+    except IOError:
+        return False
+
+
+def cached_generator(build_path):
+    """
+    :return: the generator build_path was configured with, None if it wasn't configured yet
+    """
+    try:
+        with open(os.path.join(build_path, "CMakeCache.txt"), "r") as f:
+            for line in f:
+                if line.startswith("CMAKE_GENERATOR:"):
+                    return line.split("=", 1)[1].strip()
+    except IOError:
+        pass
+    return None
+
+
+def reset_generator(build_path, generator):
+    """
+    remove the configuration from build_path if it was configured with a different generator, cmake
+    refuses to configure it otherwise
+    :return: True if the configuration was removed
+    """
+    previous = cached_generator(build_path)
+    if previous is None or previous == generator:
+        return False
+    os.remove(os.path.join(build_path, "CMakeCache.txt"))
+    if os.path.isdir(os.path.join(build_path, "CMakeFiles")):
+        shutil.rmtree(os.path.join(build_path, "CMakeFiles"))
+    clear_stamp(build_path)
+    return True
+
+
+def write_stamp(build_path, key):
+    with open(_stamp_path(build_path), "w") as f:
+        f.write(key)
+
+
+def clear_stamp(build_path):
+    if os.path.isfile(_stamp_path(build_path)):
+        os.remove(_stamp_path(build_path))
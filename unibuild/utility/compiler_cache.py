@@ -0,0 +1,190 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from contextlib import contextmanager
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+
+
+KINDS = ["ccache", "sccache", "clcache"]
+
+# counters of "ccache --print-stats", the names changed with ccache 4
+CCACHE_HITS = ["direct_cache_hit", "preprocessed_cache_hit", "cache_hit_direct", "cache_hit_preprocessed"]
+CCACHE_MISSES = ["cache_miss"]
+
+CLCACHE_HITS = re.compile(r"^\s*cache hits\s*:\s*(\d+)", re.MULTILINE | re.IGNORECASE)
+CLCACHE_MISSES = re.compile(r"^\s*cache misses\s*:\s*(\d+)", re.MULTILINE | re.IGNORECASE)
+
+SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(size):
+    """
+    :param size: number of bytes or a string like "512M" or "10G"
+    :return: the size in bytes
+    """
+    if isinstance(size, (int, long)):
+        return size
+    match = SIZE.match(str(size))
+    if match is None:
+        raise ValueError("invalid size {}".format(size))
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+class CompilerCache(object):
+    """
+    a compiler cache (ccache, sccache or clcache) storing its objects in a local directory of limited size
+    """
+
+    def __init__(self, executable, cache_path, max_size):
+        self.__executable = executable
+        self.__cache_path = cache_path
+        self.__max_size = parse_size(max_size)
+        self.__kind = os.path.splitext(os.path.basename(executable))[0].lower()
+        if self.__kind not in KINDS:
+            raise ValueError("unsupported compiler cache {}, expected one of {}".format(executable, ", ".join(KINDS)))
+
+    @property
+    def executable(self):
+        return self.__executable
+
+    @property
+    def kind(self):
+        return self.__kind
+
+    def wrap(self, compiler):
+        """
+        :return: command line invoking compiler through the cache. clcache replaces cl.exe rather than
+                 wrapping it and finds the compiler itself (on the PATH or through CLCACHE_CL)
+        """
+        if self.__kind == "clcache":
+            return "\"{}\"".format(self.__executable)
+        return "\"{}\" {}".format(self.__executable, compiler)
+
+    def environment(self, environment):
+        """
+        :return: copy of environment that makes the cache use the local directory and size limit
+        """
+        result = dict(environment or os.environ)
+        if self.__kind == "ccache":
+            result["CCACHE_DIR"] = self.__cache_path
+            result["CCACHE_MAXSIZE"] = str(self.__max_size)
+        elif self.__kind == "sccache":
+            result["SCCACHE_DIR"] = self.__cache_path
+            result["SCCACHE_CACHE_SIZE"] = str(self.__max_size)
+        elif self.__kind == "clcache":
+            result["CLCACHE_DIR"] = self.__cache_path
+        return result
+
+    def __run(self, arguments, environment):
+        proc = subprocess.Popen([self.__executable] + arguments, env=self.environment(environment),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        return proc.returncode, stdout, stderr
+
+    def prepare(self, environment):
+        """
+        create the cache directory and apply the size limit. sccache reads its settings when the server
+        starts, so the server is started here with the right environment
+        """
+        if not os.path.isdir(self.__cache_path):
+            os.makedirs(self.__cache_path)
+        if self.__kind == "ccache":
+            returncode, _, stderr = self.__run(["--max-size", str(self.__max_size)], environment)
+        elif self.__kind == "sccache":
+            returncode, _, stderr = self.__run(["--start-server"], environment)
+            # fails if a server is already running, which is fine
+            returncode = 0
+        else:
+            returncode, _, stderr = self.__run(["-M", str(self.__max_size)], environment)
+        if returncode != 0:
+            logging.warning("failed to set up %s in %s: %s", self.__kind, self.__cache_path, stderr.strip())
+
+    def statistics(self, environment):
+        """
+        :return: total number of cache hits and misses so far as a tuple, None if they can't be determined
+        """
+        try:
+            if self.__kind == "ccache":
+                returncode, stdout, _ = self.__run(["--print-stats"], environment)
+                counters = dict(line.split("\t", 1) for line in stdout.splitlines() if "\t" in line)
+                hits = sum(int(counters.get(key, 0)) for key in CCACHE_HITS)
+                misses = sum(int(counters.get(key, 0)) for key in CCACHE_MISSES)
+            elif self.__kind == "sccache":
+                returncode, stdout, _ = self.__run(["--show-stats", "--stats-format", "json"], environment)
+                stats = json.loads(stdout)["stats"]
+                hits = sum(stats["cache_hits"]["counts"].values())
+                misses = sum(stats["cache_misses"]["counts"].values())
+            else:
+                returncode, stdout, _ = self.__run(["-s"], environment)
+                hits = int(CLCACHE_HITS.search(stdout).group(1))
+                misses = int(CLCACHE_MISSES.search(stdout).group(1))
+        except (OSError, ValueError, KeyError, AttributeError), e:
+            logging.debug("failed to read %s statistics: %s", self.__kind, e)
+            return None
+        return (hits, misses) if returncode == 0 else None
+
+
+class CacheStatistics(object):
+    """
+    cache hits and misses per task, determined from the counters of the cache before and after the task
+    """
+
+    def __init__(self):
+        self.__records = []
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, name, cache, environment):
+        """
+        record the hits and misses of the cache during the with block. Does nothing if cache is None
+        """
+        before = cache.statistics(environment) if cache is not None else None
+        try:
+            yield
+        finally:
+            after = cache.statistics(environment) if before is not None else None
+            if after is not None:
+                with self.__lock:
+                    self.__records.append((name, after[0] - before[0], after[1] - before[1]))
+
+    def report(self):
+        """
+        :return: lines summarising the hits and misses per task and in total, empty if nothing was recorded
+        """
+        with self.__lock:
+            records = [record for record in self.__records if record[1] or record[2]]
+        if not records:
+            return []
+
+        def line(name, hits, misses):
+            total = hits + misses
+            return "{:<40} {:>7} hits {:>7} misses {:>5.1f}%".format(name, hits, misses,
+                                                                    100.0 * hits / total if total else 0.0)
+
+        result = [line(*record) for record in records]
+        result.append(line("total", sum(record[1] for record in records), sum(record[2] for record in records)))
+        return result
+
+
+compiler_cache_statistics = CacheStatistics()
@@ -0,0 +1,193 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from distutils.spawn import find_executable
+import json
+import os
+import re
+
+
+SHOW_INCLUDES = re.compile(r"^Note: including file:\s*(.+?)\s*$")
+RULE_SEPARATOR = re.compile(r":(?:\s|$)")
+PREREQUISITE = re.compile(r"(?:\\.|[^\s\\])+")
+
+
+def parse_dependency_file(text):
+    """
+    prerequisites of the first rule in a make style dependency file as written by gcc -MMD
+    """
+    text = text.replace("\\\r\n", " ").replace("\\\n", " ")
+    parts = RULE_SEPARATOR.split(text, 1)
+    if len(parts) < 2:
+        return []
+    return [re.sub(r"\\(.)", r"\1", prerequisite) for prerequisite in PREREQUISITE.findall(parts[1].split("\n")[0])]
+
+
+def parse_show_includes(output):
+    """
+    split compiler output produced with /showIncludes
+    :return: the included files and the remaining output
+    """
+    includes = []
+    remaining = []
+    for line in output.splitlines(True):
+        match = SHOW_INCLUDES.match(line)
+        if match is not None:
+            includes.append(match.group(1))
+        else:
+            remaining.append(line)
+    return includes, "".join(remaining)
+
+
+class Toolchain(object):
+    """
+    commands of one compiler family for compiling single sources and packing static libraries
+    """
+
+    name = None
+    object_suffix = None
+    static_lib_suffix = None
+    default_flags = []
+
+    def __init__(self, compiler, archiver):
+        self.compiler = compiler
+        self.archiver = archiver
+
+    def locate(self, environment):
+        """
+        resolve compiler and archiver on the PATH of environment, which isn't necessarily the PATH of this process
+        """
+        path = (environment or os.environ).get("PATH")
+        self.compiler = find_executable(self.compiler, path) or self.compiler
+        self.archiver = find_executable(self.archiver, path) or self.archiver
+
+    def object_name(self, source):
+        return "{}{}".format(os.path.splitext(os.path.basename(source))[0], self.object_suffix)
+
+    def static_lib_name(self, target):
+        return "{}{}".format(target, self.static_lib_suffix)
+
+    def compile_command(self, source, object_name, flags):
+        raise NotImplementedError()
+
+    def archive_command(self, lib_name, objects):
+        raise NotImplementedError()
+
+    def dependencies(self, object_name, output, cwd):
+        """
+        :return: the headers the last compile of object_name read and its output without the dependency
+                 information
+        """
+        raise NotImplementedError()
+
+
+class MSVC(Toolchain):
+    name = "msvc"
+    object_suffix = ".obj"
+    static_lib_suffix = ".lib"
+    default_flags = ["-nologo", "-O2", "-MD"]
+
+    def __init__(self, compiler="cl", archiver="link"):
+        super(MSVC, self).__init__(compiler, archiver)
+
+    def compile_command(self, source, object_name, flags):
+        return [self.compiler, "-c"] + flags + ["-showIncludes", "-Fo{}".format(object_name), source]
+
+    def archive_command(self, lib_name, objects):
+        return [self.archiver, "/lib", "/nologo", "/out:{}".format(lib_name)] + objects
+
+    def dependencies(self, object_name, output, cwd):
+        return parse_show_includes(output)
+
+
+class GCC(Toolchain):
+    name = "gcc"
+    object_suffix = ".o"
+    static_lib_suffix = ".a"
+    default_flags = ["-O2"]
+
+    def __init__(self, compiler="cc", archiver="ar"):
+        super(GCC, self).__init__(compiler, archiver)
+
+    def compile_command(self, source, object_name, flags):
+        return [self.compiler, "-c"] + flags + ["-MMD", "-MF", "{}.d".format(object_name), "-o", object_name, source]
+
+    def archive_command(self, lib_name, objects):
+        return [self.archiver, "rcs", lib_name] + objects
+
+    def dependencies(self, object_name, output, cwd):
+        try:
+            with open(os.path.join(cwd, "{}.d".format(object_name)), "r") as f:
+                return parse_dependency_file(f.read()), output
+        except IOError:
+            return [], output
+
+
+TOOLCHAINS = {
+    "msvc": MSVC,
+    "gcc": GCC,
+    "clang": lambda: GCC("clang"),
+}
+
+
+def _signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+
+class OutputState(object):
+    """
+    remembers the command that produced each output and the state of the files it was made from, so outputs
+    are only remade if the command or one of the inputs changed
+    """
+
+    def __init__(self, base_path, file_name=".unibuild-outputs"):
+        self.__base_path = base_path
+        self.__path = os.path.join(base_path, file_name)
+        try:
+            with open(self.__path, "r") as f:
+                self.__outputs = json.load(f)
+        except (IOError, ValueError):
+            self.__outputs = {}
+
+    def __full_path(self, file_path):
+        return os.path.join(self.__base_path, file_path)
+
+    def is_current(self, output, command):
+        record = self.__outputs.get(output)
+        if record is None or record["command"] != command or not os.path.exists(self.__full_path(output)):
+            return False
+        return all(_signature(self.__full_path(path)) == signature for path, signature in record["inputs"])
+
+    def record(self, output, command, inputs):
+        self.__outputs[output] = {"command": command,
+                                  "inputs": [[path, _signature(self.__full_path(path))] for path in inputs]}
+
+    def forget(self, output):
+        self.__outputs.pop(output, None)
+
+    def save(self):
+        temp_path = "{}.tmp{}".format(self.__path, os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(self.__outputs, f)
+        if os.path.exists(self.__path):
+            os.remove(self.__path)
+        os.rename(temp_path, self.__path)
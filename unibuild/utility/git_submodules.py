@@ -0,0 +1,88 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import subprocess
+
+
+def list_submodules(git, repo_path, env=None):
+    """
+    submodules declared in .gitmodules of repo_path
+    :return: list of dictionaries with the keys of each submodule section (path, url, branch, ...)
+             plus "name"
+    """
+    proc = subprocess.Popen([git, "config", "-f", ".gitmodules", "--get-regexp", r"^submodule\."],
+                            cwd=repo_path, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    if proc.returncode != 0:
+        raise IOError("failed to read submodules of {}: {}".format(repo_path, stderr.strip()))
+
+    submodules = {}
+    order = []
+    for line in stdout.splitlines():
+        key, _, value = line.partition(" ")
+        name, _, option = key[len("submodule."):].rpartition(".")
+        if name not in submodules:
+            submodules[name] = {"name": name}
+            order.append(name)
+        submodules[name][option] = value
+    return [submodules[name] for name in order]
+
+
+def select_submodules(submodules, skip=None, skip_suffixes=None):
+    """
+    paths of the submodules that are needed. Submodules in skip (by name or path), those ending in one
+    of skip_suffixes and those the repository marks as not to be initialised (initrepo = false) are left out
+    """
+    skip = set(skip or [])
+    skip_suffixes = tuple(skip_suffixes or [])
+    result = []
+    for submodule in submodules:
+        path = submodule.get("path", submodule["name"])
+        if submodule["name"] in skip or path in skip:
+            continue
+        if skip_suffixes and path.endswith(skip_suffixes):
+            continue
+        if submodule.get("initrepo", "true").lower() == "false":
+            continue
+        result.append(path)
+    return result
+
+
+def update_submodules(git, repo_path, paths, depth=None, jobs=1, env=None):
+    """
+    initialise and check out the listed submodules, fetching up to jobs of them concurrently. A shallow
+    update is retried in full if the server refuses to hand out the recorded commits by id
+    :return: returncode of git
+    """
+    def run(args):
+        proc = subprocess.Popen([git] + args, cwd=repo_path, env=env)
+        proc.communicate()
+        return proc.returncode
+
+    returncode = run(["submodule", "init", "--"] + paths)
+    if returncode != 0:
+        return returncode
+
+    update = ["submodule", "update", "--jobs", str(jobs)]
+    if depth:
+        returncode = run(update + ["--depth", str(depth), "--"] + paths)
+        if returncode == 0:
+            return 0
+        logging.warning("shallow submodule update of %s failed, fetching complete history", repo_path)
+    return run(update + ["--"] + paths)
@@ -0,0 +1,298 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import httplib
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import urllib
+import urllib2
+from urlparse import urlsplit, urljoin
+from singleton import Singleton
+
+
+REDIRECT_CODES = [301, 302, 303, 307, 308]
+RETRY_CODES = [429, 500, 502, 503, 504]
+IDEMPOTENT_METHODS = ["GET", "HEAD"]
+MAX_REDIRECTS = 10
+BLOCK_SIZE = 64 * 1024
+
+
+class Response(object):
+    """
+    response of a HTTPClient request. Has to be closed (or used as a context manager) so the connection
+    goes back to the pool and the host slot is released
+    """
+
+    def __init__(self, client, key, connection, response, url):
+        self.__client = client
+        self.__key = key
+        self.__connection = connection
+        self.__response = response
+        self.url = url
+
+    @property
+    def status(self):
+        return self.__response.status
+
+    @property
+    def reason(self):
+        return self.__response.reason
+
+    def getheader(self, name, default=None):
+        return self.__response.getheader(name, default)
+
+    def info(self):
+        return self.__response.msg
+
+    def read(self, size=None):
+        if size is None:
+            return self.__response.read()
+        return self.__response.read(size)
+
+    def close(self):
+        if self.__connection is None:
+            return
+        # a connection can only be reused once the response body has been consumed completely
+        reusable = not self.__response.will_close and self.__response.isclosed()
+        if not reusable and not self.__response.will_close:
+            try:
+                # small leftovers (redirect and error bodies) are cheaper to drain than a new handshake
+                if self.__response.length is not None and self.__response.length <= BLOCK_SIZE:
+                    self.__response.read()
+                    reusable = True
+            except (socket.error, httplib.HTTPException):
+                pass
+        self.__client._release(self.__key, self.__connection, reusable)
+        self.__connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class HTTPClient(object):
+    """
+    http(s) client keeping persistent connections per host, limiting the number of concurrent requests
+    per host and retrying idempotent requests with exponential backoff
+    """
+    __metaclass__ = Singleton
+
+    def __init__(self):
+        self.max_per_host = 4
+        self.retries = 4
+        self.backoff = 1.0
+        self.timeout = 60
+        self.__lock = threading.Lock()
+        self.__slot_freed = threading.Condition(self.__lock)
+        self.__idle = {}
+        self.__active = {}
+
+    def configure(self, max_per_host=None, retries=None, backoff=None, timeout=None):
+        if max_per_host is not None:
+            with self.__lock:
+                # hosts already in use follow the new limit too, a lower one as their requests finish
+                self.max_per_host = max_per_host
+                self.__slot_freed.notify_all()
+        if retries is not None:
+            self.retries = retries
+        if backoff is not None:
+            self.backoff = backoff
+        if timeout is not None:
+            self.timeout = timeout
+        return self
+
+    def __acquire_slot(self, key):
+        with self.__lock:
+            while self.__active.get(key, 0) >= self.max_per_host:
+                self.__slot_freed.wait()
+            self.__active[key] = self.__active.get(key, 0) + 1
+
+    def __release_slot(self, key):
+        with self.__lock:
+            self.__active[key] -= 1
+            self.__slot_freed.notify_all()
+
+    def __connection(self, key):
+        """
+        :return: a pooled connection for key or a new one, and whether it was pooled
+        """
+        with self.__lock:
+            idle = self.__idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        scheme, host, port = key
+        proxy = urllib.getproxies().get(scheme)
+        if proxy and not urllib.proxy_bypass(host):
+            proxy_parts = urlsplit(proxy)
+            connection_class = httplib.HTTPSConnection if proxy_parts.scheme == "https" else httplib.HTTPConnection
+            connection = connection_class(proxy_parts.hostname, proxy_parts.port, timeout=self.timeout)
+            if scheme == "https":
+                connection.set_tunnel(host, port)
+        elif scheme == "https":
+            connection = httplib.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            connection = httplib.HTTPConnection(host, port, timeout=self.timeout)
+        return connection, False
+
+    def _release(self, key, connection, reusable):
+        if reusable:
+            with self.__lock:
+                self.__idle.setdefault(key, []).append(connection)
+        else:
+            connection.close()
+        self.__release_slot(key)
+
+    def close(self):
+        with self.__lock:
+            for connections in self.__idle.values():
+                for connection in connections:
+                    connection.close()
+            self.__idle = {}
+
+    @staticmethod
+    def __key(url):
+        parts = urlsplit(url)
+        if parts.scheme not in ["http", "https"]:
+            raise ValueError("unsupported url scheme: {}".format(url))
+        return parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+    def __request_once(self, method, url, headers):
+        key = HTTPClient.__key(url)
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        if urllib.getproxies().get(parts.scheme) and parts.scheme == "http" and not urllib.proxy_bypass(parts.hostname):
+            # plain http proxies expect the absolute url
+            path = url
+
+        request_headers = {"User-Agent": "unibuild", "Accept-Encoding": "identity"}
+        request_headers.update(headers or {})
+
+        self.__acquire_slot(key)
+        try:
+            while True:
+                connection, pooled = self.__connection(key)
+                try:
+                    connection.request(method, path, headers=request_headers)
+                    response = connection.getresponse()
+                    return Response(self, key, connection, response, url)
+                except (socket.error, httplib.HTTPException):
+                    connection.close()
+                    if not pooled:
+                        raise
+                    # the server dropped an idle keep-alive connection, that doesn't count as a failure
+        except:
+            self.__release_slot(key)
+            raise
+
+    def open(self, url, headers=None, method="GET"):
+        """
+        send a request, following redirects. Error statuses raise urllib2.HTTPError, except for 304
+        which callers sending conditional requests have to check for
+        """
+        attempt = 0
+        redirects = 0
+        while True:
+            try:
+                response = self.__request_once(method, url, headers)
+            except (socket.error, httplib.HTTPException), e:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.retries:
+                    raise
+                attempt += 1
+                self.__wait(attempt, url, e)
+                continue
+
+            if response.status in REDIRECT_CODES and response.getheader("Location"):
+                response.close()
+                redirects += 1
+                if redirects > MAX_REDIRECTS:
+                    raise urllib2.HTTPError(url, response.status, "too many redirects", response.info(), None)
+                url = urljoin(url, response.getheader("Location"))
+                continue
+
+            if response.status in RETRY_CODES and method in IDEMPOTENT_METHODS and attempt < self.retries:
+                response.close()
+                attempt += 1
+                self.__wait(attempt, url, "status {}".format(response.status))
+                continue
+
+            if response.status >= 400:
+                error = urllib2.HTTPError(url, response.status, response.reason, response.info(), None)
+                response.close()
+                raise error
+            return response
+
+    def __wait(self, attempt, url, reason):
+        delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+        logging.warning("request to {} failed ({}), retry {}/{} in {:.1f}s".format(url, reason, attempt,
+                                                                                    self.retries, delay))
+        time.sleep(delay)
+
+    def download(self, url, file_path, headers=None, progress_cb=None):
+        """
+        download url to file_path. The data is written to a temporary file first so an interrupted transfer
+        never replaces an existing file
+        :param progress_cb: called with (bytes read, total size or None)
+        :return: the response headers or None if the server answered a conditional request with 304
+        """
+        part_file_path = "{}.part".format(file_path)
+        attempt = 0
+        while True:
+            try:
+                info = self.__download_once(url, part_file_path, headers, progress_cb)
+                if info is None:
+                    return None
+                break
+            except (socket.error, httplib.HTTPException, IOError), e:
+                if isinstance(e, urllib2.HTTPError) or attempt >= self.retries:
+                    raise
+                attempt += 1
+                self.__wait(attempt, url, e)
+
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+        os.rename(part_file_path, file_path)
+        return info
+
+    def __download_once(self, url, file_path, headers, progress_cb):
+        with self.open(url, headers) as response:
+            if response.status == 304:
+                return None
+            length = response.getheader("Content-Length")
+            length = int(length) if length else None
+            bytes_read = 0
+            with open(file_path, "wb") as outfile:
+                while True:
+                    block = response.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    outfile.write(block)
+                    bytes_read += len(block)
+                    if progress_cb is not None:
+                        progress_cb(bytes_read, length)
+            if length is not None and bytes_read != length:
+                raise IOError("incomplete download of {} ({} of {} bytes)".format(url, bytes_read, length))
+            return response.info()
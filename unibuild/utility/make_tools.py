@@ -0,0 +1,105 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import re
+import shlex
+import subprocess
+
+
+GNU_MAKE = "gnu make"
+JOM = "jom"
+NMAKE = "nmake"
+NINJA = "ninja"
+UNKNOWN = "unknown"
+
+NAMES = {
+    "nmake": NMAKE,
+    "jom": JOM,
+    "ninja": NINJA,
+    "gmake": GNU_MAKE,
+    "mingw32-make": GNU_MAKE,
+}
+
+JOBS_ARGUMENT = re.compile(r"^(-j|/j|-j\d+|--jobs(=\d+)?)$", re.IGNORECASE)
+
+_detected = {}
+
+
+def split_command(command):
+    """
+    split a command line given as a string, keeping backslashes so windows paths survive. Quotes group
+    arguments containing spaces and are removed
+    """
+    if not isinstance(command, basestring):
+        return list(command)
+    result = []
+    for argument in shlex.split(command, posix=False):
+        if len(argument) >= 2 and argument[0] == argument[-1] and argument[0] in "\"'":
+            argument = argument[1:-1]
+        result.append(argument)
+    return result
+
+
+def detect(executable, environment=None):
+    """
+    :return: the kind of make tool executable is, GNU_MAKE, JOM, NMAKE, NINJA or UNKNOWN
+    """
+    name = os.path.splitext(re.split(r"[\\/]", executable)[-1])[0].lower()
+    if name in NAMES:
+        return NAMES[name]
+    if name != "make":
+        return UNKNOWN
+    if executable not in _detected:
+        # "make" could be anything, only GNU make identifies itself as such
+        try:
+            proc = subprocess.Popen([executable, "--version"], env=environment,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, _ = proc.communicate()
+            _detected[executable] = GNU_MAKE if "GNU Make" in stdout else UNKNOWN
+        except OSError:
+            _detected[executable] = UNKNOWN
+    return _detected[executable]
+
+
+def has_jobs_argument(arguments):
+    return any(JOBS_ARGUMENT.match(argument) for argument in arguments)
+
+
+def jobs_arguments(kind, jobs):
+    """
+    arguments that make a tool of the given kind run jobs in parallel. GNU make hands out the jobs through its
+    jobserver to recursive invocations as well. nmake can't run anything in parallel
+    """
+    if not jobs or kind in [NMAKE, UNKNOWN]:
+        return []
+    if kind == GNU_MAKE:
+        return ["-j{}".format(jobs)]
+    return ["-j", str(jobs)]
+
+
+def make_command(command, jobs, targets=None, environment=None):
+    """
+    :param command: the make tool with any arguments of its own, as a string or list
+    :param jobs: number of parallel jobs, only added if the command doesn't specify them already
+    :return: the command line as a list
+    """
+    result = split_command(command)
+    if not has_jobs_argument(result):
+        result += jobs_arguments(detect(result[0], environment), jobs)
+    return result + (targets or [])
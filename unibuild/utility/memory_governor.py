@@ -0,0 +1,187 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import threading
+import time
+from resources import memory
+
+
+NORMAL = "normal"
+PRESSURE = "pressure"
+CRITICAL = "critical"
+
+GIGABYTE = 1024.0 ** 3
+
+
+def read_pressure(path="/proc/pressure/memory"):
+    """
+    :return: the "some" and "full" stall percentages of the last 10 seconds from the kernel's pressure stall
+             information, None if the kernel doesn't provide it
+    """
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except IOError:
+        return None
+    result = {}
+    for line in lines:
+        fields = line.split()
+        if not fields:
+            continue
+        values = dict(field.split("=", 1) for field in fields[1:] if "=" in field)
+        if "avg10" in values:
+            result[fields[0]] = float(values["avg10"])
+    return result.get("some", 0.0), result.get("full", 0.0)
+
+
+class Sample(object):
+    def __init__(self, total, available, pressure):
+        self.total = total
+        self.available = available
+        # percentage of time some tasks stalled on memory, None without pressure information
+        self.pressure = pressure
+
+    def __str__(self):
+        result = "{:.1f} of {:.1f} GB available".format(self.available / GIGABYTE, self.total / GIGABYTE)
+        if self.pressure is not None:
+            result += ", {:.1f}% stalled on memory".format(self.pressure)
+        return result
+
+
+class MemoryGovernor(object):
+    """
+    watches memory while building, lowers the number of jobs handed to build tools started while memory is
+    short and holds back new tasks while less than the reserve is available, so builds don't drive the machine
+    into swap. Once a task was started anyway after waiting wait_timeout, no further tasks are held back until
+    memory recovers
+    """
+
+    def __init__(self, reserve, pressure_limit, wait_timeout, interval=2.0):
+        """
+        :param reserve: bytes of memory to keep available for the system. Jobs are limited to what fits above
+                        it and new tasks wait while less is available
+        :param pressure_limit: percentage of time stalled on memory above which the machine is considered short on
+                               memory regardless of how much is available
+        :param wait_timeout: seconds a task waits at most before it's started anyway
+        """
+        self.__reserve = reserve
+        self.__pressure_limit = pressure_limit
+        self.__wait_timeout = wait_timeout
+        self.__interval = interval
+        self.__state = NORMAL
+        self.__sample = None
+        self.__gave_up = False
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    def sample(self):
+        """
+        :return: the current memory situation, None if it can't be determined on this system
+        """
+        current = memory()
+        if current is None:
+            return None
+        pressure = read_pressure()
+        return Sample(current[0], current[1], pressure[0] if pressure is not None else None)
+
+    def __classify(self, sample):
+        if sample.available < self.__reserve:
+            return CRITICAL
+        if sample.pressure is not None and sample.pressure > self.__pressure_limit:
+            return PRESSURE
+        return NORMAL
+
+    def start(self):
+        """
+        start watching memory in the background. jobs() and wait() then use the latest sample instead of
+        taking their own
+        """
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__watch, name="memory governor")
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def __watch(self):
+        while True:
+            sample = self.sample()
+            if sample is None:
+                logging.info("memory governor: memory usage can't be determined, watching stopped")
+                return
+            state = self.__classify(sample)
+            with self.__lock:
+                previous, self.__state = self.__state, state
+                self.__sample = sample
+            if state != previous:
+                logging.info("memory governor: %s -> %s (%s)", previous, state, sample)
+            time.sleep(self.__interval)
+
+    def __current(self):
+        """
+        :return: the memory state and the sample it's based on, from the watcher if it's running. The sample is
+                 None if memory usage can't be determined
+        """
+        with self.__lock:
+            if self.__thread is not None and self.__sample is not None:
+                return self.__state, self.__sample
+        sample = self.sample()
+        return (self.__classify(sample) if sample is not None else NORMAL), sample
+
+    def jobs(self, requested, memory_per_job, name=None):
+        """
+        number of jobs a build tool started now should run: requested, but no more than fit into the memory
+        available above the reserve, halved if the system is stalling on memory
+        """
+        state, sample = self.__current()
+        if sample is None:
+            return requested
+        result = requested
+        if memory_per_job:
+            result = min(result, int(max(0, sample.available - self.__reserve) // memory_per_job))
+        if state == PRESSURE:
+            result //= 2
+        result = max(1, result)
+        if result < requested:
+            logging.info("memory governor: %d instead of %d jobs for %s (%s)", result, requested, name or "build",
+                         sample)
+        else:
+            logging.info("memory governor: %d jobs for %s (%s)", result, name or "build", sample)
+        return result
+
+    def wait(self, name):
+        """
+        hold back task name while less than the reserve is available, at most wait_timeout seconds. Pressure
+        alone only lowers the number of jobs
+        """
+        start = time.time()
+        state, sample = self.__current()
+        if state != CRITICAL:
+            self.__gave_up = False
+            return
+        if self.__gave_up:
+            return
+        logging.info("memory governor: pausing before %s (%s)", name, sample)
+        while state == CRITICAL:
+            if time.time() - start > self.__wait_timeout:
+                logging.info("memory governor: starting %s after %ds although memory is still short (%s), not "
+                             "holding back further tasks until it recovers", name, int(time.time() - start), sample)
+                self.__gave_up = True
+                return
+            time.sleep(self.__interval)
+            state, sample = self.__current()
+        logging.info("memory governor: resuming with %s after %ds (%s)", name, int(time.time() - start), sample)
@@ -0,0 +1,257 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import httplib
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import urllib2
+from urlparse import urlsplit
+
+
+PROBE_SIZE = 64 * 1024
+CHUNK_SIZE = 4 * 1024 * 1024
+BLOCK_SIZE = 64 * 1024
+# the size used to turn time-to-first-byte and throughput into one estimate
+REFERENCE_SIZE = 8 * 1024 * 1024
+# weight of a new measurement in the moving averages
+SMOOTHING = 0.3
+
+
+class MirrorStalled(IOError):
+    pass
+
+
+class MirrorStats(object):
+    """
+    time-to-first-byte and throughput per mirror host, persisted between runs
+    """
+
+    def __init__(self, file_path):
+        self.__file_path = file_path
+        self.__lock = threading.Lock()
+        try:
+            with open(file_path, "r") as f:
+                self.__stats = json.load(f)
+        except (IOError, ValueError):
+            self.__stats = {}
+
+    @staticmethod
+    def host(url):
+        return urlsplit(url).netloc
+
+    def record(self, url, ttfb, throughput):
+        with self.__lock:
+            entry = self.__stats.setdefault(MirrorStats.host(url), {})
+            for key, value in (("ttfb", ttfb), ("throughput", throughput)):
+                old = entry.get(key)
+                entry[key] = value if old is None else old + SMOOTHING * (value - old)
+            entry["failures"] = 0
+            entry["updated"] = time.time()
+
+    def record_failure(self, url):
+        with self.__lock:
+            entry = self.__stats.setdefault(MirrorStats.host(url), {})
+            entry["failures"] = entry.get("failures", 0) + 1
+            entry["updated"] = time.time()
+
+    def estimate(self, url):
+        """
+        expected seconds to fetch REFERENCE_SIZE bytes from this mirror, None if nothing is known about it
+        """
+        entry = self.__stats.get(MirrorStats.host(url))
+        if not entry or not entry.get("throughput"):
+            return None
+        return (entry["ttfb"] + REFERENCE_SIZE / entry["throughput"]) * (1 + entry.get("failures", 0))
+
+    def save(self):
+        with self.__lock:
+            with open(self.__file_path, "w") as f:
+                json.dump(self.__stats, f, indent=1)
+
+
+def parse_content_range(content_range):
+    """
+    :return: the total size from a "bytes first-last/total" Content-Range header, None if it has none
+    """
+    match = re.match(r"bytes \d+-\d+/(\d+)$", (content_range or "").strip())
+    return int(match.group(1)) if match else None
+
+
+class MirrorDownload(object):
+    """
+    downloads one file available from several mirrors. Mirrors are probed concurrently and ranked by
+    measured time-to-first-byte and throughput. The file is fetched in ranges and the download switches to
+    the next mirror when a range fails or its throughput drops below min_throughput. Ranges are only
+    combined from mirrors that agree on the size and ETag of the file, otherwise it's fetched whole
+    from a single mirror
+    """
+
+    def __init__(self, urls, client, stats, min_throughput=32 * 1024, stall_grace=5.0):
+        self.__urls = urls
+        self.__client = client
+        self.__stats = stats
+        self.__min_throughput = min_throughput
+        self.__stall_grace = stall_grace
+        self.__total_size = None
+        self.__etag = None
+        self.__ranges = True
+        self.__last_modified = {}
+        # ETag and Last-Modified of the file as served by the mirror it was downloaded from
+        self.validators = {}
+
+    def __probe(self, url, results):
+        start = time.time()
+        try:
+            with self.__client.open(url, {"Range": "bytes=0-{}".format(PROBE_SIZE - 1)}) as response:
+                ttfb = time.time() - start
+                data_start = time.time()
+                data = response.read(PROBE_SIZE)
+                elapsed = max(time.time() - data_start, 0.001)
+                results[url] = (ttfb, len(data) / elapsed, response.status,
+                                parse_content_range(response.getheader("Content-Range")),
+                                response.getheader("ETag"))
+                self.__last_modified[url] = response.getheader("Last-Modified")
+                self.__stats.record(url, ttfb, len(data) / elapsed)
+        except (socket.error, httplib.HTTPException, urllib2.HTTPError, IOError), e:
+            logging.info("mirror {} failed probe: {}".format(url, e))
+            self.__stats.record_failure(url)
+
+    def rank(self):
+        """
+        probe all mirrors concurrently
+        :return: the urls that answered, best first
+        """
+        results = {}
+        threads = [threading.Thread(target=self.__probe, args=(url, results)) for url in self.__urls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        sizes = set()
+        etags = set()
+        for url, (ttfb, throughput, status, total_size, etag) in results.items():
+            if status != 206 or total_size is None:
+                # at least one mirror ignores ranges. Stay safe and fetch whole files
+                self.__ranges = False
+            sizes.add(total_size)
+            if etag is not None:
+                etags.add(etag)
+        if len(sizes) > 1 or len(etags) > 1:
+            logging.warning("mirrors disagree about the file (sizes {}, etags {}), not combining them".format(
+                ", ".join(str(size) for size in sizes), ", ".join(etags)))
+            self.__ranges = False
+        if self.__ranges and results:
+            self.__total_size = sizes.pop()
+            # ETags are only comparable if every mirror sends one
+            if len(etags) == 1 and all(result[4] is not None for result in results.values()):
+                self.__etag = etags.pop()
+
+        def estimate(url):
+            # mirrors without a usable measurement go last
+            result = self.__stats.estimate(url)
+            return result if result is not None else float("inf")
+
+        ranked = sorted(results.keys(), key=estimate)
+        for url in ranked:
+            logging.info("mirror {}: ttfb {:.2f}s, {:.0f} KB/s".format(url, results[url][0], results[url][1] / 1024))
+        return ranked
+
+    def __read_range(self, url, outfile, offset, end, progress_cb):
+        """
+        fetch bytes offset..end (inclusive) from url, appending to outfile
+        :return: the new offset, which is less than end + 1 if the transfer failed part way
+        """
+        start = time.time()
+        with self.__client.open(url, {"Range": "bytes={}-{}".format(offset, end)}) as response:
+            if response.status != 206 or not (response.getheader("Content-Range") or "").startswith(
+                    "bytes {}-".format(offset)):
+                raise IOError("{} didn't honour the range request".format(url))
+            if parse_content_range(response.getheader("Content-Range")) != self.__total_size \
+                    or (self.__etag is not None and response.getheader("ETag") != self.__etag):
+                raise IOError("{} now serves a different file".format(url))
+            ttfb = time.time() - start
+            data_start = time.time()
+            received = 0
+            while offset <= end:
+                block = response.read(min(BLOCK_SIZE, end + 1 - offset))
+                if not block:
+                    raise IOError("connection to {} closed early".format(url))
+                outfile.write(block)
+                offset += len(block)
+                received += len(block)
+                if progress_cb is not None:
+                    progress_cb(offset, self.__total_size)
+                elapsed = time.time() - data_start
+                if elapsed > self.__stall_grace and received / elapsed < self.__min_throughput:
+                    raise MirrorStalled("{} stalled at {:.0f} KB/s".format(url, received / elapsed / 1024))
+            self.__stats.record(url, ttfb, received / max(time.time() - data_start, 0.001))
+        return offset
+
+    def download(self, file_path, progress_cb=None):
+        """
+        :return: the url of the mirror that delivered the last byte
+        """
+        ranked = self.rank()
+        if not ranked:
+            raise IOError("no mirror reachable for {}".format(os.path.basename(file_path)))
+
+        if not self.__ranges or self.__total_size is None:
+            for url in ranked:
+                try:
+                    info = self.__client.download(url, file_path, progress_cb=progress_cb)
+                    self.validators = {"etag": info.getheader("ETag"),
+                                       "last_modified": info.getheader("Last-Modified")}
+                    return url
+                except (socket.error, httplib.HTTPException, urllib2.HTTPError, IOError), e:
+                    logging.warning("download from {} failed: {}".format(url, e))
+                    self.__stats.record_failure(url)
+            raise IOError("all mirrors failed for {}".format(os.path.basename(file_path)))
+
+        part_file_path = "{}.part".format(file_path)
+        offset = 0
+        candidates = list(ranked)
+        url = candidates[0]
+        with open(part_file_path, "wb") as outfile:
+            while offset < self.__total_size:
+                end = min(offset + CHUNK_SIZE, self.__total_size) - 1
+                try:
+                    offset = self.__read_range(url, outfile, offset, end, progress_cb)
+                except (socket.error, httplib.HTTPException, urllib2.HTTPError, IOError), e:
+                    # keep whatever arrived and continue from there on the next mirror
+                    offset = outfile.tell()
+                    self.__stats.record_failure(url)
+                    candidates.remove(url)
+                    if not candidates:
+                        raise IOError("all mirrors failed for {}".format(os.path.basename(file_path)))
+                    logging.warning("{}, switching to {} at byte {}".format(e, candidates[0], offset))
+                    url = candidates[0]
+
+        if os.path.getsize(part_file_path) != self.__total_size:
+            os.remove(part_file_path)
+            raise IOError("combined download of {} has the wrong size".format(os.path.basename(file_path)))
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+        os.rename(part_file_path, file_path)
+        self.validators = {"etag": self.__etag, "last_modified": self.__last_modified.get(url)}
+        return url
@@ -0,0 +1,85 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import multiprocessing
+import os
+
+
+def read_meminfo(path="/proc/meminfo"):
+    """
+    :return: dictionary of the fields of /proc/meminfo in bytes, None if it doesn't exist
+    """
+    try:
+        with open(path, "r") as f:
+            lines = f.readlines()
+    except IOError:
+        return None
+    result = {}
+    for line in lines:
+        key, _, value = line.partition(":")
+        fields = value.split()
+        if fields and fields[0].isdigit():
+            result[key] = int(fields[0]) * (1024 if len(fields) > 1 and fields[1] == "kB" else 1)
+    return result
+
+
+def _windows_memory_status():
+    import ctypes
+
+    class MemoryStatusEx(ctypes.Structure):
+        _fields_ = [("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+    status = MemoryStatusEx()
+    status.dwLength = ctypes.sizeof(MemoryStatusEx)
+    if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+        return None
+    return status
+
+
+def memory():
+    """
+    :return: total and available physical memory in bytes, None if they can't be determined
+    """
+    if os.name == "nt":
+        status = _windows_memory_status()
+        return (status.ullTotalPhys, status.ullAvailPhys) if status is not None else None
+    meminfo = read_meminfo()
+    if meminfo is None or "MemTotal" not in meminfo:
+        return None
+    available = meminfo.get("MemAvailable",
+                            meminfo.get("MemFree", 0) + meminfo.get("Buffers", 0) + meminfo.get("Cached", 0))
+    return meminfo["MemTotal"], available
+
+
+def adaptive_jobs(memory_per_job, cpus=None):
+    """
+    number of parallel jobs the machine can take: one per cpu, but no more than fit into the available memory
+    """
+    cpus = cpus or multiprocessing.cpu_count()
+    current = memory()
+    if current is None or not memory_per_job:
+        return cpus
+    return max(1, min(cpus, int(current[1] // memory_per_job)))
@@ -0,0 +1,96 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import os
+import subprocess
+import threading
+
+
+# files and directories the build writes into the work tree (cmake's build and edit directories, the logs
+# and stamps), relative to its root. They are no sources and change with every build
+BUILD_OUTPUTS = ["build", "edit", "stdout.log", "stderr.log", ".unibuild-*"]
+
+
+def _git(git, args, cwd, env):
+    proc = subprocess.Popen([git] + args, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = proc.communicate()
+    return stdout if proc.returncode == 0 else None
+
+
+def git_fingerprint(git, repo_path, env=None, fsmonitor=False, exclude=BUILD_OUTPUTS):
+    """
+    fingerprint of the sources in a git work tree: the tree id of HEAD, followed by a hash of the local
+    modifications if there are any. git only looks at files whose stat data changed since the index was
+    written, the untracked cache (and fsmonitor, if enabled) keeps it from scanning unchanged directories.
+    Paths matching exclude are neither scanned nor part of the fingerprint
+    :return: the fingerprint or None if repo_path is not a git work tree
+    """
+    tree = _git(git, ["rev-parse", "HEAD^{tree}"], repo_path, env)
+    if tree is None:
+        return None
+
+    options = ["-c", "core.untrackedCache=true"]
+    if fsmonitor:
+        options += ["-c", "core.fsmonitor=true"]
+    pathspec = ["--", "."] + [":(exclude){}".format(path) for path in exclude]
+    status = _git(git, options + ["status", "--porcelain", "-z", "--untracked-files=all",
+                                  "--ignore-submodules=dirty"] + pathspec, repo_path, env)
+    if status is None:
+        return None
+    if not status:
+        return tree.strip()
+
+    # status only says that a file differs, not how. Modified files are cheap to diff since there are few
+    digest = hashlib.sha1(status)
+    diff = _git(git, ["diff", "--binary", "HEAD"] + pathspec, repo_path, env)
+    digest.update(diff or "")
+    for entry in status.split("\0"):
+        if entry.startswith("?? "):
+            file_path = os.path.join(repo_path, entry[3:])
+            if os.path.isfile(file_path):
+                stat = os.stat(file_path)
+                digest.update("{}:{}:{}".format(entry[3:], stat.st_size, int(stat.st_mtime)))
+    return "{}+{}".format(tree.strip(), digest.hexdigest())
+
+
+def git_fingerprints(git, repo_paths, env=None, fsmonitor=False, jobs=8):
+    """
+    fingerprint several work trees concurrently
+    :return: dictionary of repository path to fingerprint
+    """
+    result = {}
+    queue = list(repo_paths)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                repo_path = queue.pop(0)
+            fingerprint = git_fingerprint(git, repo_path, env, fsmonitor)
+            with lock:
+                result[repo_path] = fingerprint
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(jobs, len(queue))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return result
@@ -0,0 +1,277 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from contextlib import contextmanager
+import errno
+import filecmp
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+
+OWNERS_FILE = ".unibuild-owners"
+
+# suffixes of the new version of a file waiting to replace it and of the replaced version during a merge
+NEW_SUFFIX = ".unibuild-new"
+OLD_SUFFIX = ".unibuild-old"
+
+_lock = threading.Lock()
+
+
+class InstallConflict(Exception):
+    pass
+
+
+def _replace(source, destination):
+    """
+    move source to destination, replacing it in one step
+    """
+    if os.name == "nt":
+        import ctypes
+        # MOVEFILE_REPLACE_EXISTING | MOVEFILE_COPY_ALLOWED
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(source), unicode(destination), 0x1 | 0x2):
+            raise ctypes.WinError()
+    else:
+        try:
+            os.rename(source, destination)
+        except OSError, e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.copy2(source, "{}.tmp".format(destination))
+            os.rename("{}.tmp".format(destination), destination)
+            os.remove(source)
+
+
+def _files(root):
+    """
+    :return: slash separated paths of all files below root
+    """
+    result = []
+    for path, dirs, files in os.walk(root):
+        for file_name in files:
+            result.append(os.path.relpath(os.path.join(path, file_name), root).replace(os.sep, "/"))
+    return sorted(result)
+
+
+def _normalized(relative_path):
+    """
+    relative path in the form paths are compared in: slash separated and, on windows, lower case
+    """
+    return os.path.normcase(relative_path).replace(os.sep, "/")
+
+
+class Staging(object):
+    def __init__(self, root, prefix):
+        # use root as DESTDIR (or INSTALL_ROOT for qmake), prefix is then installed to path
+        self.root = root
+        self.path = os.path.join(root, os.path.splitdrive(prefix)[1].lstrip("\\/"))
+
+    def outside(self):
+        """
+        :return: files installed into root but not below path, slash separated relative to root
+        """
+        prefix = _normalized(os.path.relpath(self.path, self.root)) + "/"
+        return [path for path in _files(self.root) if not _normalized(path).startswith(prefix)]
+
+
+class _Transaction(object):
+    """
+    replaces a set of files so that either all of them or none end up replaced. The new versions are moved
+    next to their destination first, then swapped in, keeping the replaced versions until everything worked
+    """
+
+    def __init__(self):
+        self.__staged = []
+        # destinations swapped so far and whether there was a file to restore
+        self.__replaced = []
+
+    def stage(self, source, destination):
+        if not os.path.isdir(os.path.dirname(destination)):
+            os.makedirs(os.path.dirname(destination))
+        _replace(source, destination + NEW_SUFFIX)
+        self.__staged.append(destination)
+
+    def commit(self):
+        for destination in self.__staged:
+            existed = os.path.isfile(destination)
+            if existed:
+                _replace(destination, destination + OLD_SUFFIX)
+            self.__replaced.append((destination, existed))
+            _replace(destination + NEW_SUFFIX, destination)
+
+    def rollback(self):
+        for destination, existed in reversed(self.__replaced):
+            try:
+                if os.path.isfile(destination) and not os.path.isfile(destination + NEW_SUFFIX):
+                    os.remove(destination)
+                if existed:
+                    _replace(destination + OLD_SUFFIX, destination)
+            except OSError, e:
+                logging.error("failed to restore %s: %s", destination, e)
+        for destination in self.__staged:
+            if os.path.isfile(destination + NEW_SUFFIX):
+                os.remove(destination + NEW_SUFFIX)
+
+    def finish(self):
+        for destination, existed in self.__replaced:
+            if existed:
+                try:
+                    os.remove(destination + OLD_SUFFIX)
+                except OSError, e:
+                    # windows doesn't delete files in use, the next merge replaces it
+                    logging.warning("failed to remove %s: %s", destination + OLD_SUFFIX, e)
+
+
+class InstallPrefix(object):
+    """
+    install prefix shared by several tasks. Each task installs into a staging directory of its own first,
+    which is then merged into the prefix in one go while no other task merges. A file installed by another task
+    may only be overwritten with identical content, the task owning each file is recorded
+    """
+
+    def __init__(self, path, lock_timeout=600):
+        self.__path = os.path.normpath(path)
+        self.__lock_timeout = lock_timeout
+
+    @property
+    def path(self):
+        return self.__path
+
+    def __owners_path(self):
+        return os.path.join(self.__path, OWNERS_FILE)
+
+    def owners(self):
+        """
+        :return: dictionary of slash separated path relative to the prefix -> name of the task that installed it
+        """
+        try:
+            with open(self.__owners_path(), "r") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def __save_owners(self, owners):
+        temp_path = "{}.tmp{}".format(self.__owners_path(), os.getpid())
+        with open(temp_path, "w") as f:
+            json.dump(owners, f, indent=1, sort_keys=True)
+        _replace(temp_path, self.__owners_path())
+
+    @contextmanager
+    def __locked(self):
+        """
+        exclusive access to the prefix, for threads of this process and other processes
+        """
+        lock_path = "{}.lock".format(self.__path)
+        start = time.time()
+        with _lock:
+            while True:
+                try:
+                    fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                    break
+                except OSError, e:
+                    if e.errno != errno.EEXIST:
+                        raise
+                    if time.time() - start > self.__lock_timeout:
+                        raise InstallConflict("{} is locked, remove {} if no other build is running"
+                                              .format(self.__path, lock_path))
+                    time.sleep(0.5)
+            try:
+                os.write(fd, str(os.getpid()))
+                os.close(fd)
+                yield
+            finally:
+                os.remove(lock_path)
+
+    @contextmanager
+    def staging(self, owner):
+        """
+        a staging area for owner's files, merged into the prefix when the with block completes. Nothing is
+        merged if it raises
+        """
+        root = os.path.join("{}.staging".format(self.__path),
+                            "{}-{}".format(re.sub(r"[^\w.-]+", "_", owner), os.getpid()))
+        if os.path.isdir(root):
+            shutil.rmtree(root)
+        staging = Staging(root, self.__path)
+        os.makedirs(staging.path)
+        try:
+            yield staging
+            self.merge(staging, owner)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    def merge(self, staging, owner):
+        """
+        move the staged files into the prefix. Either all files are replaced and the owners recorded or, if
+        anything fails, nothing changes. That includes staged files conflicting with one another task installed
+        and files installed outside the prefix. Files owner installed before but not this time are removed
+        :return: number of files merged
+        """
+        staged = _files(staging.path)
+        outside = staging.outside()
+        if outside:
+            raise InstallConflict("{} installed files outside of {}: {}".format(owner, self.__path,
+                                                                                ", ".join(outside[:10])))
+
+        with self.__locked():
+            owners = self.owners()
+            conflicts = []
+            for path in staged:
+                current_owner = owners.get(path)
+                destination = os.path.join(self.__path, path)
+                if current_owner not in [None, owner] and os.path.isfile(destination) \
+                        and not filecmp.cmp(os.path.join(staging.path, path), destination, shallow=False):
+                    conflicts.append("{} (installed by {})".format(path, current_owner))
+            if conflicts:
+                raise InstallConflict("{} conflicts with files in {}: {}".format(owner, self.__path,
+                                                                                 ", ".join(conflicts[:10])))
+
+            staged_set = set(staged)
+            stale = [path for path, path_owner in owners.items() if path_owner == owner and path not in staged_set]
+            for path in staged:
+                owners.setdefault(path, owner)
+            for path in stale:
+                del owners[path]
+
+            transaction = _Transaction()
+            try:
+                for path in staged:
+                    transaction.stage(os.path.join(staging.path, path), os.path.join(self.__path, path))
+                transaction.commit()
+                self.__save_owners(owners)
+            except:
+                logging.error("failed to install files of %s into %s, restoring the previous state",
+                              owner, self.__path)
+                transaction.rollback()
+                raise
+            transaction.finish()
+
+            for path in stale:
+                logging.info("removing %s, no longer installed by %s", path, owner)
+                try:
+                    if os.path.isfile(os.path.join(self.__path, path)):
+                        os.remove(os.path.join(self.__path, path))
+                except OSError, e:
+                    logging.warning("failed to remove %s: %s", path, e)
+
+        logging.info("installed %d files of %s into %s", len(staged), owner, self.__path)
+        return len(staged)
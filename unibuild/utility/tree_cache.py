@@ -0,0 +1,241 @@
+# Copyright (C) 2015 Sebastian Herbord. All rights reserved.
+#
+# This file is part of Mod Organizer.
+#
+# Mod Organizer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Mod Organizer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Mod Organizer.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import errno
+import json
+import shutil
+import logging
+
+
+# ioctl request number of FICLONE on linux (_IOW(0x94, 9, int))
+FICLONE = 0x40049409
+
+REFLINK = "reflink"
+HARDLINK = "hardlink"
+COPY = "copy"
+
+
+def reflink(source, destination):
+    import fcntl
+    with open(source, "rb") as src:
+        with open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    shutil.copystat(source, destination)
+
+
+_reflink_support = {}
+
+
+def reflinks_supported(source_directory, destination_directory):
+    """
+    :return: True if files in source_directory can be reflinked into destination_directory. The result is
+             remembered per pair of directories
+    """
+    key = (os.path.abspath(source_directory), os.path.abspath(destination_directory))
+    if key not in _reflink_support:
+        supported = False
+        if hasattr(os, "uname"):
+            source = os.path.join(key[0], ".reflink-probe{}".format(os.getpid()))
+            destination = os.path.join(key[1], ".reflink-probe{}".format(os.getpid()))
+            try:
+                for directory in key:
+                    if not os.path.isdir(directory):
+                        os.makedirs(directory)
+                with open(source, "wb") as f:
+                    f.write("probe")
+                reflink(source, destination)
+                supported = True
+            except (IOError, OSError), e:
+                logging.debug("no reflinks from {} to {} ({})".format(key[0], key[1], e))
+            finally:
+                for file_path in [source, destination]:
+                    if os.path.lexists(file_path):
+                        os.remove(file_path)
+        _reflink_support[key] = supported
+    return _reflink_support[key]
+
+
+def hardlink(source, destination):
+    if hasattr(os, "link"):
+        os.link(source, destination)
+    else:
+        import ctypes
+        if not ctypes.windll.kernel32.CreateHardLinkW(unicode(destination), unicode(source), None):
+            raise ctypes.WinError()
+
+
+def break_link(file_path):
+    """
+    give a file that may be hard-linked into a cache its own copy before it gets written to.
+    This is the copy-on-write half of populating a tree through hard links
+    """
+    if not os.path.isfile(file_path) or os.stat(file_path).st_nlink < 2:
+        return
+    temp_path = "{}.unlink".format(file_path)
+    shutil.copy2(file_path, temp_path)
+    os.remove(file_path)
+    os.rename(temp_path, file_path)
+
+
+class TreeCloner(object):
+    """
+    copies a directory tree using the cheapest method the file system supports: reflinks first,
+    then hard links if allowed, plain copies as a last resort. A method that failed once isn't retried.
+    Hard links share the file with the source, so only allow them if the copy is never written to in place
+    """
+
+    def __init__(self, allow_hardlinks=False):
+        self.__methods = [REFLINK] if hasattr(os, "uname") else []
+        if allow_hardlinks:
+            self.__methods.append(HARDLINK)
+        self.__counts = {}
+
+    @property
+    def counts(self):
+        return self.__counts
+
+    def clone_file(self, source, destination):
+        for method in list(self.__methods):
+            try:
+                if method == REFLINK:
+                    reflink(source, destination)
+                else:
+                    hardlink(source, destination)
+                self.__counts[method] = self.__counts.get(method, 0) + 1
+                return method
+            except (IOError, OSError), e:
+                logging.debug("{} not available for {} ({}), falling back".format(method, destination, e))
+                self.__methods.remove(method)
+                if os.path.lexists(destination):
+                    os.remove(destination)
+        shutil.copy2(source, destination)
+        self.__counts[COPY] = self.__counts.get(COPY, 0) + 1
+        return COPY
+
+    def clone_tree(self, source, destination, expected_files=None):
+        """
+        clone source into destination. If expected_files (relative path -> [size, mtime]) is set,
+        every source file is checked against it and IOError is raised on a mismatch
+        """
+        for root, dirs, files in os.walk(source):
+            rel_root = os.path.relpath(root, source)
+            target_root = destination if rel_root == "." else os.path.join(destination, rel_root)
+            if not os.path.isdir(target_root):
+                os.makedirs(target_root)
+            for dir_name in list(dirs):
+                # os.walk doesn't descend into directory symlinks, recreate them as they are
+                dir_path = os.path.join(root, dir_name)
+                if os.path.islink(dir_path):
+                    os.symlink(os.readlink(dir_path), os.path.join(target_root, dir_name))
+                    dirs.remove(dir_name)
+            for file_name in files:
+                file_path = os.path.join(root, file_name)
+                if expected_files is not None:
+                    rel_path = file_name if rel_root == "." else "/".join(rel_root.split(os.sep) + [file_name])
+                    if expected_files.get(rel_path) != file_stat(file_path):
+                        raise IOError("cached file was modified: {}".format(file_path))
+                self.clone_file(file_path, os.path.join(target_root, file_name))
+
+
+def file_stat(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+class TreeCache(object):
+    """
+    cache of extracted source trees, one entry per key. Each entry stores the tree and the size and mtime
+    of every file in it so that files modified through a hard link in some workspace are detected
+    """
+
+    ENTRY_FILE = "entry.json"
+
+    def __init__(self, root):
+        self.__root = root
+
+    def __entry_path(self, key):
+        return os.path.join(self.__root, key)
+
+    def lookup(self, key):
+        """
+        :return: the entry data (members, files) or None if there is no complete entry for key
+        """
+        entry_file = os.path.join(self.__entry_path(key), TreeCache.ENTRY_FILE)
+        if not os.path.isfile(entry_file):
+            return None
+        try:
+            with open(entry_file, "r") as f:
+                return json.load(f)
+        except ValueError:
+            return None
+
+    def add(self, key, populate):
+        """
+        create the entry for key. populate is called with the directory to fill and has to return the
+        list of members or None on failure
+        """
+        if not os.path.isdir(self.__root):
+            os.makedirs(self.__root)
+        staging_path = "{}.tmp{}".format(self.__entry_path(key), os.getpid())
+        if os.path.isdir(staging_path):
+            shutil.rmtree(staging_path)
+        tree_path = os.path.join(staging_path, "tree")
+        os.makedirs(tree_path)
+
+        try:
+            members = populate(tree_path)
+        except:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+        if members is None:
+            shutil.rmtree(staging_path)
+            return None
+
+        files = {}
+        for root, dirs, file_names in os.walk(tree_path):
+            rel_root = os.path.relpath(root, tree_path)
+            for file_name in file_names:
+                rel_path = file_name if rel_root == "." else "/".join(rel_root.split(os.sep) + [file_name])
+                files[rel_path] = file_stat(os.path.join(root, file_name))
+
+        entry = {"members": members, "files": files}
+        with open(os.path.join(staging_path, TreeCache.ENTRY_FILE), "w") as f:
+            json.dump(entry, f)
+
+        try:
+            os.rename(staging_path, self.__entry_path(key))
+        except OSError, e:
+            # another workspace finished the same entry first, theirs is as good as ours
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY, errno.EACCES):
+                raise
+            shutil.rmtree(staging_path)
+        return entry
+
+    def discard(self, key):
+        if os.path.isdir(self.__entry_path(key)):
+            shutil.rmtree(self.__entry_path(key))
+
+    def checkout(self, key, entry, destination, allow_hardlinks=False):
+        """
+        populate destination from the entry for key
+        :return: the TreeCloner used, its counts tell how the files were populated
+        """
+        cloner = TreeCloner(allow_hardlinks)
+        cloner.clone_tree(os.path.join(self.__entry_path(key), "tree"), destination, entry["files"])
+        return cloner
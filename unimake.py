@@ -21,7 +21,11 @@ from unibuild.manager import TaskManager
 from unibuild.progress import Progress
 from unibuild.project import Project
 from unibuild import Task
+from unibuild.builder import Builder, memory_governor
 from unibuild.utility import CIDict
+from unibuild.retrieval import Retrieval
+from unibuild.utility.bundle import export_bundle, import_bundle
+from unibuild.utility.compiler_cache import compiler_cache_statistics
 from config import config
 from subprocess import Popen, PIPE
 import imp
@@ -31,6 +35,7 @@ import networkx as nx
 import tempfile
 import os.path
 import argparse
+import multiprocessing
 import re
 
 def progress_callback(job, percentage):
@@ -149,6 +154,67 @@ def init_config(args):
         """
 
 
+def enable_affected(manager, graph, targets):
+    """
+    enable the tasks whose sources were modified locally and everything depending on them.
+    If targets are specified only tasks those targets depend on are considered
+    """
+    modified = [node for node in graph.nodes_iter() if graph.node[node]['task'].sources_modified()]
+    affected = manager.dependents(modified)
+    if targets:
+        candidates = set(targets)
+        for target in targets:
+            candidates.update(nx.descendants(graph, target))
+        affected &= candidates
+
+    projects = sorted(node for node in affected if isinstance(graph.node[node]['task'], Project))
+    logging.info("modified sources: %s", ", ".join(sorted(modified)) or "none")
+    logging.info("affected projects: %s", ", ".join(projects) or "none")
+    for node in affected:
+        manager.enable(graph, node)
+
+
+def bundle(manager, graph, arguments):
+    """
+    unimake bundle export <file> [targets...]: pack the cached sources of all enabled retrievals
+    unimake bundle import <file>: seed downloads and repository caches from a bundle
+    """
+    if len(arguments) < 2 or arguments[0] not in ["export", "import"]:
+        logging.error("usage: unimake bundle export|import <file> [targets...]")
+        return 1
+    command, bundle_path, targets = arguments[0], arguments[1], arguments[2:]
+    jobs = config.get('bundle_jobs', multiprocessing.cpu_count())
+
+    if command == "export":
+        if targets:
+            for target in targets:
+                manager.enable(graph, target)
+        else:
+            manager.enable_all(graph)
+        items = []
+        for node in graph.nodes_iter():
+            task = graph.node[node]['task']
+            if graph.node[node]['enable'] and isinstance(task, Retrieval):
+                items.extend(task.bundle_items())
+        logging.info("packing %d items into %s", len(items), bundle_path)
+        export_bundle(bundle_path, items, jobs)
+    else:
+        manifest, imported = import_bundle(bundle_path, {"download": config['paths']['download'],
+                                                         "git_mirror": config['paths']['git_mirrors'],
+                                                         "hg_store": config['paths']['hg_share_pool']}, jobs)
+        logging.info("imported %d of %d items, build with \"-s offline=True\" to check out from them",
+                     len(imported), len(manifest["items"]))
+    return 0
+
+
+def report_compiler_cache():
+    lines = compiler_cache_statistics.report()
+    if lines:
+        logging.info("compiler cache statistics:")
+        for line in lines:
+            logging.info("  %s", line)
+
+
 def recursive_remove(graph, node):
     if not isinstance(graph.node[node]["task"], Project):
         for ancestor in graph.predecessors(node):
@@ -162,6 +228,8 @@ def main():
     parser.add_argument('-d', '--destination', default='.', help='output directory (base for download and build)')
     parser.add_argument('-s', '--set', action='append', help='set configuration parameters')
     parser.add_argument('-g', '--graph', action='store_true', help='update dependency graph')
+    parser.add_argument('-a', '--affected', action='store_true',
+                        help='only build projects affected by local changes to their sources')
     parser.add_argument('target', nargs='*', help='make target')
     args = parser.parse_args()
 
@@ -196,7 +264,12 @@ def main():
             logging.info(", ".join(cycle))
         return 1
 
-    if args.target:
+    if args.target and args.target[0] == "bundle":
+        return bundle(manager, build_graph, args.target[1:])
+
+    if args.affected:
+        enable_affected(manager, build_graph, args.target)
+    elif args.target:
         for target in args.target:
             manager.enable(build_graph, target)
     else:
@@ -204,24 +277,33 @@ def main():
 
     logging.debug("processing tasks")
     independent = extract_independent(build_graph)
+    changed = set()
 
     while independent:
         for node in independent:
             task = build_graph.node[node]['task']
             try:
                 task.prepare()
-                if build_graph.node[node]['enable'] and not task.already_processed():
+                dependency_changed = any(dep.name in changed for dep in task.dependencies)
+                if build_graph.node[node]['enable'] and (dependency_changed or not task.already_processed()):
                     progress = Progress()
                     progress.set_change_callback(progress_callback)
                     if isinstance(task, Project):
                         logging.debug("finished project \"{}\"".format(node))
                     else:
+                        if isinstance(task, Builder) and memory_governor() is not None:
+                            memory_governor().wait(node)
                         logging.debug("run task \"{}\"".format(node))
                     if task.process(progress):
                         task.mark_success()
+                        if task.changed:
+                            changed.add(node)
+                        else:
+                            logging.debug("task \"{}\" is unchanged".format(node))
                     else:
                         if task.fail_behaviour == Task.FailBehaviour.FAIL:
                             logging.critical("task %s failed", node)
+                            report_compiler_cache()
                             return 1
                         elif task.fail_behaviour == Task.FailBehaviour.SKIP_PROJECT:
                             recursive_remove(build_graph, node)
@@ -238,6 +320,8 @@ def main():
 
         independent = extract_independent(build_graph)
 
+    report_compiler_cache()
+
 
 if __name__ == "__main__":
     main()